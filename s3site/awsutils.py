@@ -2,22 +2,298 @@
 EC2/S3 Utility Classes
 """
 import os
+import fnmatch
 import posixpath
+import time
+import select
+import socket
+import Queue
+import tempfile
+import threading
 import mimetypes
 
 import boto
+import boto.s3.key
+import boto.s3.prefix
 import boto.s3.connection
+import boto.s3.multipart
+import boto.connection
+import boto.cloudfront
 from boto.cloudfront.origin import CustomOrigin
 
 from s3site import utils
+from s3site import diff
+from s3site import static
 from s3site import exception
+from s3site import manifest
+from s3site import journal
+from s3site import remoteindex
+from s3site import hashcache
+from s3site import gzipcache
+from s3site import invalidation
+from s3site import progress
+from s3site import profiler
 from s3site import progressbar
+from s3site import scheduler
+from s3site import stats
+from s3site import threadpool
 from s3site.logger import log
 
+MB = 1024 * 1024
+
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of boto connection objects
+
+    boto connection objects must not be used by more than one thread at a
+    time. Threads check a connection out of the pool with get() and return it
+    with put() when they're done so that the connection, and the keep-alive
+    HTTP(S) connections it holds, can be reused by the next thread instead of
+    reconnecting (and renegotiating TLS) for every batch of work.
+
+    Up to max_size idle connections are kept. More connections are created if
+    needed but connections returned to a full pool are closed. Connections
+    that have been idle for more than max_idle seconds are closed rather than
+    reused since the server has most likely dropped their sockets. Before a
+    connection is reused the keep-alive sockets the server has closed in the
+    meantime are dropped (see prune) so that requests don't fail on them.
+
+    boto's close() doesn't close a connection's sockets so the pool closes
+    them itself.
+    """
+    def __init__(self, factory, max_size=10, max_idle=30.0):
+        self.factory = factory
+        self.max_size = max(int(max_size), 1)
+        self.max_idle = max_idle
+        # (connection, time returned) pairs, most recently returned last
+        self._idle = []
+        self._lock = threading.Lock()
+        # number of connections created and checkouts that reused one
+        self.created = 0
+        self.reused = 0
+
+    def __repr__(self):
+        return '<ConnectionPool: %d/%d idle>' % (len(self._idle),
+                                                 self.max_size)
+
+    def _remove_http_connections(self, conn, matches):
+        """
+        Remove the idle HTTP(S) connections held by boto connection conn for
+        which matches(http_conn) is True and return them
+        """
+        # boto keeps the idle HTTP(S) connections of each host in a
+        # HostConnectionPool queue of (connection, time returned) pairs
+        pool = getattr(conn, '_pool', None)
+        if pool is None:
+            return []
+        removed = []
+        pool.mutex.acquire()
+        try:
+            for host_pool in pool.host_to_pool.values():
+                kept = []
+                for pair in host_pool.queue:
+                    if matches(pair[0]):
+                        removed.append(pair[0])
+                    else:
+                        kept.append(pair)
+                host_pool.queue[:] = kept
+        finally:
+            pool.mutex.release()
+        return removed
+
+    def _close_http_connection(self, http_conn):
+        try:
+            http_conn.close()
+        except Exception, e:
+            log.debug("error closing HTTP connection: %s" % e)
+
+    def _close(self, conn):
+        for http_conn in self._remove_http_connections(conn, lambda c: True):
+            self._close_http_connection(http_conn)
+        try:
+            conn.close()
+        except Exception, e:
+            log.debug("error closing connection: %s" % e)
+
+    def is_socket_closed(self, http_conn):
+        """
+        Returns True if the server has closed the socket of the idle
+        HTTP(S) connection http_conn
+        """
+        response = getattr(http_conn, '_HTTPConnection__response', None)
+        if response is not None and not response.isclosed():
+            # a response is still being read
+            return False
+        sock = getattr(http_conn, 'sock', None)
+        if sock is None:
+            # not connected: httplib connects on the next request
+            return False
+        try:
+            readable = select.select([sock], [], [], 0)[0]
+        except (select.error, socket.error, ValueError):
+            return True
+        # an idle keep-alive socket only becomes readable when the server
+        # closes it (or sends something unexpected)
+        return bool(readable)
+
+    def prune(self, conn):
+        """
+        Close the idle HTTP(S) connections held by conn whose sockets have
+        been closed by the server. Returns the number of sockets closed.
+        """
+        dead = self._remove_http_connections(conn, self.is_socket_closed)
+        for http_conn in dead:
+            log.debug("dropping closed connection to %s" % http_conn.host)
+            self._close_http_connection(http_conn)
+        return len(dead)
+
+    def is_healthy(self, conn, returned):
+        """
+        Returns True if conn, returned to the pool at time returned, can be
+        reused
+        """
+        if time.time() - returned > self.max_idle:
+            return False
+        self.prune(conn)
+        return True
+
+    def get(self):
+        """
+        Check out a connection, reusing the most recently returned healthy
+        connection if there is one
+        """
+        stale = []
+        conn = None
+        self._lock.acquire()
+        try:
+            while self._idle:
+                idle, returned = self._idle.pop()
+                if self.is_healthy(idle, returned):
+                    conn = idle
+                    self.reused += 1
+                    break
+                stale.append(idle)
+            else:
+                self.created += 1
+        finally:
+            self._lock.release()
+        for idle in stale:
+            self._close(idle)
+        if conn is None:
+            log.debug('creating connection for thread %s' %
+                      threading.currentThread().getName())
+            conn = self.factory()
+        return conn
+
+    def discard(self, conn):
+        """
+        Close a connection checked out with get() instead of returning it to
+        the pool
+        """
+        self._close(conn)
+
+    def put(self, conn):
+        """
+        Return a connection checked out with get() to the pool
+        """
+        self._lock.acquire()
+        try:
+            if len(self._idle) < self.max_size:
+                self._idle.append((conn, time.time()))
+                return
+        finally:
+            self._lock.release()
+        self._close(conn)
+
+    def clear(self):
+        """
+        Close all idle connections
+        """
+        self._lock.acquire()
+        try:
+            idle = self._idle
+            self._idle = []
+        finally:
+            self._lock.release()
+        for conn, returned in idle:
+            self._close(conn)
+
+
+class RequestHookMixin(object):
+    """
+    Mixin for boto connection classes that calls request_hook(method,
+    status, elapsed) after every request made with the connection. status is
+    None if no response was received. Requests are also reported to
+    profiler.request_sampler while profiling.
+    """
+    service = None
+    request_hook = None
+
+    def get_request_path(self, args, kwargs):
+        return ''
+
+    def make_request(self, method, *args, **kwargs):
+        start = time.time()
+        status = None
+        try:
+            response = super(RequestHookMixin, self).make_request(
+                method, *args, **kwargs)
+            status = response.status
+            return response
+        finally:
+            elapsed = time.time() - start
+            if self.request_hook:
+                self.request_hook(method, status, elapsed)
+            sampler = profiler.request_sampler
+            if sampler:
+                sampler.record(self.service, method,
+                               self.get_request_path(args, kwargs), status,
+                               elapsed)
+
+
+class S3Connection(RequestHookMixin, boto.s3.connection.S3Connection):
+    service = 's3'
+
+    def get_request_path(self, args, kwargs):
+        bucket = args and args[0] or kwargs.get('bucket', '')
+        key = args[1:2] and args[1] or kwargs.get('key', '')
+        return '/'.join([getattr(bucket, 'name', bucket),
+                         getattr(key, 'name', key)])
+
+
+class CloudFrontConnection(RequestHookMixin,
+                           boto.cloudfront.CloudFrontConnection):
+    """
+    CloudFront connection that, unlike boto's, can also connect over plain
+    HTTP (e.g. to a local stand-in for CloudFront) when is_secure is False
+    """
+    service = 'cloudfront'
+
+    def __init__(self, aws_access_key_id=None, aws_secret_access_key=None,
+                 port=None, proxy=None, proxy_port=None,
+                 host=boto.cloudfront.CloudFrontConnection.DefaultHost,
+                 is_secure=True, debug=0, security_token=None):
+        boto.connection.AWSAuthConnection.__init__(
+            self, host, aws_access_key_id, aws_secret_access_key, is_secure,
+            port, proxy, proxy_port, debug=debug,
+            security_token=security_token)
+
+    def make_request(self, method, path, headers=None, data='', host=None,
+                     **kwargs):
+        # boto connects to self.host on the default port unless the port is
+        # part of the request's host
+        host = host or self.server_name()
+        return super(CloudFrontConnection, self).make_request(
+            method, path, headers=headers, data=data, host=host, **kwargs)
+
+    def get_request_path(self, args, kwargs):
+        return args and args[0] or kwargs.get('path', '')
+
 
 class EasyAWS(object):
     def __init__(self, aws_access_key_id, aws_secret_access_key,
-                 connection_authenticator, **kwargs):
+                 connection_authenticator, max_connections=10, **kwargs):
         """
         Create an EasyAWS object.
 
@@ -27,6 +303,10 @@ class EasyAWS(object):
 
         Providing only the keys will default to using Amazon EC2
 
+        max_connections is the number of idle connections kept in the
+        connection pool shared by the main thread (self.conn) and worker
+        threads (see self.connections)
+
         kwargs are passed to the connection_authenticator's constructor
         """
         self.aws_access_key_id = aws_access_key_id
@@ -34,52 +314,261 @@ class EasyAWS(object):
         self.connection_authenticator = connection_authenticator
         self._conn = None
         self._kwargs = kwargs
+        self.connections = ConnectionPool(self.new_pooled_connection,
+                                          max_size=max_connections)
+        # statistics of the current operation (see start_stats)
+        self.stats = stats.NullStats()
+        self.request_hook = self._record_request
+
+    def close(self):
+        """
+        Close the main thread's connection and all idle pooled connections
+        """
+        if self._conn is not None:
+            self.connections.discard(self._conn)
+            self._conn = None
+        self.connections.clear()
 
     def reload(self):
-        self._conn = None
+        self.close()
         return self.conn
 
+    def new_connection(self):
+        conn = self.connection_authenticator(self.aws_access_key_id,
+                                             self.aws_secret_access_key,
+                                             **self._kwargs)
+        conn.request_hook = self.request_hook
+        return conn
+
+    def _record_request(self, method, status, elapsed):
+        self.stats.add_request(method, status, elapsed)
+
+    def start_stats(self, operation, site_name=None, op_stats=None):
+        """
+        Start collecting statistics about the requests made for operation
+        (e.g. 'sync') on site_name. Returns the new OperationStats object
+        unless op_stats, an existing OperationStats, is given to be used
+        instead.
+        """
+        self.stats = op_stats or stats.OperationStats(operation, site_name)
+        return self.stats
+
+    def stop_stats(self):
+        """
+        Stop collecting statistics and return the OperationStats collected
+        """
+        op_stats = self.stats
+        op_stats.finish()
+        self.stats = stats.NullStats()
+        return op_stats
+
     @property
     def conn(self):
+        """
+        Connection used by the main thread. It's checked out of
+        self.connections when first used and the sockets the server has
+        closed are dropped before every use (see ConnectionPool.prune).
+        """
         if self._conn is None:
-            log.debug('creating self._conn w/ connection_authenticator ' +
+            log.debug('checking out self._conn w/ connection_authenticator ' +
                       'kwargs = %s' % self._kwargs)
-            self._conn = self.connection_authenticator(
-                self.aws_access_key_id, self.aws_secret_access_key,
-                **self._kwargs)
+            self._conn = self.get_main_connection()
+        else:
+            self.connections.prune(self._conn)
         return self._conn
 
+    def get_main_connection(self):
+        """
+        Check out the connection used by the main thread (see conn)
+        """
+        return self.connections.get()
+
+    def new_pooled_connection(self):
+        """
+        Returns a new connection for self.connections. boto connections are
+        not thread-safe so worker threads must check out a connection from
+        self.connections instead of using self.conn
+        """
+        return self.new_connection()
+
+
+class SyncResult(dict):
+    """
+    Maps local paths uploaded by EasyS3.sync_bucket to their S3 paths
+
+    Local paths that failed to upload are not included. Instead they're
+    stored in the 'failed' attribute mapped to the error that occurred. The
+    S3 paths removed from the bucket are stored in the 'deleted' attribute
+    and S3 paths that could not be removed are also included in 'failed'.
+    Uploaded S3 paths that were new, and therefore didn't need to be
+    invalidated in CloudFront, are stored in the 'not_invalidated' attribute.
+    The ids of the CloudFront invalidations that were created are stored in
+    the 'invalidations' attribute mapped to the number of paths in each.
+    """
+    def __init__(self, *args, **kwargs):
+        super(SyncResult, self).__init__(*args, **kwargs)
+        self.failed = {}
+        self.deleted = []
+        self.not_invalidated = []
+        self.invalidations = {}
+
+
+class RemoteFiles(remoteindex.RemoteIndex):
+    """
+    Compact map of the S3 paths of the files in a bucket to their
+    ManifestEntries (see RemoteIndex)
+
+    Used by sync --watch to keep the state of the bucket in memory between
+    syncs instead of downloading the sync manifest every time. The number of
+    syncs since the manifest was last verified against a full listing of the
+    bucket is stored in the 'syncs_since_verify' attribute.
+    """
+    def __init__(self, entries=None):
+        super(RemoteFiles, self).__init__(entries)
+        self.syncs_since_verify = 0
+
+
+class CopySources(object):
+    """
+    Reverse index of the objects in a bucket that local files can be copied
+    from server-side, mapping each object's ETag and content type to its S3
+    path. The part counts of multipart ETags are kept by object size so that
+    only the local multipart ETags that could possibly match are computed.
+    """
+    def __init__(self):
+        self.paths = {}
+        self.sizes = set()
+        self.multipart_parts = {}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, s3key, content_type):
+        etag = s3key.etag.replace('"', '')
+        self.paths.setdefault((etag, content_type), s3key.name)
+        self.sizes.add(s3key.size)
+        num_parts = utils.get_etag_parts(etag)
+        if num_parts:
+            parts = self.multipart_parts.setdefault(s3key.size, set())
+            parts.add(num_parts)
+
+    def get(self, etag, content_type):
+        return self.paths.get((etag, content_type))
+
 
 class EasyS3(EasyAWS):
     DefaultHost = 's3.amazonaws.com'
+    # times boto retries the requests made by the main thread (boto's
+    # default)
+    MainNumRetries = 6
+    MinPartSize = 5 * MB
+    # part sizes used by other common S3 tools (aws-cli, s3cmd)
+    CommonPartSizes = [5 * MB, 8 * MB, 15 * MB, 16 * MB]
+    # maximum number of keys in a single multi-object delete request
+    MaxDeleteKeys = 1000
+    # files in this size range are copied server-side from an identical
+    # object in the bucket rather than uploaded (S3 can copy up to 5GB in
+    # a single request)
+    MinCopySize = 64 * 1024
+    MaxCopySize = 5 * 1024 * MB
     _calling_format = boto.s3.connection.OrdinaryCallingFormat()
 
     def __init__(self, aws_access_key_id, aws_secret_access_key,
                  aws_s3_path='/', aws_port=None, aws_is_secure=True,
                  aws_s3_host=DefaultHost, aws_proxy=None, aws_proxy_port=None,
-                 aws_proxy_user=None, aws_proxy_pass=None, **kwargs):
+                 aws_proxy_user=None, aws_proxy_pass=None,
+                 aws_upload_threads=10, aws_multipart_threshold=64,
+                 aws_multipart_chunk_size=16, aws_manifest_verify_interval=10,
+                 aws_gzip=False, aws_gzip_types=None, aws_gzip_min_savings=10,
+                 aws_gzip_cache_size=256,
+                 aws_cf_max_invalidation_paths=1000,
+                 aws_cf_max_overinvalidation=50, aws_max_requests_per_sec=None,
+                 aws_max_kb_per_sec=None, aws_max_retries=5,
+                 aws_list_shards=8, aws_max_connections=None,
+                 aws_cf_host=None, **kwargs):
         kwargs = dict(is_secure=aws_is_secure, host=aws_s3_host or
                       self.DefaultHost, port=aws_port, path=aws_s3_path,
                       proxy=aws_proxy, proxy_port=aws_proxy_port,
                       proxy_user=aws_proxy_user, proxy_pass=aws_proxy_pass)
         if aws_s3_host:
             kwargs.update(dict(calling_format=self._calling_format))
+        self.upload_threads = int(aws_upload_threads or 1)
+        self.list_shards = max(int(aws_list_shards or 1), 1)
+        self.cf_host = aws_cf_host
+        # by default keep enough connections for every worker thread
+        max_connections = int(aws_max_connections or
+                              max(self.upload_threads, self.list_shards))
         super(EasyS3, self).__init__(aws_access_key_id, aws_secret_access_key,
-                                     boto.connect_s3, **kwargs)
+                                     S3Connection,
+                                     max_connections=max_connections,
+                                     **kwargs)
+        self.multipart_threshold = int(aws_multipart_threshold) * MB
+        self.multipart_chunk_size = max(int(aws_multipart_chunk_size) * MB,
+                                        self.MinPartSize)
+        self.manifest_verify_interval = int(aws_manifest_verify_interval)
+        self.gzip = aws_gzip
+        self.gzip_types = aws_gzip_types
+        self.gzip_min_savings = int(aws_gzip_min_savings)
+        self.gzip_cache_size = int(aws_gzip_cache_size) * MB
+        self.cf_max_invalidation_paths = int(aws_cf_max_invalidation_paths)
+        self.cf_max_overinvalidation = int(aws_cf_max_overinvalidation)
+        max_bytes_per_sec = None
+        if aws_max_kb_per_sec:
+            max_bytes_per_sec = int(aws_max_kb_per_sec) * 1024
+        self.scheduler = scheduler.RequestScheduler(
+            max_concurrency=self.upload_threads,
+            max_requests_per_sec=aws_max_requests_per_sec,
+            max_bytes_per_sec=max_bytes_per_sec,
+            max_retries=aws_max_retries)
+        self.scheduler.retry_hook = self._record_retry
         self._progress_bar = None
         self._cf = None
 
     def __repr__(self):
         return '<EasyS3: %s>' % self.conn.server_name()
 
+    def _record_retry(self, e):
+        self.stats.add_retry()
+
+    def new_pooled_connection(self):
+        """
+        Returns a new connection for a worker thread. Requests made by
+        workers are retried by self.scheduler, which adapts concurrency to
+        S3's throttling, so boto's own retries are disabled.
+        """
+        conn = self.new_connection()
+        conn.num_retries = 0
+        return conn
+
+    def get_main_connection(self):
+        """
+        Requests made by the main thread aren't run by self.scheduler so
+        boto's own retries are enabled for self.conn. self.conn is never
+        returned to the pool (see close).
+        """
+        conn = super(EasyS3, self).get_main_connection()
+        conn.num_retries = self.MainNumRetries
+        return conn
+
+    def close(self):
+        super(EasyS3, self).close()
+        if self._cf:
+            self._cf.close()
+
     @property
     def cf(self):
         if not self._cf:
             self._cf = EasyCF(self.aws_access_key_id,
                               self.aws_secret_access_key,
                               aws_port=self.conn.port,
+                              aws_is_secure=self.conn.is_secure,
+                              aws_cf_host=self.cf_host,
                               aws_proxy=self.conn.proxy,
-                              aws_proxy_port=self.conn.proxy_port)
+                              aws_proxy_port=self.conn.proxy_port,
+                              aws_max_connections=self.connections.max_size)
+            # requests made for invalidations count towards this object's
+            # statistics
+            self._cf.request_hook = self._record_request
         return self._cf
 
     @property
@@ -108,9 +597,17 @@ class EasyS3(EasyAWS):
 
     def delete_bucket(self, bucket):
         log.info("Deleting all files in bucket: %s" % bucket.name)
-        bucket.delete_keys([f.name for f in bucket.list()])
+        self.stats.start_phase('list')
+        s3paths = [e.name for e in self.iter_bucket_keys(bucket)]
+        self.stats.add_items(len(s3paths))
+        self.stats.start_phase('delete')
+        failed = self.delete_files(bucket, s3paths)
+        if failed:
+            raise exception.AWSError("Unable to delete %d file(s) in bucket "
+                                     "'%s'" % (len(failed), bucket.name))
         log.info("Deleting bucket: %s" % bucket.name)
         bucket.delete()
+        self.stats.end_phase()
 
     def bucket_exists(self, bucket_name):
         """
@@ -167,12 +664,342 @@ class EasyS3(EasyAWS):
         for bucket in self.get_buckets():
             print bucket.name
 
+    def _has_key_worker(self, bucket_name, key_name):
+        conn = self.connections.get()
+        try:
+            bucket = conn.get_bucket(bucket_name, validate=False)
+
+            def has_key():
+                return bucket.get_key(key_name) is not None
+            return self.scheduler.run(has_key)
+        finally:
+            self.connections.put(conn)
+
+    def iter_buckets_with_key(self, buckets, key_name, num_threads=None):
+        """
+        Checks which of buckets contain key_name with concurrent HEAD
+        requests from up to num_threads (default: AWS_MAX_CONNECTIONS
+        setting) workers
+
+        Yields a (bucket, found, error) tuple for each bucket as soon as it
+        has been checked: found is True if the bucket contains key_name and
+        error is the S3ResponseError raised if the bucket couldn't be
+        checked (e.g. access denied or the bucket is in another region), in
+        which case found is False. Other errors are raised.
+        """
+        num_threads = num_threads or self.connections.max_size
+        pool = threadpool.ThreadPool(size=min(num_threads, len(buckets)),
+                                     name='s3site-probe')
+        worker = self.stats.bind(self._has_key_worker)
+        try:
+            for i, bucket in enumerate(buckets):
+                pool.add_job(worker, bucket.name, key_name, jobid=i)
+            for job in pool.as_completed():
+                bucket = buckets[job.jobid]
+                if not job.failed:
+                    yield bucket, job.result, None
+                elif isinstance(job.exception,
+                                boto.exception.S3ResponseError):
+                    yield bucket, False, job.exception
+                else:
+                    raise job.exception
+        finally:
+            pool.shutdown()
+
+    def _website_details_worker(self, bucket_name):
+        conn = self.connections.get()
+        try:
+            bucket = conn.get_bucket(bucket_name, validate=False)
+            webconfig = self.scheduler.run(bucket.get_website_configuration)
+            endpoint = self.scheduler.run(bucket.get_website_endpoint)
+            metafile = self.scheduler.run(bucket.get_key,
+                                          (static.S3SITE_META_FILE,))
+            metadata = {}
+            if metafile:
+                metadata = metafile.metadata
+            return webconfig, endpoint, metadata
+        finally:
+            self.connections.put(conn)
+
+    def iter_website_details(self, buckets, num_threads=None):
+        """
+        Fetches the website configuration, website endpoint and the metadata
+        of s3site's metadata file of each of buckets using up to num_threads
+        (default: AWS_MAX_CONNECTIONS setting) concurrent workers
+
+        Yields a (bucket, details, error) tuple for each bucket as soon as
+        its details have been fetched: details is a (webconfig,
+        website_endpoint, metadata) tuple and error is the S3ResponseError
+        raised if the details couldn't be fetched (e.g. access denied or the
+        bucket has no website configuration), in which case details is None.
+        Other errors are raised.
+        """
+        if not buckets:
+            return
+        num_threads = num_threads or self.connections.max_size
+        pool = threadpool.ThreadPool(size=min(num_threads, len(buckets)),
+                                     name='s3site-website')
+        worker = self.stats.bind(self._website_details_worker)
+        try:
+            for i, bucket in enumerate(buckets):
+                pool.add_job(worker, bucket.name, jobid=i)
+            for job in pool.as_completed():
+                bucket = buckets[job.jobid]
+                if not job.failed:
+                    yield bucket, job.result, None
+                elif isinstance(job.exception,
+                                boto.exception.S3ResponseError):
+                    yield bucket, None, job.exception
+                else:
+                    raise job.exception
+        finally:
+            pool.shutdown()
+
     def get_bucket_files(self, bucket):
         files = [file for file in bucket.list()]
         return files
 
     def get_bucket_files_map(self, bucket):
-        return dict([(k.name, k) for k in bucket.list()])
+        """
+        Returns a RemoteIndex mapping the name of every object in bucket to
+        its ManifestEntry
+        """
+        return remoteindex.RemoteIndex(self.iter_bucket_keys(bucket))
+
+    def _put_page(self, pages, page, cancelled):
+        """
+        Puts page on the bounded pages queue, waiting for room unless the
+        listing is cancelled first. Returns False if it was cancelled.
+        """
+        while not cancelled.is_set():
+            try:
+                pages.put(page, True, 0.5)
+                return True
+            except Queue.Full:
+                continue
+        return False
+
+    def _list_prefix_worker(self, bucket_name, prefix, pages, cancelled):
+        """
+        Lists prefix in bucket one page at a time, putting a list of
+        ManifestEntry objects on the pages queue for each page followed by
+        None once the listing is complete
+        """
+        if cancelled.is_set():
+            return
+        conn = self.connections.get()
+        try:
+            bucket = conn.get_bucket(bucket_name, validate=False)
+
+            def list_page(marker):
+                return bucket.get_all_keys(prefix=prefix, marker=marker)
+            # each page is scheduled (and retried) separately so that a
+            # throttled request doesn't restart the whole listing
+            marker = ''
+            while True:
+                page = self.scheduler.run(list_page, (marker,))
+                entries = [manifest.ManifestEntry.from_key(key)
+                           for key in page]
+                if not self._put_page(pages, entries, cancelled):
+                    return
+                if not page.is_truncated or not len(page):
+                    break
+                marker = page.next_marker or page[-1].name
+        finally:
+            self.connections.put(conn)
+        self._put_page(pages, None, cancelled)
+
+    def _iter_prefix_pages(self, job, pages):
+        while True:
+            try:
+                page = pages.get(True, 0.5)
+            except Queue.Empty:
+                if job.failed:
+                    raise job.exception
+                continue
+            if page is None:
+                return
+            yield page
+
+    def iter_bucket_keys(self, bucket, num_shards=None):
+        """
+        Yields a ManifestEntry for every object in bucket sorted by name
+
+        The bucket's top-level prefixes ('dir/') are found with a delimiter
+        listing and then listed concurrently by up to num_shards (default:
+        AWS_LIST_SHARDS setting) workers. Results are yielded in order. Each
+        worker hands its listing over one page at a time through a queue
+        that holds a single page, so at most about 2 * num_shards pages are
+        in memory however large a prefix is.
+        """
+        num_shards = num_shards or self.list_shards
+        items = []
+        for item in bucket.list(delimiter='/'):
+            name = item.name
+            if isinstance(name, unicode):
+                name = name.encode('utf-8')
+            items.append((name, item))
+        # keys and prefixes are listed separately on each page
+        items.sort()
+        prefixes = [p[0] for p in items
+                    if isinstance(p[1], boto.s3.prefix.Prefix)]
+        if prefixes:
+            log.debug("listing %d prefixes in bucket %s using %d shards" %
+                      (len(prefixes), bucket.name, num_shards))
+        pool = threadpool.ThreadPool(size=max(min(num_shards,
+                                                  len(prefixes)), 1),
+                                     name='s3site-list')
+        cancelled = threading.Event()
+        # jobs are started in order so the prefix being yielded is always
+        # being listed while later workers wait for room in their queues
+        listings = []
+        worker = self.stats.bind(self._list_prefix_worker)
+        try:
+            for i, prefix in enumerate(prefixes):
+                pages = Queue.Queue(maxsize=1)
+                job = pool.add_job(worker, bucket.name, prefix, pages,
+                                   cancelled, jobid=i)
+                listings.append((job, pages))
+            current = 0
+            for name, item in items:
+                if not isinstance(item, boto.s3.prefix.Prefix):
+                    yield manifest.ManifestEntry.from_key(item)
+                    continue
+                job, pages = listings[current]
+                listings[current] = None
+                for page in self._iter_prefix_pages(job, pages):
+                    for entry in page:
+                        yield entry
+                current += 1
+        finally:
+            cancelled.set()
+            pool.shutdown()
+
+    def iter_bucket_files(self, bucket):
+        """
+        Yields a ManifestEntry for every object in bucket, excluding s3site's
+        own files, sorted by name
+        """
+        for entry in self.iter_bucket_keys(bucket):
+            if entry.name not in manifest.RESERVED_FILES:
+                yield entry
+
+    def get_manifest(self, bucket):
+        """
+        Returns a ManifestReader for the sync manifest stored in bucket or
+        None if the bucket has no (valid) manifest
+        """
+        key = bucket.get_key(static.S3SITE_MANIFEST_FILE)
+        if not key:
+            return
+        tmp = tempfile.TemporaryFile()
+        key.get_contents_to_file(tmp)
+        try:
+            return manifest.ManifestReader(tmp)
+        except exception.InvalidManifest, e:
+            log.warn("Ignoring sync manifest in bucket '%s': %s" %
+                     (bucket.name, e.msg))
+
+    def put_manifest(self, bucket, fileobj):
+        key = bucket.new_key(static.S3SITE_MANIFEST_FILE)
+        key.set_contents_from_file(
+            fileobj, headers={'Content-Type': 'application/x-gzip'})
+
+    def _get_remote_files(self, bucket, mf=None, full_scan=False):
+        """
+        Returns an iterator over the ManifestEntries for the files in bucket
+        sorted by S3 path, along with a flag indicating whether they come from
+        the sync manifest rather than a full listing of the bucket
+        """
+        if mf and not full_scan:
+            if mf.syncs_since_verify < self.manifest_verify_interval:
+                log.info("Using sync manifest for S3 bucket: %s (%d files)" %
+                         (bucket.name, len(mf)))
+                return iter(mf), True
+            log.info("Verifying sync manifest against S3 bucket listing")
+        log.info("Fetching list of files in S3 bucket: %s" % bucket.name)
+        listing = self.iter_bucket_files(bucket)
+        if mf:
+            listing = self._verify_manifest(listing, mf)
+        return listing, False
+
+    def get_remote_files(self, bucket, full_scan=False):
+        """
+        Returns a RemoteFiles object describing the files currently in bucket
+        """
+        mf = self.get_manifest(bucket)
+        entries, used_manifest = self._get_remote_files(bucket, mf,
+                                                        full_scan=full_scan)
+        remote = RemoteFiles(entries)
+        if used_manifest:
+            remote.syncs_since_verify = mf.syncs_since_verify
+        return remote
+
+    def _verify_manifest(self, listing, mf):
+        """
+        Yields the entries from a bucket listing, carrying over the headers
+        recorded in the sync manifest mf, and warns about manifest entries
+        that turned out to be out of date
+        """
+        stale = 0
+        for name, listed, old in diff.merge_join(listing, mf,
+                                                 lambda e: e.name,
+                                                 lambda e: e.name):
+            if not listed or not old or listed.etag != old.etag:
+                stale += 1
+            else:
+                listed.headers = old.headers
+            if listed:
+                yield listed
+        if stale:
+            log.warn("Sync manifest was out of date for %d file(s)" % stale)
+
+    def _update_manifest(self, bucket, kept, files_map, uploaded, changed,
+                         compressed=None, syncs_since_verify=0):
+        """
+        Store a new sync manifest in bucket made up of the entries in the
+        ManifestWriter kept, which holds every remote file that was left
+        untouched, and the files that were uploaded. changed maps the S3 paths
+        of files that were modified, or could not be deleted, to their
+        previous entry which is kept if the file was not uploaded.
+        compressed maps local paths to the compressed copy that was uploaded
+        in their place.
+        """
+        compressed = compressed or {}
+        updates = dict(changed)
+        for f, etag in uploaded.items():
+            s3path = files_map[f]
+            updates[s3path] = self._get_manifest_entry(f, s3path, etag,
+                                                       compressed.get(f))
+        updates = sorted(updates.values(), key=lambda e: e.name)
+        kept = manifest.ManifestReader(kept.close())
+        mf = manifest.ManifestWriter(syncs_since_verify=syncs_since_verify)
+        for name, old, new in diff.merge_join(kept, updates,
+                                              lambda e: e.name,
+                                              lambda e: e.name):
+            mf.add(new or old)
+        self.put_manifest(bucket, mf.close())
+
+    def _get_manifest_entry(self, path, s3path, etag, compressed=None):
+        """
+        Returns the ManifestEntry for local file path uploaded to s3path
+        (from the compressed copy, if any) with the resulting etag
+        """
+        headers = (self._get_upload_headers(path, compressed) or
+                   {'Content-Type': self._get_content_type(path)})
+        size = os.path.getsize(compressed or path)
+        return manifest.ManifestEntry(s3path, etag, size, headers)
+
+    def _put_remote_files(self, bucket, remote):
+        """
+        Store a new sync manifest in bucket made up of the entries in remote
+        (RemoteFiles)
+        """
+        mf = manifest.ManifestWriter(
+            syncs_since_verify=remote.syncs_since_verify)
+        for entry in remote.itervalues():
+            mf.add(entry)
+        self.put_manifest(bucket, mf.close())
 
     def _s3_upload_progress(self, current, total):
         pb = self.progress_bar
@@ -181,22 +1008,471 @@ class EasyS3(EasyAWS):
         pb.maxval = total
         pb.update(current)
 
+    def _get_content_type(self, path):
+        return (mimetypes.guess_type(path)[0] or
+                boto.s3.key.Key.DefaultContentType)
+
+    def _get_upload_headers(self, path, compressed=None):
+        """
+        Returns the headers to upload path with. Files uploaded from a
+        compressed copy need their Content-Type set explicitly since it can't
+        be guessed from the compressed copy's file name.
+        """
+        if not compressed:
+            return None
+        return {'Content-Type': self._get_content_type(path),
+                'Content-Encoding': 'gzip'}
+
+    def _use_multipart(self, path):
+        return os.path.getsize(path) >= self.multipart_threshold
+
     def put_file(self, path, bucket, bucket_path, policy=None,
-                 pre_upload_cb=None, pretend=False):
+                 pre_upload_cb=None, pretend=False, progress=True,
+                 compressed=None, transfer=None):
+        """
+        Upload path to bucket_path in bucket. If compressed is specified it
+        must be the path to a gzip-compressed copy of path which is uploaded
+        instead. The upload's progress is reported to transfer
+        (TransferProgress) if specified, otherwise a progress bar is shown
+        for the file if progress is True.
+        """
+        source = compressed or path
+        if not pretend and self._use_multipart(source):
+            return self.put_multipart_file(path, bucket, bucket_path,
+                                           policy=policy,
+                                           pre_upload_cb=pre_upload_cb,
+                                           compressed=compressed,
+                                           transfer=transfer)
         key = bucket.new_key(bucket_path)
         key.content_type = mimetypes.guess_type(path)
         if pre_upload_cb:
             key = pre_upload_cb(key) or key
+        headers = self._get_upload_headers(path, compressed)
         if not pretend:
-            pbar = self.progress_bar
-            pbar.reset()
-            log.info("Uploading file: %s" % path)
-            key.set_contents_from_filename(path, policy=policy,
-                                           cb=self._s3_upload_progress)
-            pbar.reset()
+            # the aggregate progress line replaces per-file messages
+            log_upload = transfer and log.debug or log.info
+            log_upload("Uploading file: %s" % path)
+            kwargs = dict(headers=headers, policy=policy)
+            progress = progress and not transfer
+            if transfer:
+                kwargs['cb'] = transfer.get_callback(path)
+            elif progress:
+                kwargs['cb'] = self._s3_upload_progress
+                self.progress_bar.reset()
+            self.scheduler.run(key.set_contents_from_filename, (source,),
+                               kwargs, nbytes=os.path.getsize(source))
+            if progress:
+                self.progress_bar.reset()
+            return key.etag.strip('"')
         else:
             log.info("Would upload file: %s" % path)
 
+    def _put_file_worker(self, path, bucket_name, bucket_path, transfer=None,
+                         **kwargs):
+        if transfer:
+            source = kwargs.get('compressed') or path
+            transfer.start_file(path, os.path.getsize(source))
+        conn = self.connections.get()
+        try:
+            bucket = conn.get_bucket(bucket_name, validate=False)
+            return self.put_file(path, bucket, bucket_path, progress=False,
+                                 transfer=transfer, **kwargs)
+        finally:
+            self.connections.put(conn)
+
+    def _get_multipart_upload(self, bucket, bucket_path, upload_id):
+        mp = boto.s3.multipart.MultiPartUpload(bucket)
+        mp.key_name = bucket_path
+        mp.id = upload_id
+        return mp
+
+    def _upload_part_worker(self, path, bucket_name, bucket_path, upload_id,
+                            part_num, offset, size):
+        conn = self.connections.get()
+        try:
+            bucket = conn.get_bucket(bucket_name, validate=False)
+            mp = self._get_multipart_upload(bucket, bucket_path, upload_id)
+            fp = open(path, 'rb')
+
+            def upload_part():
+                fp.seek(offset)
+                mp.upload_part_from_file(fp, part_num, size=size)
+            try:
+                self.scheduler.run(upload_part, nbytes=size)
+            finally:
+                fp.close()
+        finally:
+            self.connections.put(conn)
+        return size
+
+    def put_multipart_file(self, path, bucket, bucket_path, policy=None,
+                           pre_upload_cb=None, num_threads=None,
+                           compressed=None, transfer=None):
+        """
+        Upload path to bucket as a multipart upload with parts of
+        self.multipart_chunk_size bytes sent in parallel by num_threads
+        workers. The upload is cancelled if any part fails. If compressed is
+        specified it must be the path to a gzip-compressed copy of path which
+        is uploaded instead. The upload's progress is reported to transfer
+        (TransferProgress) if specified, otherwise a progress bar is shown.
+        """
+        num_threads = num_threads or self.upload_threads
+        key = bucket.new_key(bucket_path)
+        if pre_upload_cb:
+            key = pre_upload_cb(key) or key
+        source = compressed or path
+        headers = (self._get_upload_headers(path, compressed) or
+                   {'Content-Type': self._get_content_type(path)})
+        size = os.path.getsize(source)
+        num_parts = utils.get_multipart_count(size, self.multipart_chunk_size)
+        log_upload = transfer and log.debug or log.info
+        log_upload("Uploading file: %s (%d parts)" % (path, num_parts))
+        # requests are retried by the scheduler so they're made on a pooled
+        # connection, like the parts, rather than on bucket's connection
+        # which also retries them itself
+        conn = self.connections.get()
+        try:
+            mp_bucket = conn.get_bucket(bucket.name, validate=False)
+            mp = self.scheduler.run(mp_bucket.initiate_multipart_upload,
+                                    (bucket_path,),
+                                    dict(headers=headers,
+                                         metadata=key.metadata,
+                                         policy=policy))
+            self._upload_parts(path, source, bucket_path, mp, size,
+                               num_threads, transfer=transfer)
+            return self.scheduler.run(mp.complete_upload).etag.strip('"')
+        finally:
+            self.connections.put(conn)
+
+    def _upload_parts(self, path, source, bucket_path, mp, size, num_threads,
+                      transfer=None):
+        """
+        Upload source in parts for multipart upload mp using num_threads
+        workers. The upload is cancelled if any part fails.
+        """
+        chunk_size = self.multipart_chunk_size
+        num_parts = utils.get_multipart_count(size, chunk_size)
+        pool = threadpool.ThreadPool(size=min(num_threads, num_parts),
+                                     name='s3site-multipart')
+        worker = self.stats.bind(self._upload_part_worker)
+        for i in range(num_parts):
+            offset = i * chunk_size
+            pool.add_job(worker, source, mp.bucket.name,
+                         bucket_path, mp.id, i + 1, offset,
+                         min(chunk_size, size - offset), jobid=i + 1)
+        if transfer:
+            transfer.start_file(path, size)
+        else:
+            pbar = self.progress_bar.reset()
+            pbar.maxval = size or 1
+        done = 0
+        failed = []
+        completed = False
+        try:
+            for job in pool.as_completed():
+                if job.failed:
+                    failed.append(job)
+                    continue
+                done += job.result
+                if transfer:
+                    transfer.update(path, done)
+                else:
+                    pbar.update(done)
+            completed = not failed
+        finally:
+            pool.shutdown()
+            if not transfer:
+                pbar.reset()
+            if not completed:
+                self._cancel_multipart_upload(path, mp)
+        if failed:
+            raise failed[0].exception
+
+    def _cancel_multipart_upload(self, path, mp):
+        """
+        Cancel multipart upload mp. Errors are logged rather than raised so
+        that they don't hide the error that caused the upload to be
+        cancelled.
+        """
+        log.debug("cancelling multipart upload %s" % mp.id)
+        try:
+            self.scheduler.run(mp.cancel_upload)
+        except Exception, e:
+            log.warn("Unable to cancel multipart upload %s of '%s': %s" %
+                     (mp.id, path, e))
+
+    def put_files(self, files_map, bucket, policy=None, pre_upload_cb=None,
+                  pretend=False, num_threads=None, compressed=None,
+                  post_upload_cb=None):
+        """
+        Upload all files in files_map (local path -> S3 path) to bucket using
+        a pool of num_threads workers, each with its own S3 connection. Files
+        larger than self.multipart_threshold are uploaded one at a time as
+        multipart uploads with their parts sent in parallel instead.
+        compressed optionally maps local paths to a gzip-compressed copy that
+        should be uploaded in their place. post_upload_cb, if specified, is
+        called with the local path and new ETag of every file as soon as it
+        has been uploaded. The progress of all uploads is shown on a single
+        line (see TransferProgress).
+
+        Returns a tuple of two dictionaries: the local paths that were
+        uploaded mapped to their new ETags and the local paths that failed to
+        upload mapped to the corresponding exception
+        """
+        num_threads = self._get_num_threads(num_threads)
+        throttled = self.scheduler.throttled
+        compressed = compressed or {}
+        uploaded = {}
+        failed = {}
+        files_map = files_map.copy()
+        large_files = {}
+        transfer = None
+        if not pretend:
+            sizes = {}
+            for f, s3path in files_map.items():
+                sizes[f] = os.path.getsize(compressed.get(f, f))
+                if sizes[f] >= self.multipart_threshold:
+                    large_files[f] = files_map.pop(f)
+            if sizes:
+                transfer = progress.TransferProgress(
+                    total_files=len(sizes), total_bytes=sum(sizes.values()),
+                    label='Uploaded').start()
+        try:
+            if pretend or num_threads == 1 or len(files_map) <= 1:
+                for f, s3path in sorted(files_map.items()):
+                    if transfer:
+                        transfer.start_file(f, sizes[f])
+                    try:
+                        uploaded[f] = self.put_file(
+                            f, bucket, s3path, policy=policy,
+                            pre_upload_cb=pre_upload_cb, pretend=pretend,
+                            compressed=compressed.get(f), transfer=transfer)
+                    except Exception, e:
+                        log.error("Failed to upload file '%s': %s" % (f, e))
+                        failed[f] = e
+                        if transfer:
+                            transfer.finish_file(f, failed=True)
+                        continue
+                    if transfer:
+                        transfer.finish_file(f)
+                    if post_upload_cb and not pretend:
+                        post_upload_cb(f, uploaded[f])
+            else:
+                results = self._put_files_concurrently(
+                    files_map, bucket, policy=policy,
+                    pre_upload_cb=pre_upload_cb, num_threads=num_threads,
+                    compressed=compressed, post_upload_cb=post_upload_cb,
+                    transfer=transfer)
+                uploaded.update(results[0])
+                failed.update(results[1])
+            for f, s3path in sorted(large_files.items()):
+                try:
+                    uploaded[f] = self.put_multipart_file(
+                        f, bucket, s3path, policy=policy,
+                        pre_upload_cb=pre_upload_cb, num_threads=num_threads,
+                        compressed=compressed.get(f), transfer=transfer)
+                except Exception, e:
+                    log.error("Failed to upload file '%s': %s" % (f, e))
+                    failed[f] = e
+                    transfer.finish_file(f, failed=True)
+                    continue
+                transfer.finish_file(f)
+                if post_upload_cb:
+                    post_upload_cb(f, uploaded[f])
+        finally:
+            if transfer:
+                transfer.finish()
+        if not pretend:
+            self.stats.add_items(len(uploaded))
+            self.stats.add_bytes(sum([sizes[f] for f in uploaded]))
+        throttled = self.scheduler.throttled - throttled
+        if throttled:
+            log.warn("S3 throttled %d request(s), concurrency reduced to %d" %
+                     (throttled, self.scheduler.concurrency))
+        return uploaded, failed
+
+    def _get_num_threads(self, num_threads=None):
+        """
+        Returns num_threads or the configured number of upload threads and
+        makes it the scheduler's maximum concurrency
+        """
+        num_threads = num_threads or self.upload_threads
+        self.scheduler.set_max_concurrency(num_threads)
+        return num_threads
+
+    def _put_files_concurrently(self, files_map, bucket, policy=None,
+                                pre_upload_cb=None, num_threads=None,
+                                compressed=None, post_upload_cb=None,
+                                transfer=None):
+        uploaded = {}
+        failed = {}
+        num_threads = min(num_threads, len(files_map))
+        log.info("Uploading %d files using %d threads" % (len(files_map),
+                                                          num_threads))
+        pool = threadpool.ThreadPool(size=num_threads, name='s3site-upload')
+        worker = self.stats.bind(self._put_file_worker)
+        for f, s3path in sorted(files_map.items()):
+            pool.add_job(worker, f, bucket.name, s3path,
+                         policy=policy, pre_upload_cb=pre_upload_cb,
+                         compressed=compressed.get(f), transfer=transfer,
+                         jobid=f)
+        try:
+            for job in pool.as_completed():
+                if transfer:
+                    transfer.finish_file(job.jobid, failed=job.failed)
+                if job.failed:
+                    log.error("Failed to upload file '%s': %s" %
+                              (job.jobid, job.exception))
+                    failed[job.jobid] = job.exception
+                else:
+                    uploaded[job.jobid] = job.result
+                    if post_upload_cb:
+                        post_upload_cb(job.jobid, job.result)
+        finally:
+            pool.shutdown()
+        return uploaded, failed
+
+    def _get_copy_metadata(self, path, bucket, bucket_path,
+                           pre_upload_cb=None, compressed=None):
+        """
+        Returns the metadata, including Content-Type and Content-Encoding,
+        that path would be uploaded to bucket_path with after pre_upload_cb
+        has modified its key
+        """
+        key = bucket.new_key(bucket_path)
+        key.content_type = self._get_content_type(path)
+        key = pre_upload_cb(key) or key
+        metadata = dict(key.metadata)
+        metadata['Content-Type'] = key.content_type
+        if compressed:
+            metadata['Content-Encoding'] = 'gzip'
+        return metadata
+
+    def _copy_file_worker(self, bucket_name, src_path, bucket_path,
+                          policy=None, path=None, pre_upload_cb=None,
+                          compressed=None):
+        headers = {}
+        if policy:
+            headers['x-amz-acl'] = policy
+        conn = self.connections.get()
+        try:
+            bucket = conn.get_bucket(bucket_name, validate=False)
+            metadata = None
+            if pre_upload_cb:
+                metadata = self._get_copy_metadata(path, bucket, bucket_path,
+                                                   pre_upload_cb, compressed)
+            key = self.scheduler.run(bucket.copy_key,
+                                     (bucket_path, bucket_name, src_path),
+                                     dict(metadata=metadata, headers=headers))
+        finally:
+            self.connections.put(conn)
+        return key.etag.strip('"')
+
+    def copy_files(self, copies, files_map, bucket, policy=None,
+                   pre_upload_cb=None, pretend=False, num_threads=None,
+                   compressed=None):
+        """
+        Create the S3 paths in files_map (local path -> S3 path) by copying
+        the existing objects in copies (local path -> source S3 path)
+        server-side. The source object's headers, including Content-Type and
+        Content-Encoding, are copied as well unless pre_upload_cb is
+        specified, in which case it's called with the new key exactly as for
+        an upload and the copy's metadata is replaced with the key's
+        metadata. compressed optionally maps local paths to the
+        gzip-compressed copy the source object was uploaded from.
+
+        Returns a tuple of two dictionaries: the local paths that were copied
+        mapped to their new ETags and the local paths that failed to copy
+        mapped to the corresponding exception
+        """
+        compressed = compressed or {}
+        copied = {}
+        failed = {}
+        if not copies:
+            return copied, failed
+        if pretend:
+            for f, src_path in sorted(copies.items()):
+                log.info("Would copy '%s' to '%s'" % (src_path, files_map[f]))
+            return copied, failed
+        log.info("Copying %d files from existing S3 paths" % len(copies))
+        num_threads = min(self._get_num_threads(num_threads), len(copies))
+        pool = threadpool.ThreadPool(size=num_threads, name='s3site-copy')
+        worker = self.stats.bind(self._copy_file_worker)
+        for f, src_path in sorted(copies.items()):
+            log.info("Copying '%s' to '%s'" % (src_path, files_map[f]))
+            pool.add_job(worker, bucket.name, src_path,
+                         files_map[f], policy=policy, path=f,
+                         pre_upload_cb=pre_upload_cb,
+                         compressed=compressed.get(f), jobid=f)
+        try:
+            for job in pool.as_completed():
+                if job.failed:
+                    log.warn("Failed to copy '%s' (will upload instead): %s" %
+                             (copies[job.jobid], job.exception))
+                    failed[job.jobid] = job.exception
+                else:
+                    copied[job.jobid] = job.result
+        finally:
+            pool.shutdown()
+        self.stats.add_items(len(copied))
+        return copied, failed
+
+    def _delete_files_worker(self, bucket_name, s3paths):
+        conn = self.connections.get()
+        try:
+            bucket = conn.get_bucket(bucket_name, validate=False)
+            result = self.scheduler.run(bucket.delete_keys, (s3paths,),
+                                        dict(quiet=True))
+        finally:
+            self.connections.put(conn)
+        return dict([(e.key, '%s: %s' % (e.code, e.message))
+                     for e in result.errors])
+
+    def delete_files(self, bucket, s3paths, num_threads=None):
+        """
+        Delete s3paths from bucket using multi-object delete requests of up
+        to MaxDeleteKeys keys each which are sent concurrently. Returns a
+        dictionary mapping the S3 paths that could not be deleted to the
+        error that occurred.
+        """
+        failed = {}
+        batches = utils.group_iter(sorted(s3paths), n=self.MaxDeleteKeys)
+        if not batches:
+            return failed
+        num_threads = min(self._get_num_threads(num_threads), len(batches))
+        pool = threadpool.ThreadPool(size=num_threads, name='s3site-delete')
+        worker = self.stats.bind(self._delete_files_worker)
+        for i, batch in enumerate(batches):
+            pool.add_job(worker, bucket.name, batch, jobid=i)
+        try:
+            for job in pool.as_completed():
+                if job.failed:
+                    batch = batches[job.jobid]
+                    log.error("Failed to delete %d file(s): %s" %
+                              (len(batch), job.exception))
+                    for s3path in batch:
+                        failed[s3path] = job.exception
+                else:
+                    for s3path, error in job.result.items():
+                        log.error("Failed to delete '%s': %s" %
+                                  (s3path, error))
+                    failed.update(job.result)
+        finally:
+            pool.shutdown()
+        self.stats.add_items(len(s3paths) - len(failed))
+        return failed
+
+    def _is_excluded(self, s3path, exclude=None):
+        """
+        Returns True if any component of s3path matches one of the
+        shell-style patterns in exclude
+        """
+        for name in s3path.split(posixpath.sep):
+            for pattern in exclude or []:
+                if fnmatch.fnmatch(name, pattern):
+                    return True
+        return False
+
     def _local_to_s3_path(self, path):
         # remove Windows driver letters (if any)
         path = utils.strip_windows_drive_letter(path)
@@ -205,43 +1481,477 @@ class EasyS3(EasyAWS):
         # join using unix path separator to match S3
         return posixpath.sep.join(parts)
 
+    def _get_s3_path(self, rootdir, path):
+        """
+        Returns the (utf-8 encoded) S3 path for local path under rootdir
+        """
+        s3path = self._local_to_s3_path(os.path.relpath(path, rootdir))
+        if isinstance(s3path, unicode):
+            s3path = s3path.encode('utf-8')
+        return s3path
+
+    def _get_part_sizes(self, size, num_parts):
+        """
+        Returns the candidate part sizes that split size bytes into num_parts
+        parts, starting with the configured chunk size
+        """
+        part_sizes = [self.multipart_chunk_size] + self.CommonPartSizes
+        candidates = []
+        for part_size in part_sizes:
+            if part_size in candidates:
+                continue
+            if utils.get_multipart_count(size, part_size) == num_parts:
+                candidates.append(part_size)
+        return candidates
+
+    def _get_compressed(self, path, st, hashes, gzcache):
+        """
+        Returns a (path, md5, size) tuple describing the gzip-compressed copy
+        of path that should be uploaded in its place or None if path should
+        be uploaded as is
+        """
+        if not gzcache or not gzcache.matches(self._get_content_type(path)):
+            return
+        md5 = hashes.get_md5(path, st=st)
+
+        def hash_func(path):
+            gz_path = gzcache.compress(path, md5)
+            return [utils.compute_md5(gz_path), os.path.getsize(gz_path)]
+        gz_md5, gz_size = hashes.get_hash(path, gzcache.kind, hash_func, st=st)
+        if not gzcache.is_worthwhile(st.st_size, gz_size):
+            return
+        return gzcache.compress(path, md5), gz_md5, gz_size
+
+    def _is_in_sync(self, path, st, s3key, hashes, compressed=None):
+        """
+        Returns True if the local file path matches s3key. Files whose size
+        differs are never hashed. Multipart ETags ('<md5>-<parts>') are
+        compared by recomputing the ETag locally with each part size that
+        would produce the same number of parts. If compressed is specified
+        s3key is compared against the compressed copy of path instead (see
+        _get_compressed).
+        """
+        size = st.st_size
+        if compressed:
+            size = compressed[2]
+        if s3key.size != size:
+            return False
+        etag = s3key.etag.replace('"', '')
+        num_parts = utils.get_etag_parts(etag)
+        if not num_parts:
+            if compressed:
+                return compressed[1] == etag
+            return hashes.get_md5(path, st=st) == etag
+        for part_size in self._get_part_sizes(size, num_parts):
+            if compressed:
+                gz_etag = utils.compute_multipart_etag(compressed[0],
+                                                       part_size)
+                if gz_etag == etag:
+                    return True
+            elif hashes.get_multipart_etag(path, part_size, st=st) == etag:
+                return True
+        return False
+
+    def _is_copyable(self, size):
+        return self.MinCopySize <= size <= self.MaxCopySize
+
+    def _find_copy_source(self, path, st, sources, hashes, gz=None):
+        """
+        Returns the S3 path of an object in sources (CopySources) identical
+        to the local file path or None. Compressed files (see
+        _get_compressed) are only matched against plain MD5 ETags.
+        """
+        content_type = self._get_content_type(path)
+        if gz:
+            return sources.get(gz[1], content_type)
+        s3path = sources.get(hashes.get_md5(path, st=st), content_type)
+        size = st.st_size
+        for num_parts in sorted(sources.multipart_parts.get(size, [])):
+            if s3path:
+                break
+            for part_size in self._get_part_sizes(size, num_parts):
+                etag = hashes.get_multipart_etag(path, part_size, st=st)
+                s3path = sources.get(etag, content_type)
+                if s3path:
+                    break
+        return s3path
+
+    def _find_copy_sources(self, entries, sources, hashes, gzcache=None):
+        """
+        Returns a dictionary mapping the local files in entries (DirEntries)
+        to the S3 path of an identical object with the same content type in
+        sources (CopySources)
+        """
+        copies = {}
+        if not sources:
+            return copies
+        for entry in entries:
+            st = entry.stat()
+            gz = self._get_compressed(entry.path, st, hashes, gzcache)
+            size = st.st_size
+            if gz:
+                size = gz[2]
+            if size not in sources.sizes:
+                continue
+            s3path = self._find_copy_source(entry.path, st, sources, hashes,
+                                            gz)
+            if s3path:
+                copies[entry.path] = s3path
+        return copies
+
+    def iter_local_files(self, rootdir, exclude=None):
+        """
+        Yields (s3path, DirEntry) tuples for every file under rootdir sorted
+        by S3 path
+        """
+        for entry in utils.walk_files(rootdir, exclude=exclude, sort=True):
+            yield self._get_s3_path(rootdir, entry.path), entry
+
+    def _get_gzip_cache(self, gzip=None):
+        """
+        Returns the GzipCache to use for uploads or None if text assets
+        should not be compressed (gzip defaults to the AWS_GZIP setting)
+        """
+        if gzip or (gzip is None and self.gzip):
+            return gzipcache.GzipCache(types=self.gzip_types,
+                                       min_savings=self.gzip_min_savings,
+                                       max_size=self.gzip_cache_size)
+
+    def _get_planner(self):
+        return invalidation.InvalidationPlanner(
+            max_paths=self.cf_max_invalidation_paths,
+            max_overinvalidation=self.cf_max_overinvalidation)
+
     def sync_bucket(self, rootdir, bucket, cf_dist_id=None, files_filter=None,
-                    pre_upload_cb=None, cf_files_filter=None, pretend=False):
-        log.info("Fetching list of files in S3 bucket: %s" % bucket.name)
-        s3files = self.get_bucket_files_map(bucket)
-        put_files_map = dict()
-        for f in utils.find_files(rootdir):
-            relpath = os.path.relpath(f, rootdir)
-            s3path = self._local_to_s3_path(relpath)
-            if s3path in s3files:
-                etag = s3files.get(s3path).etag.replace('"', '')
-                md5 = utils.compute_md5(f)
-                log.debug('S3 path found: %s with ETAG: %s' % (s3path, etag))
-                if etag != md5:
-                    log.info("Existing S3 path '%s' is NOT in sync" % s3path)
-                    put_files_map[f] = s3path
+                    pre_upload_cb=None, cf_files_filter=None, pretend=False,
+                    num_threads=None, exclude=None, full_scan=False,
+                    delete=False, gzip=None):
+        """
+        Upload the files under rootdir that are missing or out of date in
+        bucket and invalidate their paths in CloudFront distribution
+        cf_dist_id (if any). If delete is True files in the bucket that don't
+        exist locally are removed, unless they match one of the exclude
+        patterns. If gzip is True (default: AWS_GZIP setting) text assets are
+        uploaded gzip-compressed with 'Content-Encoding: gzip'.
+
+        Returns a SyncResult mapping local paths to the S3 paths they were
+        uploaded to. The time spent in each phase of the sync is recorded in
+        self.stats (see start_stats).
+        """
+        rootdir = os.path.expanduser(rootdir)
+        if not os.path.isdir(rootdir):
+            raise exception.BaseException("'%s' is not a directory" % rootdir)
+        op_stats = self.stats
+        op_stats.start_phase('list')
+        mf = self.get_manifest(bucket)
+        remote_files, used_manifest = self._get_remote_files(
+            bucket, mf, full_scan=full_scan)
+        jrnl = None
+        if not pretend:
+            jrnl = journal.SyncJournal(bucket.name, rootdir).load()
+            if not jrnl.is_empty:
+                log.info("Resuming interrupted sync: %d file(s) already "
+                         "uploaded, %d deleted" % (len(jrnl.uploaded),
+                                                   len(jrnl.deleted)))
+                remote_files = jrnl.replay(remote_files)
+        # listing, walking and hashing are interleaved while diffing so
+        # their time is measured separately
+        op_stats.start_phase('diff')
+        remote_files = op_stats.time_iter('list', remote_files)
+        local_files = op_stats.time_iter(
+            'walk', self.iter_local_files(rootdir, exclude=exclude))
+        hashes = hashcache.HashCache(rootdir)
+        gzcache = self._get_gzip_cache(gzip)
+
+        def compare(entry, s3key):
+            st = entry.stat()
+            gz = self._get_compressed(entry.path, st, hashes, gzcache)
+            return self._is_in_sync(entry.path, st, s3key, hashes, gz)
+
+        def is_in_sync(entry, s3key):
+            return op_stats.time_call('hash', compare, entry, s3key)
+        put_files_map = SyncResult()
+        # local files to upload from a compressed copy
+        compressed = {}
+        # remote files that won't be touched, in sorted order
+        kept = manifest.ManifestWriter()
+        # previous remote state of files that are out of sync
+        changed = {}
+        # remote files that no longer exist locally and should be deleted
+        extraneous = {}
+        # S3 paths that don't exist in the bucket yet
+        new = set()
+        # remote files that can be copied to new paths
+        copy_sources = CopySources()
+        # local files that might be copied from an identical remote file
+        copy_candidates = []
+        planner = self._get_planner()
+        # hashes computed so far are kept even if the sync is interrupted
+        try:
+            diffs = diff.diff(local_files, remote_files, is_in_sync)
+            for action, s3path, entry, s3key in diffs:
+                planner.add_file(s3path, new=action == diff.ADD)
+                if action in (diff.ADD, diff.CHANGE):
+                    if action == diff.ADD:
+                        log.info("Local file '%s' not on S3 - marked for "
+                                 "upload" % entry.path)
+                        new.add(s3path)
+                    else:
+                        log.info("Existing S3 path '%s' is NOT in sync" %
+                                 s3path)
+                        changed[s3path] = s3key
+                    put_files_map[entry.path] = s3path
+                    size = entry.stat().st_size
+                    gz = self._get_compressed(entry.path, entry.stat(),
+                                              hashes, gzcache)
+                    if gz:
+                        compressed[entry.path] = gz[0]
+                        size = gz[2]
+                    if self._is_copyable(size):
+                        copy_candidates.append(entry)
+                elif (action == diff.EXTRANEOUS and delete and
+                      not self._is_excluded(s3path, exclude)):
+                    log.info("S3 path '%s' not found locally - marked for "
+                             "deletion" % s3path)
+                    extraneous[s3path] = s3key
+                else:
+                    if action == diff.UNCHANGED:
+                        log.debug('S3 path found: %s with ETAG: %s' %
+                                  (s3path, s3key.etag))
+                    kept.add(s3key)
+                if action in (diff.UNCHANGED, diff.EXTRANEOUS):
+                    if self._is_copyable(s3key.size):
+                        copy_sources.add(
+                            s3key, self._get_content_type(s3key.name))
+            if files_filter:
+                put_files_map = files_filter(put_files_map) or put_files_map
+            copy_candidates = [e for e in copy_candidates
+                               if e.path in put_files_map]
+            copies = self._find_copy_sources(copy_candidates, copy_sources,
+                                             hashes, gzcache)
+        finally:
+            hashes.save()
+
+        # only called for files that were actually uploaded (not pretend)
+        def record_upload(f, etag):
+            s3path = put_files_map[f]
+            entry = self._get_manifest_entry(f, s3path, etag,
+                                             compressed.get(f))
+            jrnl.record_upload(entry, new=s3path in new)
+        op_stats.start_phase('copy')
+        copied, copy_failed = self.copy_files(copies, put_files_map, bucket,
+                                              policy='public-read',
+                                              pre_upload_cb=pre_upload_cb,
+                                              pretend=pretend,
+                                              num_threads=num_threads,
+                                              compressed=compressed)
+        for f, etag in copied.items():
+            record_upload(f, etag)
+        # files that failed to copy are uploaded instead
+        uploads = dict([(f, p) for f, p in put_files_map.items()
+                        if f not in copies or f in copy_failed])
+        op_stats.start_phase('upload')
+        uploaded, failed = self.put_files(uploads, bucket,
+                                          policy='public-read',
+                                          pre_upload_cb=pre_upload_cb,
+                                          pretend=pretend,
+                                          num_threads=num_threads,
+                                          compressed=compressed,
+                                          post_upload_cb=record_upload)
+        if gzcache and not pretend:
+            gzcache.prune()
+        uploaded.update(copied)
+        deleted = sorted(extraneous)
+        if extraneous:
+            op_stats.start_phase('delete')
+            log.info("Deleting %d files from S3 bucket: %s" %
+                     (len(extraneous), bucket.name))
+            if not pretend:
+                delete_failed = self.delete_files(bucket, extraneous,
+                                                  num_threads=num_threads)
+                for s3path in delete_failed:
+                    changed[s3path] = extraneous[s3path]
+                failed.update(delete_failed)
+                deleted = [p for p in deleted if p not in delete_failed]
+                jrnl.record_delete(deleted)
+        if not pretend:
+            op_stats.start_phase('manifest')
+            syncs = 0
+            if used_manifest:
+                syncs = mf.syncs_since_verify + 1
+            self._update_manifest(bucket, kept, put_files_map, uploaded,
+                                  changed, compressed=compressed,
+                                  syncs_since_verify=syncs)
+        put_files_map = SyncResult([(f, p) for f, p in put_files_map.items()
+                                    if f not in failed])
+        put_files_map.failed = failed
+        put_files_map.deleted = deleted
+        if cf_dist_id:
+            op_stats.start_phase('invalidate')
+            self._invalidate_changes(cf_dist_id, planner, put_files_map, new,
+                                     cf_files_filter=cf_files_filter,
+                                     jrnl=jrnl)
+        op_stats.end_phase()
+        if jrnl:
+            jrnl.remove()
+        return put_files_map
+
+    def _invalidate_changes(self, cf_dist_id, planner, result, new,
+                            cf_files_filter=None, jrnl=None):
+        """
+        Invalidate the S3 paths uploaded or deleted according to result
+        (SyncResult) in CloudFront distribution cf_dist_id, skipping the
+        paths in new, and record the invalidations created in result. If a
+        SyncJournal is specified the paths changed by previous, interrupted
+        syncs are invalidated as well and the invalidations are recorded in
+        the journal.
+        """
+        cf_files_map = result
+        if cf_files_filter:
+            cf_files_map = cf_files_filter(dict(cf_files_map)) or cf_files_map
+        cfd = self.cf.get_distribution_info(cf_dist_id)
+        root_index = cfd.config.default_root_object
+        new_paths = [p for p in cf_files_map.values() if p in new]
+        changed_paths = [p for p in cf_files_map.values() if p not in new]
+        changed_paths += result.deleted
+        if jrnl:
+            for s3path, is_new in jrnl.unplanned.items():
+                if is_new:
+                    new_paths.append(s3path)
+                else:
+                    changed_paths.append(s3path)
+        cf_paths = planner.plan(changed_paths, root_index=root_index,
+                                new=new_paths)
+        if new_paths:
+            log.info("Skipping CloudFront invalidation for %d new path(s)" %
+                     len(new_paths))
+            result.not_invalidated = sorted(new_paths)
+        if jrnl:
+            cf_paths = sorted(set(cf_paths) | jrnl.pending)
+            if cf_paths:
+                jrnl.record_plan(cf_paths)
+        for s3paths in utils.group_iter(cf_paths, n=1000):
+            batch = self.cf.invalidate_paths(cfd.id, s3paths)
+            result.invalidations[batch.id] = len(s3paths)
+            if jrnl:
+                jrnl.record_invalidation(batch.id, s3paths)
+
+    def _get_local_changes(self, rootdir, paths, remote, exclude=None):
+        """
+        Returns a tuple of two dictionaries for the local paths (files or
+        directories under rootdir) in paths: the files that exist, mapped to
+        their S3 paths, and the S3 paths in remote (RemoteFiles) that no
+        longer exist locally under any of the paths, mapped to their entries
+        """
+        files = {}
+        missing = {}
+        for path in sorted(set(paths)):
+            s3path = self._get_s3_path(rootdir, path)
+            if s3path.startswith('..') or s3path == '.':
+                continue
+            if self._is_excluded(s3path, exclude):
+                continue
+            if os.path.isfile(path):
+                files[path] = s3path
+                continue
+            if s3path in remote and not os.path.exists(path):
+                missing[s3path] = remote[s3path]
+                continue
+            # a directory that was added, removed or replaced
+            found = set()
+            if os.path.isdir(path):
+                for entry in utils.walk_files(path, exclude=exclude):
+                    files[entry.path] = self._get_s3_path(rootdir, entry.path)
+                    found.add(files[entry.path])
+            for entry in remote.itervalues(prefix=s3path + '/'):
+                if (entry.name not in found and
+                        not self._is_excluded(entry.name, exclude)):
+                    missing[entry.name] = entry
+        return files, missing
+
+    def sync_files(self, rootdir, bucket, paths, remote, cf_dist_id=None,
+                   files_filter=None, pre_upload_cb=None, cf_files_filter=None,
+                   num_threads=None, exclude=None, delete=False, gzip=None):
+        """
+        Sync only the local paths (files or directories under rootdir) in
+        paths with bucket. Rather than listing the bucket or downloading the
+        sync manifest the files are compared against remote (RemoteFiles)
+        which is updated to reflect the changes made. Paths that no longer
+        exist locally are deleted from the bucket if delete is True.
+
+        Returns a SyncResult, just like sync_bucket
+        """
+        rootdir = os.path.abspath(os.path.expanduser(rootdir))
+        hashes = hashcache.HashCache(rootdir)
+        gzcache = self._get_gzip_cache(gzip)
+        files, missing = self._get_local_changes(rootdir, paths, remote,
+                                                 exclude=exclude)
+        put_files_map = SyncResult()
+        compressed = {}
+        new = set()
+        for path, s3path in sorted(files.items()):
+            try:
+                st = os.stat(path)
+                gz = self._get_compressed(path, st, hashes, gzcache)
+                s3key = remote.get(s3path)
+                if s3key and self._is_in_sync(path, st, s3key, hashes, gz):
+                    continue
+            except (IOError, OSError), e:
+                # most likely removed or replaced since it was reported
+                log.debug("skipping %s: %s" % (path, e))
+                continue
+            if s3key:
+                log.info("Existing S3 path '%s' is NOT in sync" % s3path)
             else:
-                log.info("Local file '%s' not on S3 - marked for upload" % f)
-                put_files_map[f] = s3path
+                log.info("Local file '%s' not on S3 - marked for upload" %
+                         path)
+                new.add(s3path)
+            put_files_map[path] = s3path
+            if gz:
+                compressed[path] = gz[0]
+        # only the changed paths were hashed: keep the rest of the cache
+        hashes.save(merge=True)
         if files_filter:
             put_files_map = files_filter(put_files_map) or put_files_map
-        for f, s3path in put_files_map.items():
-            self.put_file(f, bucket, s3path, pre_upload_cb=pre_upload_cb,
-                          policy='public-read', pretend=pretend)
-        if not cf_dist_id:
+        uploaded, failed = self.put_files(put_files_map, bucket,
+                                          policy='public-read',
+                                          pre_upload_cb=pre_upload_cb,
+                                          num_threads=num_threads,
+                                          compressed=compressed)
+        if gzcache:
+            gzcache.prune()
+        deleted = []
+        if missing and delete:
+            log.info("Deleting %d files from S3 bucket: %s" %
+                     (len(missing), bucket.name))
+            delete_failed = self.delete_files(bucket, missing,
+                                              num_threads=num_threads)
+            failed.update(delete_failed)
+            deleted = sorted([p for p in missing if p not in delete_failed])
+        if not uploaded and not deleted:
+            put_files_map = SyncResult()
+            put_files_map.failed = failed
             return put_files_map
-        if cf_files_filter:
-            put_files_map = cf_files_filter(put_files_map) or put_files_map
-        cfd = self.cf.get_distribution_info(cf_dist_id)
-        root_index = cfd.config.default_root_object
-        for s3paths in utils.group_iter(put_files_map.values(), n=1000):
-            for s3path in s3paths:
-                bname = posixpath.basename(s3path)
-                if bname == root_index:
-                    slash = posixpath.dirname(s3path) + posixpath.sep
-                    s3paths.append(slash)
-            s3paths.sort()
-            self.cf.invalidate_paths(cfd.id, s3paths)
+        planner = self._get_planner()
+        for s3path in deleted:
+            planner.add_file(s3path)
+            del remote[s3path]
+        for f, etag in uploaded.items():
+            s3path = put_files_map[f]
+            remote[s3path] = self._get_manifest_entry(f, s3path, etag,
+                                                      compressed.get(f))
+        for s3path in remote:
+            planner.add_file(s3path, new=s3path in new)
+        remote.syncs_since_verify += 1
+        self._put_remote_files(bucket, remote)
+        put_files_map = SyncResult([(f, p) for f, p in put_files_map.items()
+                                    if f not in failed])
+        put_files_map.failed = failed
+        put_files_map.deleted = deleted
+        if cf_dist_id:
+            self._invalidate_changes(cf_dist_id, planner, put_files_map, new,
+                                     cf_files_filter=cf_files_filter)
+        return put_files_map
 
     def download_bucket_file(self, bucket_key, local_path):
         pbar = self.progress_bar
@@ -252,32 +1962,91 @@ class EasyS3(EasyAWS):
         pbar.reset()
         return res
 
-    def download_bucket(self, bucket, output_dir):
+    def _download_file_worker(self, bucket_name, s3path, local_path, size,
+                              transfer=None):
+        if transfer:
+            transfer.start_file(s3path, size)
+        conn = self.connections.get()
+        try:
+            bucket = conn.get_bucket(bucket_name, validate=False)
+            key = bucket.new_key(s3path)
+            kwargs = {}
+            if transfer:
+                kwargs['cb'] = transfer.get_callback(s3path)
+            self.scheduler.run(key.get_contents_to_filename, (local_path,),
+                               kwargs, nbytes=size)
+        finally:
+            self.connections.put(conn)
+        return size
+
+    def download_bucket(self, bucket, output_dir, num_threads=None):
+        """
+        Download every file in bucket to a new directory named after the
+        bucket in output_dir using num_threads (default: AWS_UPLOAD_THREADS
+        setting) workers. Downloads are retried by self.scheduler like
+        uploads. The first error is raised once all downloads have finished.
+        """
         if not os.path.isdir(output_dir):
             raise exception.BaseException("'%s' is not a directory" %
                                           output_dir)
         output_dir = os.path.join(output_dir, bucket.name)
         if os.path.isdir(output_dir):
             raise exception.BaseException("'%s' already exists" % output_dir)
+        self.stats.start_phase('list')
         s3files = self.get_bucket_files_map(bucket)
+        self.stats.add_items(len(s3files))
         log.info("Downloading %d files from bucket '%s':" % (len(s3files),
                                                              bucket.name))
-        for key, obj in s3files.items():
-            local_path = os.path.join(output_dir, key)
-            parent_dir = os.path.dirname(local_path)
-            if not os.path.isdir(parent_dir):
-                os.makedirs(parent_dir)
-            self.download_bucket_file(obj, local_path)
+        self.stats.start_phase('download')
+        entries = list(s3files.itervalues())
+        num_threads = self._get_num_threads(num_threads)
+        pool = threadpool.ThreadPool(size=min(num_threads, len(entries)),
+                                     name='s3site-download')
+        transfer = progress.TransferProgress(
+            total_files=len(entries),
+            total_bytes=sum([e.size for e in entries]),
+            label='Downloaded').start()
+        worker = self.stats.bind(self._download_file_worker)
+        failed = []
+        try:
+            for entry in entries:
+                local_path = os.path.join(output_dir, entry.name)
+                parent_dir = os.path.dirname(local_path)
+                if not os.path.isdir(parent_dir):
+                    os.makedirs(parent_dir)
+                log.debug("Downloading: %s" % entry.name)
+                pool.add_job(worker, bucket.name, entry.name, local_path,
+                             entry.size, transfer=transfer, jobid=entry.name)
+            for job in pool.as_completed():
+                transfer.finish_file(job.jobid, failed=job.failed)
+                if job.failed:
+                    log.error("Failed to download file '%s': %s" %
+                              (job.jobid, job.exception))
+                    failed.append(job)
+                    continue
+                self.stats.add_items(1)
+                self.stats.add_bytes(job.result)
+        finally:
+            pool.shutdown()
+            transfer.finish()
+        self.stats.end_phase()
+        if failed:
+            raise failed[0].exception
 
 
 class EasyCF(EasyAWS):
+    DefaultHost = 'cloudfront.amazonaws.com'
+
     def __init__(self, aws_access_key_id, aws_secret_access_key, aws_port=None,
-                 aws_proxy=None, aws_proxy_port=None,
-                 host='cloudfront.amazonaws.com', **kwargs):
-        kwargs = dict(port=aws_port, proxy=aws_proxy,
-                      proxy_port=aws_proxy_port)
+                 aws_is_secure=True, aws_cf_host=DefaultHost, aws_proxy=None,
+                 aws_proxy_port=None, aws_max_connections=None, **kwargs):
+        kwargs = dict(is_secure=aws_is_secure,
+                      host=aws_cf_host or self.DefaultHost, port=aws_port,
+                      proxy=aws_proxy, proxy_port=aws_proxy_port)
         super(EasyCF, self).__init__(aws_access_key_id, aws_secret_access_key,
-                                     boto.connect_cloudfront, **kwargs)
+                                     CloudFrontConnection,
+                                     max_connections=aws_max_connections or 10,
+                                     **kwargs)
 
     def __repr__(self):
         return '<EasyCF: %s>' % self.conn.server_name()
@@ -316,4 +2085,46 @@ class EasyCF(EasyAWS):
             raise ValueError("Too many (>1000) paths to invalidate!")
         for path in paths:
             log.info("Invalidating path: %s" % path)
-        return self.conn.create_invalidation_request(dist_id, paths)
+        batch = invalidation.InvalidationBatch(paths)
+        return self.conn.create_invalidation_request(dist_id, batch)
+
+    def get_invalidation_status(self, dist_id, inval_id):
+        return self.conn.invalidation_request_status(dist_id, inval_id).status
+
+    def wait_for_invalidations(self, dist_id, ids, interval=5,
+                               max_interval=60, timeout=None):
+        """
+        Poll the status of invalidations ids in distribution dist_id until
+        all of them have completed. The time between polls starts at interval
+        seconds and doubles after every poll up to max_interval seconds. Gives
+        up after timeout seconds (if specified).
+
+        Returns a dictionary mapping each id to its last known status
+        """
+        statuses = dict([(i, None) for i in ids])
+        pending = sorted(ids)
+        log.info("Waiting for %d invalidation(s) to complete..." % len(ids))
+        widgets = ['Invalidations: ', progressbar.Fraction(), ' ',
+                   progressbar.Bar(marker=progressbar.RotatingMarker()),
+                   ' ', progressbar.Percentage()]
+        pbar = progressbar.ProgressBar(widgets=widgets, maxval=len(ids),
+                                       force_update=True)
+        start = time.time()
+        while True:
+            for inval_id in pending:
+                status = self.get_invalidation_status(dist_id, inval_id)
+                log.debug("invalidation %s: %s" % (inval_id, status))
+                statuses[inval_id] = status
+            pending = [i for i in pending
+                       if statuses[i] != invalidation.COMPLETED]
+            pbar.update(len(ids) - len(pending))
+            if not pending:
+                break
+            if timeout and time.time() - start + interval > timeout:
+                log.warn("Timed out waiting for %d invalidation(s)" %
+                         len(pending))
+                break
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
+        pbar.finish()
+        return statuses
@@ -17,6 +17,7 @@ from s3site import config
 from s3site import static
 from s3site import logger
 from s3site import commands
+from s3site import profiler
 from s3site import exception
 from s3site import optcomplete
 from s3site.logger import log, console, session
@@ -62,6 +63,9 @@ class S3SiteCLI(object):
         if not args:
             gparser.print_help()
             raise SystemExit("\n!!! Error: you must specify a command.")
+        if gopts.PROFILE_REQUESTS is not None and \
+                not 0 < gopts.PROFILE_REQUESTS <= 1:
+            gparser.error("--profile-requests must be between 0 and 1")
         # set debug level if specified
         if gopts.DEBUG:
             console.setLevel(logger.DEBUG)
@@ -127,6 +131,17 @@ class S3SiteCLI(object):
                            metavar="FILE",
                            help="use alternate config file (default: %s)" %
                            static.S3SITE_CFG_FILE)
+        gparser.add_option("--profile", dest="PROFILE",
+                           action="store_true", default=False,
+                           help="profile the command with cProfile and "
+                           "write the results to %s" % static.S3SITE_LOG_DIR)
+        gparser.add_option("--profile-requests", dest="PROFILE_REQUESTS",
+                           action="store", type="float", default=None,
+                           metavar="RATE",
+                           help="record the latency of a RATE fraction "
+                           "(0-1) of the requests made to AWS, e.g. 1 for "
+                           "every request, and write them to %s" %
+                           static.S3SITE_LOG_DIR)
         gparser.disable_interspersed_args()
         return gparser
 
@@ -184,6 +199,26 @@ class S3SiteCLI(object):
             sys.stdout = sys.__stdout__
             sys.stderr = sys.__stderr__
 
+    def execute(self, sc, args, gopts):
+        """
+        Run the subcommand sc with args, profiling it if the --profile or
+        --profile-requests options were specified
+        """
+        if not (gopts.PROFILE or gopts.PROFILE_REQUESTS):
+            return sc.execute(args)
+        prof = profiler.Profiler(cpu=gopts.PROFILE,
+                                 request_sample_rate=gopts.PROFILE_REQUESTS)
+        prof.start()
+        try:
+            return sc.execute(args)
+        finally:
+            prof.stop()
+            try:
+                for path in prof.save():
+                    log.info("Profile written to: %s" % path)
+            except (IOError, OSError), e:
+                log.error("Unable to write profile: %s" % e)
+
     def is_completion_active(self):
         return 'OPTPARSE_AUTO_COMPLETE' in os.environ
 
@@ -251,7 +286,7 @@ class S3SiteCLI(object):
             sys.exit(0)
         # run the subcommand and handle exceptions
         try:
-            sc.execute(args)
+            self.execute(sc, args, gopts)
         except (EC2ResponseError, S3ResponseError, BotoServerError), e:
             log.error("%s: %s" % (e.error_code, e.error_message))
             sys.exit(1)
@@ -2,6 +2,7 @@ from create import CmdCreate
 from sync import CmdSync
 from list import CmdList
 from clone import CmdClone
+from invalidations import CmdInvalidations
 from delete import CmdDelete
 from shell import CmdShell
 from help import CmdHelp
@@ -11,6 +12,7 @@ all_cmds = [
     CmdSync(),
     CmdList(),
     CmdClone(),
+    CmdInvalidations(),
     CmdDelete(),
     CmdShell(),
     CmdHelp(),
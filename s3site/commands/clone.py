@@ -1,7 +1,7 @@
-from base import CmdBase
+from completers import SiteCompleter
 
 
-class CmdClone(CmdBase):
+class CmdClone(SiteCompleter):
     """
     clone <site_name>
 
@@ -14,6 +14,11 @@ class CmdClone(CmdBase):
                           action="store", default=None,
                           help="use an output directory other than the "
                           "current working directory")
+        parser.add_option("--stats-json", dest="stats_json",
+                          action="store", type="string", default=None,
+                          metavar="PATH",
+                          help="also save per-phase timing statistics to "
+                          "PATH as JSON")
 
     def execute(self, args):
         if len(args) != 1:
@@ -14,6 +14,17 @@ class Completer(CmdBase):
         return self._completer()
 
 
+class SiteCompleter(Completer):
+    """
+    Returns a list of all site names as completion options
+    """
+    def _completer(self):
+        try:
+            return optcomplete.ListCompleter(self.sm.get_site_names())
+        except Exception, e:
+            log.debug('unable to complete site names: %s' % e)
+
+
 class ClusterCompleter(Completer):
     """
     Returns a list of all cluster names as completion options
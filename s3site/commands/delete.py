@@ -1,7 +1,7 @@
-from base import CmdBase
+from completers import SiteCompleter
 
 
-class CmdDelete(CmdBase):
+class CmdDelete(SiteCompleter):
     """
     delete <site_name>
 
@@ -9,7 +9,14 @@ class CmdDelete(CmdBase):
     """
     names = ['delete', 'd']
 
+    def addopts(self, parser):
+        parser.add_option("--stats-json", dest="stats_json",
+                          action="store", type="string", default=None,
+                          metavar="PATH",
+                          help="also save per-phase timing statistics to "
+                          "PATH as JSON")
+
     def execute(self, args):
         if len(args) != 1:
             self.parser.error("please specify a <site_name>")
-        self.sm.delete_site(args[0])
+        self.sm.delete_site(args[0], **self.specified_options_dict)
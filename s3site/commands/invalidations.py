@@ -0,0 +1,22 @@
+from completers import SiteCompleter
+
+
+class CmdInvalidations(SiteCompleter):
+    """
+    invalidations <site_name>
+
+    Show the status of the CloudFront invalidations created by sync
+    """
+    names = ['invalidations', 'inv']
+
+    def addopts(self, parser):
+        parser.add_option("-w", "--wait", dest="wait",
+                          action="store_true", default=None,
+                          help="wait for invalidations that are in progress "
+                          "to complete")
+
+    def execute(self, args):
+        if len(args) != 1:
+            self.parser.error("please specify a <site_name>")
+        site_name = args[0]
+        self.sm.list_invalidations(site_name, **self.specified_options_dict)
@@ -1,7 +1,7 @@
-from base import CmdBase
+from completers import SiteCompleter
 
 
-class CmdList(CmdBase):
+class CmdList(SiteCompleter):
     """
     list
 
@@ -9,5 +9,11 @@ class CmdList(CmdBase):
     """
     names = ['list', 'ls']
 
+    def addopts(self, parser):
+        parser.add_option("-r", "--refresh", dest="refresh",
+                          action="store_true", default=False,
+                          help="scan the account for sites instead of using "
+                          "the cached list of sites")
+
     def execute(self, args):
-        self.sm.list_all_sites(args)
+        self.sm.list_all_sites(args, refresh=self.opts.refresh)
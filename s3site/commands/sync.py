@@ -1,10 +1,10 @@
 import os
 
 from s3site import exception
-from base import CmdBase
+from completers import SiteCompleter
 
 
-class CmdSync(CmdBase):
+class CmdSync(SiteCompleter):
     """
     sync <site_name> <root_directory>
 
@@ -12,6 +12,49 @@ class CmdSync(CmdBase):
     """
     names = ['sync', 's']
 
+    def addopts(self, parser):
+        parser.add_option("-n", "--num-threads", dest="num_threads",
+                          action="callback", type="int", default=None,
+                          callback=self._positive_int,
+                          help="number of concurrent uploads (default: "
+                          "AWS_UPLOAD_THREADS setting or 10)")
+        parser.add_option("-x", "--exclude", dest="exclude",
+                          action="append", type="string", default=None,
+                          help="skip files and directories whose name "
+                          "matches this shell pattern (this option can be "
+                          "used more than once)")
+        parser.add_option("-F", "--full-scan", dest="full_scan",
+                          action="store_true", default=None,
+                          help="list the entire S3 bucket instead of using "
+                          "the site's sync manifest")
+        parser.add_option("-d", "--delete", dest="delete",
+                          action="store_true", default=None,
+                          help="delete files from the site that don't exist "
+                          "in <root_directory> (files matching --exclude "
+                          "patterns are kept)")
+        parser.add_option("-z", "--gzip", dest="gzip",
+                          action="store_true", default=None,
+                          help="upload text assets (HTML, CSS, JS, JSON, "
+                          "etc.) gzip-compressed with Content-Encoding: gzip "
+                          "(default: AWS_GZIP setting)")
+        parser.add_option("-w", "--wait", dest="wait",
+                          action="store_true", default=None,
+                          help="wait for the CloudFront invalidations to "
+                          "complete before exiting")
+        parser.add_option("-W", "--watch", dest="watch",
+                          action="store_true", default=None,
+                          help="keep running and sync files as soon as they "
+                          "change in <root_directory> (press Ctrl-C to stop)")
+        parser.add_option("-P", "--poll", dest="poll",
+                          action="store_true", default=None,
+                          help="poll <root_directory> for changes in watch "
+                          "mode instead of using inotify")
+        parser.add_option("--stats-json", dest="stats_json",
+                          action="store", type="string", default=None,
+                          metavar="PATH",
+                          help="also save per-phase timing statistics to "
+                          "PATH as JSON")
+
     def execute(self, args):
         if len(args) != 2:
             self.parser.error(
@@ -19,4 +62,4 @@ class CmdSync(CmdBase):
         site_name, rootdir = args
         if not os.path.isdir(rootdir):
             raise exception.BaseException("'%s' is not a directory" % rootdir)
-        self.sm.sync(site_name, rootdir)
+        self.sm.sync(site_name, rootdir, **self.specified_options_dict)
@@ -0,0 +1,73 @@
+"""
+Streaming diff between a local directory tree and the contents of an S3
+bucket
+
+Both sides must be sorted by S3 path in the same (byte-wise lexicographic)
+order that S3 uses when listing a bucket. This allows the diff to merge-join
+the two streams while holding only one item from each side in memory.
+"""
+from s3site import exception
+
+ADD = 'add'
+CHANGE = 'change'
+UNCHANGED = 'unchanged'
+EXTRANEOUS = 'extraneous'
+
+
+def _check_sorted(items, key, name):
+    prev = None
+    for item in items:
+        k = key(item)
+        if prev is not None and k <= prev:
+            raise exception.SortOrderError(name, prev, k)
+        prev = k
+        yield item
+
+
+def merge_join(left, right, left_key, right_key):
+    """
+    Joins two iterables sorted by key and yields (key, left_item, right_item)
+    tuples in key order. left_item or right_item is None if the key only
+    appears on one side.
+    """
+    left = iter(_check_sorted(left, left_key, 'left'))
+    right = iter(_check_sorted(right, right_key, 'right'))
+    litem = next(left, None)
+    ritem = next(right, None)
+    while litem is not None or ritem is not None:
+        lkey = litem is not None and left_key(litem)
+        rkey = ritem is not None and right_key(ritem)
+        if ritem is None or (litem is not None and lkey < rkey):
+            yield lkey, litem, None
+            litem = next(left, None)
+        elif litem is None or rkey < lkey:
+            yield rkey, None, ritem
+            ritem = next(right, None)
+        else:
+            yield lkey, litem, ritem
+            litem = next(left, None)
+            ritem = next(right, None)
+
+
+def diff(local_files, remote_files, is_in_sync):
+    """
+    Yields (action, s3path, local_entry, remote_entry) tuples for every path
+    in either local_files or remote_files
+
+    local_files yields (s3path, DirEntry) tuples and remote_files yields
+    objects with a name attribute (e.g. boto Keys or ManifestEntries).
+    is_in_sync(local_entry, remote_entry) is called for paths that exist on
+    both sides to choose between CHANGE and UNCHANGED. Paths that only exist
+    locally are ADDed and paths that only exist remotely are EXTRANEOUS.
+    """
+    for s3path, local, remote in merge_join(local_files, remote_files,
+                                            lambda l: l[0],
+                                            lambda r: r.name):
+        if remote is None:
+            yield ADD, s3path, local[1], None
+        elif local is None:
+            yield EXTRANEOUS, s3path, None, remote
+        elif is_in_sync(local[1], remote):
+            yield UNCHANGED, s3path, local[1], remote
+        else:
+            yield CHANGE, s3path, local[1], remote
@@ -69,6 +69,25 @@ class SiteDoesNotExist(S3SiteError):
         self.msg = "Site '%s' does not exist" % site_name
 
 
+class SyncFailed(S3SiteError):
+    def __init__(self, site_name, failed):
+        self.failed = failed
+        msg = "Failed to sync %d file(s) while syncing site '%s':"
+        self.msg = msg % (len(failed), site_name)
+        for f in sorted(failed):
+            self.msg += "\n%s: %s" % (f, failed[f])
+
+
+class InvalidManifest(S3SiteError):
+    def __init__(self, reason):
+        self.msg = "invalid sync manifest: %s" % reason
+
+
+class SortOrderError(S3SiteError):
+    def __init__(self, name, prev, key):
+        self.msg = "%s is not sorted: '%s' came after '%s'" % (name, key, prev)
+
+
 class AWSError(BaseException):
     """Base exception for all AWS related errors"""
 
@@ -0,0 +1,135 @@
+"""
+Cache of gzip-compressed copies of text assets uploaded by sync
+
+Files whose content type matches one of the configured patterns are
+compressed before upload and stored on S3 with 'Content-Encoding: gzip'. The
+compressed output is deterministic (no file name or timestamp in the gzip
+header) so the same source always produces the same payload and therefore the
+same ETag. Compressed payloads are stored in static.S3SITE_GZIP_CACHE_DIR
+keyed by the source file's MD5 so unchanged files are never recompressed.
+Cache files can be safely deleted at any time: the least recently used ones
+are removed once the cache grows beyond max_size bytes (see prune).
+"""
+import os
+import gzip
+import shutil
+import fnmatch
+import tempfile
+
+from s3site import utils
+from s3site import static
+from s3site.logger import log
+
+
+class GzipCache(object):
+    DefaultTypes = ['text/*', 'application/javascript',
+                    'application/x-javascript', 'application/json',
+                    'application/xml', 'application/rss+xml',
+                    'application/atom+xml', 'image/svg+xml']
+
+    DefaultMaxSize = 256 * 1024 * 1024
+
+    def __init__(self, types=None, min_savings=10, level=9, cache_dir=None,
+                 max_size=None):
+        self.types = types or self.DefaultTypes
+        self.min_savings = min_savings
+        self.level = level
+        self.cache_dir = cache_dir or static.S3SITE_GZIP_CACHE_DIR
+        self.max_size = max_size or self.DefaultMaxSize
+
+    def __repr__(self):
+        return '<GzipCache: %s>' % self.cache_dir
+
+    @property
+    def kind(self):
+        """
+        Hash cache kind used to store the MD5 and size of compressed payloads
+        """
+        return 'gzip-%d' % self.level
+
+    def matches(self, content_type):
+        """
+        Returns True if files of content_type should be compressed
+        """
+        for pattern in self.types:
+            if fnmatch.fnmatch(content_type, pattern):
+                return True
+        return False
+
+    def is_worthwhile(self, size, gz_size):
+        """
+        Returns True if compressing size bytes down to gz_size bytes saves at
+        least min_savings percent
+        """
+        return gz_size * 100 <= size * (100 - self.min_savings)
+
+    def get_path(self, md5):
+        return os.path.join(self.cache_dir, md5[:2],
+                            '%s-%d.gz' % (md5, self.level))
+
+    def compress(self, path, md5):
+        """
+        Returns the path to the compressed copy of path whose MD5 hex digest
+        is md5, compressing it first if it isn't already cached
+        """
+        gz_path = self.get_path(md5)
+        if os.path.isfile(gz_path):
+            # the modification time records when it was last used
+            try:
+                os.utime(gz_path, None)
+            except OSError:
+                pass
+            return gz_path
+        gz_dir = os.path.dirname(gz_path)
+        if not os.path.isdir(gz_dir):
+            os.makedirs(gz_dir)
+        log.debug("compressing %s to %s" % (path, gz_path))
+        fd, tmp = tempfile.mkstemp(dir=gz_dir, suffix='.tmp')
+        try:
+            f = os.fdopen(fd, 'wb')
+            gz = gzip.GzipFile(filename='', mode='wb', fileobj=f,
+                               compresslevel=self.level, mtime=0)
+            src = open(path, 'rb')
+            shutil.copyfileobj(src, gz)
+            src.close()
+            gz.close()
+            f.close()
+            os.rename(tmp, gz_path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return gz_path
+
+    def prune(self):
+        """
+        Remove the least recently used compressed copies until the cache
+        takes up at most max_size bytes. Returns the number of files removed.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        files = []
+        total = 0
+        for entry in utils.walk_files(self.cache_dir):
+            if not entry.name.endswith('.gz'):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+        files.sort()
+        removed = 0
+        for mtime, size, path in files:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            log.debug("removed %d file(s) from gzip cache %s" %
+                      (removed, self.cache_dir))
+        return removed
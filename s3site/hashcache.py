@@ -0,0 +1,127 @@
+"""
+Persistent cache of local file MD5 hashes used when syncing sites
+
+Each root directory gets its own cache file in static.S3SITE_HASH_CACHE_DIR.
+Entries are keyed by the file's path relative to the root directory and are
+only reused if the file's size, mtime and inode haven't changed. Cache files
+can be safely deleted at any time.
+"""
+import os
+import json
+import hashlib
+import tempfile
+
+from s3site import utils
+from s3site import static
+from s3site.logger import log
+
+
+class HashCache(object):
+    version = 2
+
+    def __init__(self, rootdir, cache_dir=None):
+        self.rootdir = os.path.abspath(os.path.expanduser(rootdir))
+        self.cache_dir = cache_dir or static.S3SITE_HASH_CACHE_DIR
+        cache_name = hashlib.md5(self.rootdir).hexdigest() + '.json'
+        self.cache_file = os.path.join(self.cache_dir, cache_name)
+        self._entries = None
+        self._updated = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return '<HashCache: %s>' % self.rootdir
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = self.load()
+        return self._entries
+
+    def load(self):
+        """
+        Returns the cached entries for this root directory. A missing or
+        unreadable cache file results in an empty cache.
+        """
+        if not os.path.isfile(self.cache_file):
+            return {}
+        try:
+            cache = json.load(open(self.cache_file))
+            if cache.get('version') != self.version:
+                return {}
+            return cache.get('entries', {})
+        except (IOError, ValueError, AttributeError), e:
+            log.debug("ignoring invalid hash cache %s: %s" %
+                      (self.cache_file, e))
+            return {}
+
+    def _stat_key(self, st):
+        return [st.st_size, st.st_mtime, st.st_ino]
+
+    def get_hash(self, path, kind, hash_func, st=None):
+        """
+        Returns hash_func(path), reusing the cached value of the given kind if
+        the file hasn't changed since it was last hashed
+        """
+        st = st or os.stat(path)
+        relpath = os.path.relpath(path, self.rootdir)
+        stat_key = self._stat_key(st)
+        updated = self._updated.get(relpath)
+        if not updated or updated[:3] != stat_key:
+            hashes = {}
+            entry = self.entries.get(relpath)
+            if entry and entry[:3] == stat_key:
+                hashes = entry[3]
+            updated = self._updated[relpath] = stat_key + [hashes]
+        hashes = updated[3]
+        if kind in hashes:
+            self.hits += 1
+        else:
+            self.misses += 1
+            hashes[kind] = hash_func(path)
+        return hashes[kind]
+
+    def get_md5(self, path, st=None):
+        """
+        Returns the MD5 hex digest of path
+        """
+        return self.get_hash(path, 'md5', utils.compute_md5, st=st)
+
+    def get_multipart_etag(self, path, part_size, st=None):
+        """
+        Returns the ETag S3 assigns to path when uploaded in part_size parts
+        """
+        def hash_func(path):
+            return utils.compute_multipart_etag(path, part_size)
+        kind = 'multipart-%d' % part_size
+        return self.get_hash(path, kind, hash_func, st=st)
+
+    def save(self, merge=False):
+        """
+        Atomically replace the cache file with the entries used during this
+        run. Entries for files that were not looked up are dropped unless
+        merge is True, which should be used when only some of the files under
+        the root directory were looked up (e.g. sync --watch).
+        """
+        entries = self._updated
+        if merge:
+            entries = dict(self.entries)
+            entries.update(self._updated)
+        cache = dict(version=self.version, rootdir=self.rootdir,
+                     entries=entries)
+        tmp = None
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            f = os.fdopen(fd, 'w')
+            json.dump(cache, f)
+            f.close()
+            os.rename(tmp, self.cache_file)
+        except (IOError, OSError), e:
+            log.warn("Unable to save hash cache %s: %s" % (self.cache_file, e))
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        log.debug("hash cache %s: %d hits, %d misses" %
+                  (self.cache_file, self.hits, self.misses))
@@ -0,0 +1,269 @@
+"""
+CloudFront invalidation planning
+
+CloudFront bills every invalidation path, while a '/dir/*' wildcard counts as
+a single path no matter how many files it covers. The planner collapses the
+paths changed by a sync into wildcards for directories where most files
+changed and, if the plan still exceeds the configured number of paths,
+collapses further directories, choosing the ones that save the most paths
+for the fewest unchanged files invalidated along the way.
+
+Paths that didn't exist before the sync can't be cached at any edge location
+so they are never invalidated (except for the directory of a new default root
+object in a directory that already existed).
+
+The invalidations created by sync are recorded per site in
+static.S3SITE_INVALIDATIONS_DIR so their status can be checked later.
+"""
+import os
+import json
+import time
+import urllib
+import tempfile
+import posixpath
+
+from boto.cloudfront import invalidation
+
+from s3site import static
+from s3site.logger import log
+
+ROOT = ''
+# status of an invalidation that has been applied at every edge location
+COMPLETED = 'Completed'
+
+
+class InvalidationBatch(invalidation.InvalidationBatch):
+    """
+    InvalidationBatch that doesn't escape the '*' in wildcard paths
+    """
+    def escape(self, p):
+        if not p.startswith('/'):
+            p = '/' + p
+        return urllib.quote(p, safe='/*')
+
+
+def get_parent_dirs(s3path):
+    """
+    Returns the directories containing s3path from the root down, e.g.
+    'a/b/c.html' => ['', 'a/', 'a/b/']
+    """
+    dirs = [ROOT]
+    parts = s3path.split('/')[:-1]
+    for i in range(len(parts)):
+        dirs.append('/'.join(parts[:i + 1]) + '/')
+    return dirs
+
+
+class InvalidationPlanner(object):
+    """
+    Plans the CloudFront invalidation paths for a set of changed S3 paths
+
+    Every S3 path in the site (changed or not) must be registered with
+    add_file so the planner knows how many files each wildcard would cover
+    and which directories existed before the sync.
+    max_overinvalidation is the maximum percentage of unchanged files a
+    directory may contain for it to be replaced with a wildcard. If the plan
+    still has more than max_paths paths additional directories are collapsed
+    regardless of max_overinvalidation until it fits.
+    """
+    def __init__(self, max_paths=1000, max_overinvalidation=50):
+        self.max_paths = max_paths
+        self.max_overinvalidation = max_overinvalidation
+        # number of files under each directory
+        self.totals = {}
+        # directories that contained at least one file before the sync
+        self.existing_dirs = set()
+
+    def add_file(self, s3path, new=False):
+        """
+        Register s3path with the planner. new is True if s3path didn't exist
+        before the sync.
+        """
+        for d in get_parent_dirs(s3path):
+            self.totals[d] = self.totals.get(d, 0) + 1
+            if not new:
+                self.existing_dirs.add(d)
+
+    def _wildcard(self, d):
+        return d + '*'
+
+    def _slash(self, d):
+        return d or '/'
+
+    def _add_dirs(self, dirs):
+        for d in dirs:
+            self._counts.setdefault(d, 0)
+        for parent, child in zip(dirs, dirs[1:]):
+            self._children.setdefault(parent, set()).add(child)
+
+    def plan(self, changed, root_index=None, new=None):
+        """
+        Returns a sorted list of paths to invalidate for the changed S3
+        paths. If root_index (the distribution's default root object) is
+        specified, a changed root_index file also invalidates its directory
+        ('dir/'). new S3 paths are not invalidated, unless they're a
+        root_index in an existing directory in which case only the
+        directory's slash path is invalidated.
+        """
+        changed = set(changed)
+        new = set(new or []) - changed
+        self._counts = {}
+        self._new = {}
+        self._files = {}
+        self._slashes = set()
+        self._children = {}
+        for s3path in changed:
+            dirs = get_parent_dirs(s3path)
+            self._add_dirs(dirs)
+            for d in dirs:
+                self._counts[d] += 1
+            self._files.setdefault(dirs[-1], []).append(s3path)
+            if root_index and posixpath.basename(s3path) == root_index:
+                self._slashes.add(dirs[-1])
+        for s3path in new:
+            dirs = get_parent_dirs(s3path)
+            for d in dirs:
+                self._new[d] = self._new.get(d, 0) + 1
+            if (root_index and posixpath.basename(s3path) == root_index and
+                    dirs[-1] in self.existing_dirs):
+                self._add_dirs(dirs)
+                self._slashes.add(dirs[-1])
+        if not self._counts:
+            return []
+        collapsed = set([d for d in self._counts
+                         if self._is_mostly_changed(d)])
+        paths = self._get_paths(ROOT, collapsed)
+        while len(paths) > self.max_paths:
+            d = self._get_best_collapse(collapsed)
+            if d is None:
+                break
+            collapsed.add(d)
+            paths = self._get_paths(ROOT, collapsed)
+        return sorted(paths)
+
+    def _unchanged(self, d):
+        """
+        Returns the number of files under directory d that are neither
+        changed nor new
+        """
+        unchanged = (self.totals.get(d, 0) - self._counts[d] -
+                     self._new.get(d, 0))
+        return max(unchanged, 0)
+
+    def _is_mostly_changed(self, d):
+        if self._counts[d] + (d in self._slashes) < 2:
+            return False
+        total = self._counts[d] + self._unchanged(d)
+        return (self._unchanged(d) * 100 <=
+                self.max_overinvalidation * total)
+
+    def _get_paths(self, d, collapsed):
+        """
+        Returns the invalidation paths for the changes under directory d and
+        records the number of paths for each directory in self._num_paths
+        """
+        if d == ROOT:
+            self._num_paths = {}
+        if d in collapsed:
+            paths = [self._wildcard(d)]
+        else:
+            paths = list(self._files.get(d, []))
+            if d in self._slashes:
+                paths.append(self._slash(d))
+            for child in self._children.get(d, []):
+                paths.extend(self._get_paths(child, collapsed))
+        self._num_paths[d] = len(paths)
+        return paths
+
+    def _get_best_collapse(self, collapsed):
+        """
+        Returns the directory whose collapse saves the most paths per
+        unchanged file invalidated or None if no collapse saves any paths
+        """
+        best = None
+        best_cost = None
+        for d, num_paths in sorted(self._num_paths.items()):
+            if d in collapsed or num_paths < 2:
+                continue
+            cost = (self._unchanged(d) + 1) / float(num_paths - 1)
+            if best_cost is None or cost < best_cost:
+                best, best_cost = d, cost
+        return best
+
+
+class InvalidationHistory(object):
+    """
+    Record of the CloudFront invalidations created when syncing a site. Only
+    the most recent MaxRecords invalidations are kept.
+    """
+    MaxRecords = 100
+
+    def __init__(self, site_name, history_dir=None):
+        self.site_name = site_name
+        self.history_dir = history_dir or static.S3SITE_INVALIDATIONS_DIR
+        self.history_file = os.path.join(self.history_dir,
+                                         site_name + '.json')
+        self._records = None
+
+    def __repr__(self):
+        return '<InvalidationHistory: %s>' % self.site_name
+
+    @property
+    def records(self):
+        """
+        List of dictionaries with the id, dist_id, created (timestamp),
+        num_paths and status of each invalidation, oldest first
+        """
+        if self._records is None:
+            self._records = self.load()
+        return self._records
+
+    def load(self):
+        if not os.path.isfile(self.history_file):
+            return []
+        try:
+            return json.load(open(self.history_file)).get('invalidations', [])
+        except (IOError, ValueError, AttributeError), e:
+            log.debug("ignoring invalid invalidation history %s: %s" %
+                      (self.history_file, e))
+            return []
+
+    def add(self, dist_id, inval_id, num_paths=None, status='InProgress'):
+        self.records.append(dict(id=inval_id, dist_id=dist_id,
+                                 created=time.time(), num_paths=num_paths,
+                                 status=status))
+        del self.records[:-self.MaxRecords]
+
+    def get_pending(self):
+        """
+        Returns the records of invalidations that haven't completed
+        """
+        return [r for r in self.records if r['status'] != COMPLETED]
+
+    def update(self, statuses):
+        """
+        Update the status of the invalidations in statuses (id -> status)
+        """
+        for r in self.records:
+            if statuses.get(r['id']):
+                r['status'] = statuses[r['id']]
+
+    def save(self):
+        """
+        Atomically replace the history file with the current records
+        """
+        tmp = None
+        try:
+            if not os.path.isdir(self.history_dir):
+                os.makedirs(self.history_dir)
+            fd, tmp = tempfile.mkstemp(dir=self.history_dir, suffix='.tmp')
+            f = os.fdopen(fd, 'w')
+            json.dump(dict(site=self.site_name, invalidations=self.records),
+                      f, indent=1)
+            f.close()
+            os.rename(tmp, self.history_file)
+        except (IOError, OSError), e:
+            log.warn("Unable to save invalidation history %s: %s" %
+                     (self.history_file, e))
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
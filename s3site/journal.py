@@ -0,0 +1,171 @@
+"""
+On-disk checkpoint journal used to resume interrupted syncs
+
+While syncing, every completed upload, copy and delete is appended to a
+journal file in static.S3SITE_JOURNAL_DIR (one per site and root directory)
+along with the CloudFront invalidation paths planned and the invalidations
+created. The sync manifest is only updated once a sync finishes so if a sync
+is interrupted the next sync replays the journal: files that were already
+uploaded or deleted are treated as such instead of being compared against
+the stale manifest, and their paths are still invalidated. The journal is
+removed once a sync finishes.
+
+Each line in the journal is a JSON record. A partially written last line
+(e.g. from a crash) is ignored.
+"""
+import os
+import json
+import time
+import hashlib
+
+from s3site import diff
+from s3site import static
+from s3site import manifest
+from s3site.logger import log
+
+
+class SyncJournal(object):
+    version = 1
+
+    def __init__(self, bucket_name, rootdir, journal_dir=None):
+        self.bucket_name = bucket_name
+        self.rootdir = os.path.abspath(os.path.expanduser(rootdir))
+        self.journal_dir = journal_dir or static.S3SITE_JOURNAL_DIR
+        rootdir_hash = hashlib.md5(self.rootdir).hexdigest()
+        journal_name = '%s-%s.journal' % (bucket_name, rootdir_hash)
+        self.journal_file = os.path.join(self.journal_dir, journal_name)
+        # S3 paths uploaded or copied by previous syncs -> ManifestEntry
+        self.uploaded = {}
+        # S3 paths deleted by previous syncs
+        self.deleted = set()
+        # S3 paths changed by previous syncs that haven't been planned for
+        # invalidation yet -> whether the path was new to the bucket
+        self.unplanned = {}
+        # planned invalidation paths that haven't been invalidated yet
+        self.pending = set()
+        self._fp = None
+
+    def __repr__(self):
+        return '<SyncJournal: %s>' % self.journal_file
+
+    @property
+    def is_empty(self):
+        return not (self.uploaded or self.deleted or self.unplanned or
+                    self.pending)
+
+    def _read_records(self):
+        try:
+            f = open(self.journal_file)
+        except IOError:
+            return
+        try:
+            lines = iter(f)
+            try:
+                header = json.loads(next(lines))
+            except (StopIteration, ValueError):
+                return
+            if (not isinstance(header, dict) or
+                    header.get('version') != self.version or
+                    header.get('bucket') != self.bucket_name or
+                    header.get('rootdir') != self.rootdir):
+                log.debug("ignoring journal %s written for another sync" %
+                          self.journal_file)
+                return
+            for line in lines:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    log.debug("ignoring truncated journal record: %r" % line)
+                    return
+        finally:
+            f.close()
+
+    def load(self):
+        """
+        Replay the records written by previous syncs that didn't finish
+        """
+        for r in self._read_records():
+            op = r.get('op')
+            if op == 'upload':
+                entry = manifest.ManifestEntry(r['s3path'], r['etag'],
+                                               r['size'], r['headers'])
+                self.uploaded[entry.name] = entry
+                self.deleted.discard(entry.name)
+                self.unplanned[entry.name] = (
+                    self.unplanned.get(entry.name, True) and r['new'])
+            elif op == 'delete':
+                for s3path in r['s3paths']:
+                    s3path = s3path.encode('utf-8')
+                    self.uploaded.pop(s3path, None)
+                    self.deleted.add(s3path)
+                    self.unplanned[s3path] = False
+            elif op == 'plan':
+                self.pending.update([p.encode('utf-8') for p in r['paths']])
+                self.unplanned.clear()
+            elif op == 'invalidation':
+                self.pending.difference_update(
+                    [p.encode('utf-8') for p in r['paths']])
+        return self
+
+    def replay(self, remote_files):
+        """
+        Yields the entries from remote_files (sorted by S3 path) updated with
+        the uploads and deletes recorded in the journal
+        """
+        uploaded = sorted(self.uploaded.values(), key=lambda e: e.name)
+        for name, remote, journaled in diff.merge_join(remote_files,
+                                                       uploaded,
+                                                       lambda e: e.name,
+                                                       lambda e: e.name):
+            if name in self.deleted:
+                continue
+            yield journaled or remote
+
+    def _append(self, record):
+        if self._fp is None:
+            if not os.path.isdir(self.journal_dir):
+                os.makedirs(self.journal_dir)
+            is_new = not os.path.isfile(self.journal_file)
+            self._fp = open(self.journal_file, 'a')
+            if is_new:
+                header = dict(version=self.version, bucket=self.bucket_name,
+                              rootdir=self.rootdir, created=time.time())
+                self._fp.write(json.dumps(header) + '\n')
+        self._fp.write(json.dumps(record) + '\n')
+        # flushed (but not fsync'd) after every record so that it survives
+        # the process being killed
+        self._fp.flush()
+
+    def record_upload(self, entry, new=False):
+        """
+        Record that entry (ManifestEntry) was uploaded or copied. new is
+        True if the S3 path didn't exist in the bucket before.
+        """
+        self._append(dict(op='upload', s3path=entry.name, etag=entry.etag,
+                          size=entry.size, headers=entry.headers, new=new))
+
+    def record_delete(self, s3paths):
+        if s3paths:
+            self._append(dict(op='delete', s3paths=list(s3paths)))
+
+    def record_plan(self, paths):
+        """
+        Record the full list of paths that are about to be invalidated
+        """
+        self._append(dict(op='plan', paths=list(paths)))
+
+    def record_invalidation(self, inval_id, paths):
+        self._append(dict(op='invalidation', id=inval_id, paths=list(paths)))
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def remove(self):
+        """
+        Remove the journal once the sync it records has finished
+        """
+        self.close()
+        if os.path.isfile(self.journal_file):
+            os.remove(self.journal_file)
@@ -0,0 +1,123 @@
+"""
+Compact manifest of a site bucket's contents
+
+The manifest is stored in the site's bucket alongside static.S3SITE_META_FILE
+as gzip-compressed JSON lines: a header object followed by one
+[path, etag, size, headers] array per S3 object sorted by path. sync reads it
+instead of listing the entire bucket.
+
+Manifests are read and written as streams so that memory usage doesn't grow
+with the number of objects in the bucket.
+"""
+import gzip
+import json
+import zlib
+import time
+import tempfile
+
+from s3site import static
+from s3site import exception
+
+# s3site's own files are never part of a site's contents
+RESERVED_FILES = [static.S3SITE_META_FILE, static.S3SITE_MANIFEST_FILE]
+VERSION = 1
+
+
+class ManifestEntry(object):
+    """
+    Remote state of a single S3 object. Provides the same name, etag and size
+    attributes as boto's Key so that it can be used in its place. Names are
+    always stored as UTF-8 encoded strings so that they sort in the same
+    order as S3 listings.
+    """
+    __slots__ = ['name', 'etag', 'size', 'headers']
+
+    def __init__(self, name, etag, size, headers=None):
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        self.name = name
+        self.etag = str(etag).strip('"')
+        self.size = size
+        self.headers = headers or {}
+
+    def __repr__(self):
+        return '<ManifestEntry: %s>' % self.name
+
+    @classmethod
+    def from_key(cls, key, headers=None):
+        return cls(key.name, key.etag, key.size, headers)
+
+
+class ManifestReader(object):
+    """
+    Iterates over the entries of a manifest stored in fileobj. The whole
+    manifest is read once up front so that a corrupt manifest is detected
+    before any of its entries are used.
+    """
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        header = self._read_header(self._open())
+        if not isinstance(header, dict) or header.get('version') != VERSION:
+            raise exception.InvalidManifest("unsupported manifest header")
+        self.created = header.get('created')
+        self.syncs_since_verify = header.get('syncs_since_verify', 0)
+        self.count = 0
+        for entry in self:
+            self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def _open(self):
+        self.fileobj.seek(0)
+        return gzip.GzipFile(fileobj=self.fileobj, mode='rb')
+
+    def _read_header(self, gz):
+        try:
+            return json.loads(gz.readline())
+        except (IOError, EOFError, ValueError, zlib.error), e:
+            raise exception.InvalidManifest(str(e))
+
+    def __iter__(self):
+        gz = self._open()
+        self._read_header(gz)
+        try:
+            for line in gz:
+                name, etag, size, headers = json.loads(line)
+                yield ManifestEntry(name, etag, size, headers)
+        except (IOError, EOFError, ValueError, TypeError, zlib.error), e:
+            raise exception.InvalidManifest(str(e))
+
+
+class ManifestWriter(object):
+    """
+    Writes manifest entries, which must be added in sorted order, to fileobj
+    (a temporary file by default)
+    """
+    def __init__(self, fileobj=None, syncs_since_verify=0):
+        self.fileobj = fileobj or tempfile.TemporaryFile()
+        self.gz = gzip.GzipFile(fileobj=self.fileobj, mode='wb')
+        self.count = 0
+        self._last = None
+        header = dict(version=VERSION, created=time.time(),
+                      syncs_since_verify=syncs_since_verify)
+        self.gz.write(json.dumps(header) + '\n')
+
+    def add(self, entry):
+        if entry.name in RESERVED_FILES:
+            return
+        if self._last is not None and entry.name <= self._last:
+            raise exception.SortOrderError('manifest', self._last, entry.name)
+        self._last = entry.name
+        self.count += 1
+        self.gz.write(json.dumps([entry.name, entry.etag, entry.size,
+                                  entry.headers]) + '\n')
+
+    def close(self):
+        """
+        Finish writing and return the underlying file object rewound to the
+        beginning
+        """
+        self.gz.close()
+        self.fileobj.seek(0)
+        return self.fileobj
@@ -0,0 +1,305 @@
+"""
+Profiling support for the global --profile and --profile-requests options
+
+Profiler runs cProfile in the main thread and in the ThreadPool workers
+started while profiling (upload, listing and delete workers) and merges the
+results. Other threads (e.g. those started by libraries) are not affected.
+Each worker stops its own profiler when it exits so only the workers that have
+finished by the time the results are saved are included. Profilers can be
+nested: a worker's results are added to every Profiler that was active when
+it started. Profiler can also record the latency of the requests made to AWS
+by EasyS3 and EasyCF connections (see RequestSampler).
+
+The results are written to static.S3SITE_LOG_DIR:
+
+  - profile-<timestamp>.pstats: raw cProfile data for use with pstats or
+    other tools (e.g. snakeviz)
+  - profile-<timestamp>.txt: the most expensive functions followed by a
+    summary of request latencies by service and method
+  - profile-<timestamp>-requests.csv: one row per sampled request
+"""
+import os
+import sys
+import csv
+import time
+import random
+import pstats
+import cProfile
+import threading
+
+from s3site import static
+
+# the RequestSampler requests are reported to (set while profiling)
+request_sampler = None
+
+# the Profilers with cpu profiling enabled, innermost last
+_active = []
+_active_lock = threading.Lock()
+
+
+class RequestSampler(object):
+    """
+    Records the latency of a rate fraction (0 < rate <= 1) of requests
+    """
+    def __init__(self, rate=1.0):
+        self.rate = rate
+        self.started = time.time()
+        self.total = 0
+        # (start offset, thread, service, method, path, status, latency)
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<RequestSampler: %d/%d sampled>' % (len(self.samples),
+                                                    self.total)
+
+    def record(self, service, method, path, status, elapsed):
+        self._lock.acquire()
+        try:
+            self.total += 1
+            if self.rate < 1 and random.random() >= self.rate:
+                return
+            offset = time.time() - elapsed - self.started
+            self.samples.append((round(offset, 6),
+                                 threading.currentThread().getName(),
+                                 service, method, path, status,
+                                 round(elapsed, 6)))
+        finally:
+            self._lock.release()
+
+    def write_csv(self, path):
+        f = open(path, 'wb')
+        try:
+            writer = csv.writer(f)
+            writer.writerow(['start', 'thread', 'service', 'method', 'path',
+                             'status', 'seconds'])
+            for row in self.samples:
+                writer.writerow([isinstance(c, unicode) and
+                                 c.encode('utf-8') or c for c in row])
+        finally:
+            f.close()
+
+    def format_summary(self):
+        """
+        Returns a list of lines with the count, errors and latency
+        percentiles of the sampled requests for each service and method
+        """
+        groups = {}
+        for row in self.samples:
+            groups.setdefault((row[2], row[3]), []).append(row)
+        fmt = '%-12s %-7s %7s %7s %8s %8s %8s %8s'
+        lines = ['%d of %d requests sampled' % (len(self.samples),
+                                                self.total),
+                 fmt % ('service', 'method', 'count', 'errors', 'mean',
+                        'p50', 'p90', 'max')]
+        for (service, method), rows in sorted(groups.items()):
+            latencies = sorted([r[6] for r in rows])
+            errors = len([r for r in rows if r[5] is None or r[5] >= 400])
+            lines.append(fmt % (
+                service, method, len(rows), errors,
+                '%.3fs' % (sum(latencies) / len(latencies)),
+                '%.3fs' % get_percentile(latencies, 50),
+                '%.3fs' % get_percentile(latencies, 90),
+                '%.3fs' % latencies[-1]))
+        return lines
+
+
+def get_percentile(values, percent):
+    """
+    Returns the percent percentile of the sorted list values
+    """
+    i = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[i]
+
+
+class ThreadStats(object):
+    """
+    The stats of a cProfile profiler that has been stopped by the thread it
+    ran in. cProfile profilers must be disabled by their own thread, so
+    pstats.Stats is given this instead of the profiler, which it would
+    disable again from the main thread. pstats.Stats takes over (and clears)
+    the stats it loads so each load gets a copy, which lets the same
+    ThreadStats be shared by nested Profilers and loaded more than once.
+    """
+    def __init__(self, profile):
+        profile.create_stats()
+        self._stats = profile.stats
+        self.stats = dict(self._stats)
+
+    def create_stats(self):
+        self.stats = dict(self._stats)
+
+
+def _get_active():
+    _active_lock.acquire()
+    try:
+        return list(_active)
+    finally:
+        _active_lock.release()
+
+
+def profile_worker(run):
+    """
+    Call run() (a ThreadPool worker's loop) under cProfile if any Profiler is
+    active and add the results to each of them
+    """
+    profilers = _get_active()
+    if not profilers:
+        return run()
+    thread = threading.currentThread()
+    for prof in profilers:
+        prof._add_thread(thread)
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        return run()
+    finally:
+        profile.disable()
+        thread_stats = ThreadStats(profile)
+        for prof in profilers:
+            prof._add_stats(thread_stats)
+
+
+class Profiler(object):
+    """
+    Profiles the code run between start() and stop() with cProfile if cpu
+    is True and samples AWS request latencies if request_sample_rate is
+    specified. start() and stop() must be called from the same thread and
+    nested Profilers must be stopped before the Profilers enclosing them.
+    """
+    # seconds stop() waits for the profiled ThreadPool workers to exit
+    # (e.g. the workers of pools that have just been shut down)
+    JoinTimeout = 2.0
+
+    def __init__(self, cpu=True, request_sample_rate=None):
+        self.cpu = cpu
+        self.sampler = None
+        if request_sample_rate:
+            self.sampler = RequestSampler(request_sample_rate)
+        self.started = None
+        # ThreadStats of the profiled threads that have finished
+        self._thread_stats = []
+        self._profile = None
+        # the Profiler that was profiling the main thread before start()
+        self._outer = None
+        self._prev_sampler = None
+        # workers profiled while profiling
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _add_stats(self, thread_stats):
+        self._lock.acquire()
+        try:
+            self._thread_stats.append(thread_stats)
+        finally:
+            self._lock.release()
+
+    def _add_thread(self, thread):
+        self._lock.acquire()
+        try:
+            self._threads.append(thread)
+        finally:
+            self._lock.release()
+
+    def start(self):
+        global request_sampler
+        self.started = time.time()
+        if self.sampler:
+            self._prev_sampler = request_sampler
+            request_sampler = self.sampler
+        if self.cpu:
+            _active_lock.acquire()
+            try:
+                if _active:
+                    self._outer = _active[-1]
+                _active.append(self)
+            finally:
+                _active_lock.release()
+            # only one cProfile profiler can run per thread so the enclosing
+            # Profiler's is paused and gets these results when stopped
+            if self._outer and self._outer._profile:
+                self._outer._profile.disable()
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def stop(self):
+        global request_sampler
+        if self.sampler:
+            request_sampler = self._prev_sampler
+            self._prev_sampler = None
+        if self.cpu and self._profile:
+            self._profile.disable()
+            thread_stats = ThreadStats(self._profile)
+            self._profile = None
+            _active_lock.acquire()
+            try:
+                _active.remove(self)
+            finally:
+                _active_lock.release()
+            outer = self._outer
+            self._outer = None
+            self._add_stats(thread_stats)
+            if outer:
+                outer._add_stats(thread_stats)
+                if outer._profile:
+                    outer._profile.enable()
+            deadline = time.time() + self.JoinTimeout
+            for thread in self._threads:
+                thread.join(max(deadline - time.time(), 0))
+            self._threads = []
+
+    def get_stats(self, stream=None):
+        """
+        Returns a pstats.Stats object combining the profiles of the main
+        thread and the threads that have finished
+        """
+        self._lock.acquire()
+        try:
+            thread_stats = list(self._thread_stats)
+        finally:
+            self._lock.release()
+        stats = None
+        for ts in thread_stats:
+            if not ts._stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(ts, stream=stream)
+            else:
+                stats.add(ts)
+        return stats
+
+    def save(self, log_dir=None):
+        """
+        Write the profile data to log_dir (default: static.S3SITE_LOG_DIR)
+        and return the paths of the files written
+        """
+        log_dir = log_dir or static.S3SITE_LOG_DIR
+        if not os.path.isdir(log_dir):
+            os.makedirs(log_dir)
+        timestamp = time.strftime('%Y%m%d-%H%M%S',
+                                  time.localtime(self.started))
+        prefix = os.path.join(log_dir, 'profile-%s' % timestamp)
+        paths = []
+        report = open(prefix + '.txt', 'w')
+        try:
+            report.write('command: %s\n' % ' '.join(sys.argv))
+            report.write('threads profiled: %d\n\n' %
+                         len(self._thread_stats))
+            stats = None
+            if self.cpu:
+                stats = self.get_stats(stream=report)
+            if stats:
+                stats.dump_stats(prefix + '.pstats')
+                paths.append(prefix + '.pstats')
+                stats.sort_stats('cumulative').print_stats(40)
+                stats.sort_stats('time').print_stats(20)
+            if self.sampler:
+                report.write('\n'.join(self.sampler.format_summary()))
+                report.write('\n')
+                self.sampler.write_csv(prefix + '-requests.csv')
+                paths.append(prefix + '-requests.csv')
+        finally:
+            report.close()
+        paths.append(prefix + '.txt')
+        return paths
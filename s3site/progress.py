@@ -0,0 +1,221 @@
+"""
+Aggregate progress display for concurrent transfers
+
+TransferProgress shows the progress of a whole batch of transfers on a single
+line: files and bytes done, transfer rates, the number of active transfers
+and an ETA. Transfer callbacks (e.g. boto's upload callbacks) only update
+counters; the line is redrawn by a separate timer thread at most every
+interval seconds so that the cost of drawing doesn't grow with the number of
+files or callbacks. The line is only redrawn while transferring if fd is a
+terminal. Otherwise (e.g. when logging to a file or in CI) only the final
+line is written.
+"""
+import sys
+import time
+import threading
+
+from s3site import utils
+
+
+class TransferProgress(object):
+    """
+    Shows the aggregate progress of total_files transfers totalling
+    total_bytes bytes
+
+    progress = TransferProgress(total_files=10, total_bytes=1024).start()
+    progress.start_file(path, size)
+    progress.update(path, nbytes)  # e.g. from a boto callback
+    progress.finish_file(path)
+    progress.finish()
+    """
+    # transfer rates are averaged over this many seconds
+    RateWindow = 10.0
+
+    def __init__(self, total_files=0, total_bytes=0, label='Transferred',
+                 fd=sys.stderr, interval=0.5, term_width=79):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.label = label
+        self.fd = fd
+        self.interval = interval
+        self.term_width = term_width
+        self.redraw = is_terminal(fd)
+        self.files_done = 0
+        self.files_failed = 0
+        self.bytes_done = 0
+        self.start_time = None
+        # active transfers -> [bytes transferred so far, size]
+        self._active = {}
+        # (time, bytes done, files done) samples used to compute rates
+        self._samples = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return '<TransferProgress: %d/%d files>' % (self.files_done,
+                                                    self.total_files)
+
+    @property
+    def active(self):
+        return len(self._active)
+
+    @property
+    def is_running(self):
+        return self.start_time is not None and not self._stopped.isSet()
+
+    def start(self):
+        """
+        Start the timer thread that redraws the progress line (if fd is a
+        terminal)
+        """
+        self.start_time = time.time()
+        self._samples = [(self.start_time, 0, 0)]
+        if self.redraw:
+            self._thread = threading.Thread(target=self._run,
+                                            name='s3site-progress')
+            self._thread.setDaemon(True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.isSet():
+            self._stopped.wait(self.interval)
+            if not self._stopped.isSet():
+                self.draw()
+
+    def start_file(self, path, size=None):
+        """
+        Record that path, which is size bytes long, started transferring
+        """
+        self._lock.acquire()
+        try:
+            self._active[path] = [0, size]
+        finally:
+            self._lock.release()
+
+    def update(self, path, nbytes, total=None):
+        """
+        Record that nbytes of path's total bytes have been transferred so
+        far. Can be passed directly to boto as a transfer callback using
+        get_callback().
+        """
+        self._lock.acquire()
+        try:
+            transfer = self._active.setdefault(path, [0, total])
+            # a retried transfer starts again from 0
+            self.bytes_done += nbytes - transfer[0]
+            transfer[0] = nbytes
+        finally:
+            self._lock.release()
+
+    def get_callback(self, path):
+        """
+        Returns a callback suitable for boto's cb argument which reports
+        path's progress
+        """
+        def callback(nbytes, total):
+            self.update(path, nbytes, total)
+        return callback
+
+    def finish_file(self, path, failed=False):
+        """
+        Record that path finished transferring. Bytes not reported by
+        update() so far are counted as done as well.
+        """
+        self._lock.acquire()
+        try:
+            done, size = self._active.pop(path, [0, None])
+            if failed:
+                self.files_failed += 1
+                self.bytes_done -= done
+            else:
+                self.files_done += 1
+                if size is not None:
+                    self.bytes_done += size - done
+        finally:
+            self._lock.release()
+
+    def get_rates(self):
+        """
+        Returns the current transfer rates in bytes/sec and files/sec
+        """
+        now = time.time()
+        self._lock.acquire()
+        try:
+            self._samples.append((now, self.bytes_done, self.files_done))
+            while (len(self._samples) > 2 and
+                   now - self._samples[1][0] >= self.RateWindow):
+                self._samples.pop(0)
+            first = self._samples[0]
+            last = self._samples[-1]
+        finally:
+            self._lock.release()
+        elapsed = last[0] - first[0]
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return ((last[1] - first[1]) / elapsed, (last[2] - first[2]) / elapsed)
+
+    def get_eta(self, bytes_per_sec, files_per_sec):
+        """
+        Returns the estimated number of seconds left or None if unknown
+        """
+        if self.total_bytes and bytes_per_sec > 0:
+            return max(self.total_bytes - self.bytes_done, 0) / bytes_per_sec
+        elif self.total_files and files_per_sec > 0:
+            files_left = (self.total_files - self.files_done -
+                          self.files_failed)
+            return max(files_left, 0) / files_per_sec
+
+    def format_line(self, final=False):
+        bytes_per_sec, files_per_sec = self.get_rates()
+        if final:
+            elapsed = time.time() - (self.start_time or time.time())
+            if elapsed > 0:
+                bytes_per_sec = self.bytes_done / elapsed
+                files_per_sec = self.files_done / elapsed
+        parts = ['%s: %d/%d files' % (self.label, self.files_done,
+                                      self.total_files)]
+        parts.append('%s/%s' % (utils.format_size(self.bytes_done),
+                                utils.format_size(self.total_bytes)))
+        parts.append('%s/s' % utils.format_size(bytes_per_sec))
+        parts.append('%.1f files/s' % files_per_sec)
+        if self.files_failed:
+            parts.append('%d failed' % self.files_failed)
+        if final:
+            parts.append('Time %s' % utils.format_seconds(elapsed))
+        else:
+            parts.append('%d active' % self.active)
+            eta = self.get_eta(bytes_per_sec, files_per_sec)
+            if eta is None:
+                parts.append('ETA --:--:--')
+            else:
+                parts.append('ETA %s' % utils.format_seconds(eta))
+        return ' '.join(parts)
+
+    def draw(self, final=False):
+        line = self.format_line(final=final)
+        end = final and '\n' or '\r'
+        self.fd.write(line.ljust(self.term_width) + end)
+        self.fd.flush()
+
+    def finish(self):
+        """
+        Stop the timer thread and draw the final progress line
+        """
+        if not self.is_running:
+            return
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.draw(final=True)
+
+
+def is_terminal(fd):
+    isatty = getattr(fd, 'isatty', None)
+    try:
+        return bool(isatty and isatty())
+    except ValueError:
+        # closed file
+        return False
@@ -0,0 +1,125 @@
+"""
+Local cache of the sites in an AWS account
+
+Finding every site in an account means listing all of its buckets and
+checking each one for s3site's metadata file (see SiteManager.get_all_sites)
+which is slow for accounts with many buckets. SiteRegistry keeps the name,
+website endpoint, index and error documents and CloudFront distribution of
+each site found in a file in static.S3SITE_REGISTRY_DIR (one per account and
+S3 endpoint) so that 'list' and site name completion can use it instead.
+
+The registry is considered fresh for ttl seconds after the account was last
+scanned. Creating or deleting a site updates the registry without a rescan.
+The registry file can be safely deleted at any time.
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+from s3site import static
+from s3site.logger import log
+
+
+class SiteRegistry(object):
+    version = 1
+
+    def __init__(self, account, ttl=3600, registry_dir=None):
+        self.account = account
+        self.ttl = ttl
+        self.registry_dir = registry_dir or static.S3SITE_REGISTRY_DIR
+        registry_name = hashlib.md5(account).hexdigest() + '.json'
+        self.registry_file = os.path.join(self.registry_dir, registry_name)
+        # time the account was last scanned for sites
+        self.scanned = None
+        self._sites = None
+
+    def __repr__(self):
+        return '<SiteRegistry: %d sites>' % len(self.sites)
+
+    @property
+    def sites(self):
+        """
+        Dictionary mapping site names to dictionaries with the site's name,
+        website_endpoint, index_doc, error_doc and, if the site has a
+        CloudFront distribution, its cf_id, cf_domain, cf_enabled and
+        cf_cnames
+        """
+        if self._sites is None:
+            self._sites = self.load()
+        return self._sites
+
+    @property
+    def is_fresh(self):
+        """
+        True if the account was scanned for sites less than ttl seconds ago
+        """
+        self.sites
+        if not self.ttl or self.scanned is None:
+            return False
+        return 0 <= time.time() - self.scanned <= self.ttl
+
+    def load(self):
+        """
+        Returns the registered sites. A missing or unreadable registry file
+        results in an empty registry.
+        """
+        if not os.path.isfile(self.registry_file):
+            return {}
+        try:
+            registry = json.load(open(self.registry_file))
+            if registry.get('version') != self.version:
+                return {}
+            self.scanned = registry.get('scanned')
+            return dict([(s['name'], s) for s in registry.get('sites', [])])
+        except (IOError, ValueError, AttributeError, KeyError), e:
+            log.debug("ignoring invalid site registry %s: %s" %
+                      (self.registry_file, e))
+            return {}
+
+    def get_names(self):
+        return sorted(self.sites)
+
+    def get_sites(self):
+        """
+        Returns the registered sites sorted by name
+        """
+        return [self.sites[name] for name in self.get_names()]
+
+    def add(self, site):
+        """
+        Register site (see sites) replacing any site with the same name
+        """
+        self.sites[site['name']] = site
+
+    def remove(self, name):
+        self.sites.pop(name, None)
+
+    def replace(self, sites):
+        """
+        Replace the registered sites with the sites found by scanning the
+        account
+        """
+        self._sites = dict([(s['name'], s) for s in sites])
+        self.scanned = time.time()
+
+    def save(self):
+        """
+        Atomically replace the registry file with the current sites
+        """
+        tmp = None
+        try:
+            if not os.path.isdir(self.registry_dir):
+                os.makedirs(self.registry_dir)
+            fd, tmp = tempfile.mkstemp(dir=self.registry_dir, suffix='.tmp')
+            f = os.fdopen(fd, 'w')
+            json.dump(dict(version=self.version, scanned=self.scanned,
+                           sites=self.get_sites()), f, indent=1)
+            f.close()
+            os.rename(tmp, self.registry_file)
+        except (IOError, OSError), e:
+            log.warn("Unable to save site registry %s: %s" %
+                     (self.registry_file, e))
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
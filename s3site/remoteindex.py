@@ -0,0 +1,218 @@
+"""
+Compact in-memory index of the objects in an S3 bucket
+
+Keeping a boto Key (or even a ManifestEntry) per object costs several hundred
+bytes per object which adds up to gigabytes for buckets with millions of
+objects. RemoteIndex instead stores the sorted object names in a list and
+everything else in flat arrays:
+
+  - MD5s as 16 raw bytes each (multipart ETags store the MD5 of the part
+    MD5s plus the part count)
+  - sizes and part counts in typed arrays
+  - headers as an index into a list of the distinct header dictionaries
+    (most sites only have a handful of distinct Content-Types)
+
+ManifestEntries are created on demand when an object is looked up. Entries
+can be added, replaced and removed after the index has been built; these
+changes are kept in a small dictionary which is merged into the arrays once
+it grows past MaxUpdates entries.
+"""
+import array
+import bisect
+import binascii
+
+from s3site import diff
+from s3site import exception
+from s3site import manifest
+
+# 'L' is 64 bits on most Unix platforms, elsewhere fall back to a double
+# which represents sizes up to 2**53 bytes exactly
+SIZE_TYPECODE = array.array('L').itemsize >= 8 and 'L' or 'd'
+MAX_PARTS = 2 ** 16 - 1
+
+
+class RemoteIndex(object):
+    """
+    Maps S3 paths to ManifestEntries, sorted by S3 path
+
+    entries must be sorted by name. The index supports the basic dictionary
+    operations (get, in, [], del, len and iteration over the sorted names).
+    """
+    MaxUpdates = 10000
+
+    def __init__(self, entries=None):
+        self._names = []
+        self._md5s = bytearray()
+        self._sizes = array.array(SIZE_TYPECODE)
+        self._parts = array.array('H')
+        self._header_ids = array.array('I')
+        self._headers = []
+        self._header_ids_by_key = {}
+        # ETags that aren't (multipart) MD5 hex digests, by position
+        self._etags = {}
+        # entries added or replaced (ManifestEntry) or removed (None) since
+        # the arrays were last compacted
+        self._updates = {}
+        self._len = 0
+        for entry in entries or []:
+            self.append(entry)
+
+    def __repr__(self):
+        return '<%s: %d objects>' % (self.__class__.__name__, len(self))
+
+    def __len__(self):
+        return self._len
+
+    def _find(self, name):
+        i = bisect.bisect_left(self._names, name)
+        if i < len(self._names) and self._names[i] == name:
+            return i
+
+    def _get_header_id(self, headers):
+        key = tuple(sorted((headers or {}).items()))
+        header_id = self._header_ids_by_key.get(key)
+        if header_id is None:
+            header_id = len(self._headers)
+            self._headers.append(dict(key))
+            self._header_ids_by_key[key] = header_id
+        return header_id
+
+    def append(self, entry):
+        """
+        Add entry (ManifestEntry or boto Key) to the end of the index. Its
+        name must sort after every name already in the index.
+        """
+        if self._updates:
+            self.compact()
+        if self._names and entry.name <= self._names[-1]:
+            raise exception.SortOrderError('remote index', self._names[-1],
+                                           entry.name)
+        i = len(self._names)
+        etag = entry.etag.strip('"')
+        md5, sep, parts = etag.partition('-')
+        try:
+            raw = binascii.unhexlify(md5)
+            parts = int(parts or 0)
+            if len(raw) != 16 or parts > MAX_PARTS or bool(sep) != bool(parts):
+                raise ValueError(etag)
+        except (TypeError, ValueError):
+            raw = '\0' * 16
+            parts = 0
+            self._etags[i] = etag
+        name = entry.name
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        self._names.append(name)
+        self._md5s.extend(raw)
+        self._sizes.append(entry.size)
+        self._parts.append(parts)
+        self._header_ids.append(self._get_header_id(
+            getattr(entry, 'headers', None)))
+        self._len += 1
+
+    def _get_entry(self, i):
+        etag = self._etags.get(i)
+        if etag is None:
+            etag = binascii.hexlify(self._md5s[i * 16:(i + 1) * 16])
+            if self._parts[i]:
+                etag += '-%d' % self._parts[i]
+        headers = dict(self._headers[self._header_ids[i]])
+        return manifest.ManifestEntry(self._names[i], etag,
+                                      int(self._sizes[i]), headers)
+
+    def get(self, name, default=None):
+        if name in self._updates:
+            entry = self._updates[name]
+            if entry is None:
+                return default
+            return entry
+        i = self._find(name)
+        if i is None:
+            return default
+        return self._get_entry(i)
+
+    def __contains__(self, name):
+        if name in self._updates:
+            return self._updates[name] is not None
+        return self._find(name) is not None
+
+    def __getitem__(self, name):
+        entry = self.get(name)
+        if entry is None:
+            raise KeyError(name)
+        return entry
+
+    def __setitem__(self, name, entry):
+        if name not in self:
+            self._len += 1
+        self._updates[name] = entry
+        if len(self._updates) > self.MaxUpdates:
+            self.compact()
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self._len -= 1
+        self._updates[name] = None
+        if len(self._updates) > self.MaxUpdates:
+            self.compact()
+
+    def _iter(self, prefix=''):
+        """
+        Yields (name, position, update) tuples for the names starting with
+        prefix where position is the name's position in the arrays (or None)
+        and update is the name's pending update (or None)
+        """
+        start = bisect.bisect_left(self._names, prefix)
+        names = self._names
+
+        def positions():
+            for i in xrange(start, len(names)):
+                if not names[i].startswith(prefix):
+                    return
+                yield i
+        updates = sorted([u for u in self._updates.items()
+                          if u[0].startswith(prefix)])
+        for name, i, update in diff.merge_join(positions(), updates,
+                                               lambda i: names[i],
+                                               lambda u: u[0]):
+            if update is not None:
+                if update[1] is not None:
+                    yield name, None, update[1]
+            else:
+                yield name, i, None
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def iterkeys(self, prefix=''):
+        """
+        Yields the names starting with prefix in sorted order
+        """
+        for name, i, update in self._iter(prefix):
+            yield name
+
+    def itervalues(self, prefix=''):
+        """
+        Yields the ManifestEntries for the names starting with prefix in
+        sorted order
+        """
+        for name, i, update in self._iter(prefix):
+            if update is not None:
+                yield update
+            else:
+                yield self._get_entry(i)
+
+    def compact(self):
+        """
+        Merge pending updates into the arrays
+        """
+        if not self._updates:
+            return
+        index = RemoteIndex()
+        for entry in self.itervalues():
+            index.append(entry)
+        for attr in ('_names', '_md5s', '_sizes', '_parts', '_header_ids',
+                     '_headers', '_header_ids_by_key', '_etags', '_updates',
+                     '_len'):
+            setattr(self, attr, getattr(index, attr))
@@ -0,0 +1,221 @@
+"""
+Request scheduling for concurrent S3 operations
+
+Every S3 request made by EasyS3's upload, copy and delete workers goes
+through a single RequestScheduler which:
+
+  - limits the number of requests and bytes sent per second using token
+    buckets (both optional)
+  - limits the number of requests in flight using AIMD (additive increase,
+    multiplicative decrease): the limit is halved whenever S3 responds with
+    '503 SlowDown' and grows by roughly one request per round-trip while
+    requests succeed, up to the configured maximum
+  - retries throttled requests and transient errors (500/503 responses,
+    connection errors) with exponential backoff and full jitter so that
+    workers throttled at the same time don't retry in lockstep
+"""
+import time
+import random
+import socket
+import httplib
+import threading
+
+from s3site.logger import log
+
+
+class TokenBucket(object):
+    """
+    Allows an average of rate units per second with bursts of up to capacity
+    units (default: one second's worth)
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<TokenBucket: %s/s>' % self.rate
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def consume(self, n=1):
+        """
+        Blocks until n units can be taken from the bucket. Requests for more
+        than the bucket's capacity wait for a full bucket and leave it in
+        debt so that the average rate is still respected.
+        """
+        need = min(n, self.capacity)
+        while True:
+            self._lock.acquire()
+            try:
+                self._refill()
+                if self.tokens >= need:
+                    self.tokens -= n
+                    return
+                wait = (need - self.tokens) / self.rate
+            finally:
+                self._lock.release()
+            time.sleep(wait)
+
+
+class RequestScheduler(object):
+    """
+    Runs S3 requests from any number of threads subject to shared rate
+    limits, an adaptive concurrency limit and a retry policy. See the module
+    docstring for details.
+
+    scheduler = RequestScheduler(max_concurrency=10, max_requests_per_sec=50)
+    etag = scheduler.run(upload, args=(path,), nbytes=size)
+    """
+    # error codes S3 uses to ask clients to slow down
+    ThrottleCodes = ['SlowDown', 'Throttling', 'ServiceUnavailable']
+    # error codes for transient failures that are worth retrying
+    RetryCodes = ['InternalError', 'RequestTimeout']
+
+    def __init__(self, max_concurrency=10, min_concurrency=1,
+                 max_requests_per_sec=None, max_bytes_per_sec=None,
+                 max_retries=5, base_delay=0.25, max_delay=20.0):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_concurrency = max(1, min(int(min_concurrency),
+                                          self.max_concurrency))
+        self.max_retries = max(0, int(max_retries))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.requests = None
+        if max_requests_per_sec:
+            self.requests = TokenBucket(max_requests_per_sec)
+        self.bandwidth = None
+        if max_bytes_per_sec:
+            self.bandwidth = TokenBucket(max_bytes_per_sec)
+        # current concurrency limit (fractional so it can grow gradually)
+        self.limit = float(self.max_concurrency)
+        # number of requests that were throttled/retried so far
+        self.throttled = 0
+        self.retries = 0
+        # called with the exception whenever a request is retried
+        self.retry_hook = None
+        self._active = 0
+        self._last_decrease = None
+        self._cond = threading.Condition()
+
+    def __repr__(self):
+        return '<RequestScheduler: %d/%d>' % (self.concurrency,
+                                              self.max_concurrency)
+
+    @property
+    def concurrency(self):
+        return int(self.limit)
+
+    def set_max_concurrency(self, max_concurrency):
+        """
+        Change the maximum number of concurrent requests. The current limit
+        is only raised to the new maximum if requests were never throttled.
+        """
+        self._cond.acquire()
+        try:
+            self.max_concurrency = max(1, int(max_concurrency))
+            self.min_concurrency = min(self.min_concurrency,
+                                       self.max_concurrency)
+            if self._last_decrease is None:
+                self.limit = float(self.max_concurrency)
+            else:
+                self.limit = min(self.limit, self.max_concurrency)
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    def _acquire(self):
+        self._cond.acquire()
+        try:
+            while self._active >= self.concurrency:
+                self._cond.wait()
+            self._active += 1
+            return time.time()
+        finally:
+            self._cond.release()
+
+    def _release(self, started, succeeded, throttled, retrying=False):
+        self._cond.acquire()
+        try:
+            self._active -= 1
+            if retrying:
+                self.retries += 1
+            if throttled:
+                self.throttled += 1
+                # requests that were already in flight when the limit was
+                # last decreased don't decrease it again
+                if self._last_decrease is None or \
+                        started >= self._last_decrease:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._last_decrease = time.time()
+                    log.debug("S3 is throttling requests, reducing "
+                              "concurrency to %d" % self.concurrency)
+            elif succeeded:
+                self.limit = min(self.max_concurrency,
+                                 self.limit + 1.0 / self.limit)
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    def is_throttled(self, e):
+        return (getattr(e, 'status', None) == 503 or
+                getattr(e, 'error_code', None) in self.ThrottleCodes)
+
+    def is_retryable(self, e):
+        if isinstance(e, (socket.error, httplib.HTTPException)):
+            return True
+        status = getattr(e, 'status', None)
+        return ((status is not None and status >= 500) or
+                getattr(e, 'error_code', None) in self.RetryCodes)
+
+    def get_retry_delay(self, attempt):
+        """
+        Returns a random delay between 0 and base_delay * 2**attempt seconds
+        (at most max_delay)
+        """
+        return random.uniform(0, min(self.max_delay,
+                                     self.base_delay * 2 ** attempt))
+
+    def run(self, func, args=None, kwargs=None, nbytes=0):
+        """
+        Call func(*args, **kwargs), which sends a single request of roughly
+        nbytes bytes to S3, once the rate and concurrency limits allow it.
+        Throttled requests and transient errors are retried up to
+        max_retries times.
+        """
+        args = args or ()
+        kwargs = kwargs or {}
+        attempt = 0
+        while True:
+            if self.requests:
+                self.requests.consume()
+            if self.bandwidth and nbytes:
+                self.bandwidth.consume(nbytes)
+            started = self._acquire()
+            succeeded = throttled = retrying = False
+            try:
+                result = func(*args, **kwargs)
+                succeeded = True
+                return result
+            except Exception, e:
+                throttled = self.is_throttled(e)
+                if attempt >= self.max_retries or \
+                        not (throttled or self.is_retryable(e)):
+                    raise
+                retrying = True
+            finally:
+                self._release(started, succeeded, throttled, retrying)
+            attempt += 1
+            if self.retry_hook:
+                self.retry_hook(e)
+            delay = self.get_retry_delay(attempt)
+            log.debug("retrying %s in %.2fs (attempt %d of %d): %s" %
+                      (getattr(func, '__name__', func), delay, attempt,
+                       self.max_retries, e))
+            time.sleep(delay)
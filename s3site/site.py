@@ -6,17 +6,37 @@ from boto.exception import S3ResponseError
 from s3site import config
 from s3site import static
 from s3site import spinner
+from s3site import watcher
+from s3site import registry
 from s3site import exception
+from s3site import invalidation
 from s3site import progressbar
 from s3site.logger import log
 
 
+def get_registry_entry(name, webconfig, website_endpoint, dist=None):
+    """
+    Returns the site registry entry (see registry.SiteRegistry.sites) of
+    site name from its website configuration, website endpoint and
+    CloudFront distribution (DistributionSummary), if any
+    """
+    webcfg = webconfig.get("WebsiteConfiguration")
+    entry = dict(name=name, website_endpoint=website_endpoint,
+                 index_doc=webcfg.get("IndexDocument", {}).get("Suffix"),
+                 error_doc=webcfg.get("ErrorDocument", {}).get("Key"))
+    if dist:
+        entry.update(cf_id=dist.id, cf_domain=dist.domain_name,
+                     cf_enabled=dist.enabled, cf_cnames=list(dist.cnames))
+    return entry
+
+
 class SiteManager(object):
     def __init__(self, s3=None, cf=None, cfg=None):
         self.cfg = cfg or config.S3SiteConfig().load()
         self.s3 = s3 or self.cfg.get_easy_s3()
         self.cf = cf or self.cfg.get_easy_cf()
         self._progress_bar = None
+        self._site_registry = None
 
     @property
     def progress_bar(self):
@@ -28,6 +48,17 @@ class SiteManager(object):
             self._progress_bar = pbar
         return self._progress_bar
 
+    @property
+    def site_registry(self):
+        """
+        Local cache of the sites in the account (see registry.SiteRegistry)
+        """
+        if not self._site_registry:
+            account = '%s@%s' % (self.s3.aws_access_key_id, self.s3.conn.host)
+            ttl = self.cfg.globals.get('site_cache_ttl')
+            self._site_registry = registry.SiteRegistry(account, ttl=ttl)
+        return self._site_registry
+
     def get_site(self, name):
         try:
             site_bucket = self.s3.get_bucket(name)
@@ -63,6 +94,7 @@ class SiteManager(object):
         if not metafile:
             log.info("Creating metadata file in S3 bucket")
             metafile = site_bucket.new_key(static.S3SITE_META_FILE)
+            metafile.set_contents_from_string('')
         else:
             log.info("Loading metadata file from S3 bucket")
         cfid = metafile.metadata.get('cfid')
@@ -97,10 +129,23 @@ class SiteManager(object):
                         log.info("  - CNAME: %s" % cname)
                     dist = cfd.get_distribution()
                     dist.update(cnames=missing_cnames + existing_cnames)
-        return Site(site_bucket, self.s3, self.cf)
+        site = Site(site_bucket, self.s3, self.cf)
+        self.site_registry.add(site.get_registry_entry())
+        self.site_registry.save()
+        return site
 
-    def delete_site(self, name):
+    def delete_site(self, name, stats_json=None):
         site = self.get_site(name)
+        site.start_stats('delete')
+        try:
+            self._delete_site(site)
+        finally:
+            site.stop_stats(stats_json=stats_json)
+        self.site_registry.remove(name)
+        self.site_registry.save()
+
+    def _delete_site(self, site):
+        self.s3.stats.start_phase('cloudfront')
         cfdist = site.cfdist
         if cfdist:
             log.info("Deleting CloudFront distribution: %s" % cfdist.id,
@@ -118,6 +163,11 @@ class SiteManager(object):
         self.s3.delete_bucket(site.bucket)
 
     def get_all_sites(self):
+        """
+        Returns a Site for every bucket in the account that contains s3site's
+        metadata file. The buckets are checked concurrently. Buckets that
+        can't be checked (e.g. due to permissions) are skipped.
+        """
         buckets = self.s3.get_buckets()
         sites = []
         if len(buckets) == 0:
@@ -125,55 +175,154 @@ class SiteManager(object):
         log.info('Scanning for s3site buckets...')
         pbar = self.progress_bar.reset()
         pbar.maxval = len(buckets)
-        for i, bucket in enumerate(buckets):
-            pbar.update(i)
-            if bucket.get_key(static.S3SITE_META_FILE):
-                site = Site(bucket, self.s3, self.cf)
-                sites.append(site)
+        found = set()
+        skipped = []
+        checked = self.s3.iter_buckets_with_key(buckets,
+                                                static.S3SITE_META_FILE)
+        for i, (bucket, is_site, error) in enumerate(checked):
+            pbar.update(i + 1)
+            if error:
+                log.debug("unable to check bucket %s: %s" %
+                          (bucket.name, error))
+                skipped.append(bucket.name)
+            elif is_site:
+                found.add(bucket.name)
         pbar.finish()
+        if skipped:
+            log.warn("Skipped %d bucket(s) that could not be checked: %s" %
+                     (len(skipped), ', '.join(sorted(skipped))))
+        sites = [Site(b, self.s3, self.cf) for b in buckets
+                 if b.name in found]
         log.info('%d site(s) found\n' % len(sites))
         return sites
 
-    def list_all_sites(self, sites=None):
+    def get_registered_sites(self, refresh=False):
+        """
+        Returns the details of every site in the account (see
+        registry.SiteRegistry.sites) from the site registry, scanning the
+        account for sites and updating the registry first if refresh is True
+        or the registry is out of date
+        """
+        if not refresh and self.site_registry.is_fresh:
+            log.info("Using cached list of sites (use --refresh to rescan)")
+            return self.site_registry.get_sites()
+        entries = self.get_registry_entries(self.get_all_sites())
+        self.site_registry.replace(entries)
+        self.site_registry.save()
+        return self.site_registry.get_sites()
+
+    def get_registry_entries(self, sites):
+        """
+        Returns the site registry entries of sites (see get_registry_entry)
+        in the same order, skipping sites whose details could not be
+        fetched. The details of all sites are fetched concurrently and the
+        CloudFront distributions are listed at most once.
+        """
+        details = {}
+        skipped = []
+        buckets = [site.bucket for site in sites]
+        for bucket, site_details, error in \
+                self.s3.iter_website_details(buckets):
+            if error:
+                log.debug("unable to fetch details of site %s: %s" %
+                          (bucket.name, error))
+                skipped.append(bucket.name)
+            else:
+                details[bucket.name] = site_details
+        if skipped:
+            log.warn("Skipped %d site(s) whose details could not be "
+                     "fetched: %s" % (len(skipped),
+                                      ', '.join(sorted(skipped))))
+        dists = None
+        entries = []
+        for site in sites:
+            if site.name not in details:
+                continue
+            webconfig, endpoint, metadata = details[site.name]
+            dist = None
+            cfid = metadata.get('cfid')
+            if cfid:
+                if dists is None:
+                    dists = dict([(d.id, d)
+                                  for d in self.cf.get_all_distributions()])
+                dist = dists.get(cfid)
+                if not dist:
+                    log.warn("CloudFront distribution %s of site %s does "
+                             "not exist" % (cfid, site.name))
+            entries.append(get_registry_entry(site.name, webconfig, endpoint,
+                                              dist))
+        return entries
+
+    def get_site_names(self, refresh=False):
+        return [s['name'] for s in self.get_registered_sites(refresh=refresh)]
+
+    def list_all_sites(self, sites=None, refresh=False):
         if sites:
-            sites = [self.get_site(s) for s in sites]
+            entries = {}
+            if not refresh and self.site_registry.is_fresh:
+                for name in sites:
+                    if name in self.site_registry.sites:
+                        entries[name] = self.site_registry.sites[name]
+            missing = [self.get_site(name) for name in sites
+                       if name not in entries]
+            for entry in self.get_registry_entries(missing):
+                self.site_registry.add(entry)
+                entries[entry['name']] = entry
+            if missing:
+                self.site_registry.save()
+            entries = [entries[name] for name in sites if name in entries]
         else:
-            sites = self.get_all_sites()
+            entries = self.get_registered_sites(refresh=refresh)
         header = '*' * 60
-        if not sites:
+        if not entries:
             log.info("No sites found.")
-        for site in sites:
-            webcfg = site.webconfig.get("WebsiteConfiguration")
-            s3_web_url = site.bucket.get_website_endpoint()
-            index_file = webcfg.get("IndexDocument", {}).get("Suffix", 'N/A')
-            error_file = webcfg.get("ErrorDocument", {}).get("Key", 'N/A')
-            cfdist = site.cfdist
+        for entry in entries:
             print header
-            print site.name
+            print entry['name']
             print header
-            print 'S3 Website URL: %s' % s3_web_url
-            print 'Index file: %s' % index_file
-            print 'Error file: %s' % error_file
-            if cfdist:
-                cfdist = cfdist.get_distribution()
+            print 'S3 Website URL: %s' % entry['website_endpoint']
+            print 'Index file: %s' % (entry['index_doc'] or 'N/A')
+            print 'Error file: %s' % (entry['error_doc'] or 'N/A')
+            if entry.get('cf_id'):
                 print 'CloudFront Distribution:'
-                print '   - Id: %s' % cfdist.id
-                print '   - Domain: %s' % cfdist.domain_name
-                print '   - Enabled: %s' % cfdist.config.enabled
-                for cname in cfdist.config.cnames:
+                print '   - Id: %s' % entry['cf_id']
+                print '   - Domain: %s' % entry['cf_domain']
+                print '   - Enabled: %s' % entry['cf_enabled']
+                for cname in entry['cf_cnames']:
                     print '   - CNAME: %s' % cname
             print
 
     def sync(self, site_name, root_dir, files_filter=None, pre_upload_cb=None,
-             cf_files_filter=None, pretend=False):
+             cf_files_filter=None, pretend=False, num_threads=None,
+             exclude=None, full_scan=False, delete=False, gzip=None,
+             wait=False, watch=False, poll=False, stats_json=None):
         site = self.get_site(site_name)
         return site.sync(root_dir, files_filter=files_filter,
                          pre_upload_cb=pre_upload_cb,
-                         cf_files_filter=cf_files_filter, pretend=pretend)
+                         cf_files_filter=cf_files_filter, pretend=pretend,
+                         num_threads=num_threads, exclude=exclude,
+                         full_scan=full_scan, delete=delete, gzip=gzip,
+                         wait=wait, watch=watch, poll=poll,
+                         stats_json=stats_json)
+
+    def list_invalidations(self, site_name, wait=False):
+        site = self.get_site(site_name)
+        history = site.update_invalidations(wait=wait)
+        if not history.records:
+            log.info("No invalidations found for site: %s" % site_name)
+            return
+        for r in reversed(history.records):
+            created = time.strftime('%Y-%m-%d %H:%M:%S',
+                                    time.localtime(r['created']))
+            num_paths = r.get('num_paths')
+            if num_paths is None:
+                num_paths = '?'
+            print '%s  %s  %s  %s path(s)  %s' % (
+                created, r['dist_id'], r['id'], num_paths, r['status'])
 
-    def clone_site(self, site_name, output_dir=None):
+    def clone_site(self, site_name, output_dir=None, stats_json=None):
         site = self.get_site(site_name)
-        return site.clone(output_dir=output_dir)
+        return site.clone(output_dir=output_dir, stats_json=stats_json)
 
 
 class Site(object):
@@ -209,20 +358,220 @@ class Site(object):
     def name(self):
         return self.bucket.name
 
+    def get_registry_entry(self):
+        """
+        Returns the details of this site kept in the site registry (see
+        registry.SiteRegistry.sites)
+        """
+        return get_registry_entry(self.name, self.webconfig,
+                                  self.bucket.get_website_endpoint(),
+                                  self.cfdist)
+
+    def start_stats(self, operation):
+        """
+        Start collecting per-phase statistics for operation (e.g. 'sync')
+        """
+        op_stats = self.s3.start_stats(operation, self.name)
+        self.cf.start_stats(operation, self.name, op_stats=op_stats)
+        return op_stats
+
+    def stop_stats(self, stats_json=None):
+        """
+        Stop collecting statistics, log a summary and save the statistics as
+        JSON in static.S3SITE_STATS_DIR and, if specified, stats_json
+        """
+        op_stats = self.s3.stop_stats()
+        self.cf.stop_stats()
+        log.info("Statistics for %s of '%s':\n%s" %
+                 (op_stats.operation, self.name,
+                  '\n'.join(op_stats.format_summary())))
+        try:
+            log.debug("Saved statistics to %s" % op_stats.save())
+            if stats_json:
+                op_stats.save(stats_json)
+                log.info("Saved statistics to %s" % stats_json)
+        except (IOError, OSError), e:
+            log.error("Unable to save statistics: %s" % e)
+        return op_stats
+
     def sync(self, rootdir, files_filter=None, pre_upload_cb=None,
-             cf_files_filter=None, pretend=False):
+             cf_files_filter=None, pretend=False, num_threads=None,
+             exclude=None, full_scan=False, delete=False, gzip=None,
+             wait=False, watch=False, poll=False, stats_json=None):
+        """
+        Sync rootdir with the site. If wait is True also wait for the
+        resulting CloudFront invalidations to complete. If watch is True
+        keep running after the sync and sync the files under rootdir as soon
+        as they change (see watch). Statistics about the sync are logged and
+        saved (see stop_stats).
+        """
+        if watch:
+            if pretend:
+                raise exception.BaseException(
+                    "watch mode can not be used when pretending")
+            return self.watch(rootdir, files_filter=files_filter,
+                              pre_upload_cb=pre_upload_cb,
+                              cf_files_filter=cf_files_filter,
+                              num_threads=num_threads, exclude=exclude,
+                              full_scan=full_scan, delete=delete, gzip=gzip,
+                              wait=wait, poll=poll, stats_json=stats_json)
         log.info("Syncing '%s' with '%s'" % (self.name, rootdir))
-        files_map = self.s3.sync_bucket(rootdir, self.bucket,
-                                        cf_dist_id=self.metadata.get('cfid'),
-                                        files_filter=files_filter,
-                                        pre_upload_cb=pre_upload_cb,
-                                        cf_files_filter=cf_files_filter,
-                                        pretend=pretend)
-        log.info("Successfully synced site: %s" % self.name)
+        cfid = self.metadata.get('cfid')
+        op_stats = self.start_stats('sync')
+        try:
+            files_map = self.s3.sync_bucket(rootdir, self.bucket,
+                                            cf_dist_id=cfid,
+                                            files_filter=files_filter,
+                                            pre_upload_cb=pre_upload_cb,
+                                            cf_files_filter=cf_files_filter,
+                                            pretend=pretend,
+                                            num_threads=num_threads,
+                                            exclude=exclude,
+                                            full_scan=full_scan,
+                                            delete=delete, gzip=gzip)
+            self._record_invalidations(cfid, files_map)
+            if files_map.failed:
+                raise exception.SyncFailed(self.name, files_map.failed)
+            log.info("Uploaded %d file(s), deleted %d file(s), skipped "
+                     "invalidating %d new path(s)" %
+                     (len(files_map), len(files_map.deleted),
+                      len(files_map.not_invalidated)))
+            log.info("Successfully synced site: %s" % self.name)
+            if wait and files_map.invalidations:
+                op_stats.start_phase('wait')
+                self.update_invalidations(ids=files_map.invalidations,
+                                          wait=True)
+        finally:
+            self.stop_stats(stats_json=stats_json)
         return files_map
 
-    def clone(self, output_dir=None):
+    def _record_invalidations(self, cfid, files_map):
+        if not files_map.invalidations:
+            return
+        history = invalidation.InvalidationHistory(self.name)
+        for inval_id, num_paths in files_map.invalidations.items():
+            history.add(cfid, inval_id, num_paths=num_paths)
+        history.save()
+
+    def _get_local_paths(self, rootdir, failed):
+        """
+        Returns the local paths of the files in failed (see SyncResult), which
+        contains local paths for failed uploads and S3 paths for failed
+        deletes
+        """
+        paths = set()
+        for f in failed:
+            if not os.path.isabs(f):
+                f = os.path.join(rootdir, *f.split('/'))
+            paths.add(f)
+        return paths
+
+    def watch(self, rootdir, files_filter=None, pre_upload_cb=None,
+              cf_files_filter=None, num_threads=None, exclude=None,
+              full_scan=False, delete=False, gzip=None, wait=False,
+              poll=False, debounce=1.0, stats_json=None):
+        """
+        Sync rootdir with the site and then keep syncing the files under
+        rootdir whenever they change until interrupted (Ctrl-C). Changes are
+        detected using inotify on Linux or by polling rootdir otherwise (or
+        if poll is True) and are synced in batches once rootdir has been
+        quiet for debounce seconds. The state of the site's bucket is kept in
+        memory between syncs so only the changed files are compared and
+        uploaded. Files that fail to sync are retried with the next batch.
+        """
+        rootdir = os.path.abspath(os.path.expanduser(rootdir))
+        # start watching before the initial sync so no changes are missed
+        w = watcher.get_watcher(rootdir, exclude=exclude, poll=poll)
+        retry = set()
+        try:
+            try:
+                self.sync(rootdir, files_filter=files_filter,
+                          pre_upload_cb=pre_upload_cb,
+                          cf_files_filter=cf_files_filter,
+                          num_threads=num_threads, exclude=exclude,
+                          full_scan=full_scan, delete=delete, gzip=gzip,
+                          wait=wait, stats_json=stats_json)
+            except exception.SyncFailed, e:
+                log.error(e.msg)
+                retry = self._get_local_paths(rootdir, e.failed)
+            cfid = self.metadata.get('cfid')
+            remote = self.s3.get_remote_files(self.bucket)
+            while True:
+                log.info("Watching '%s' for changes (press Ctrl-C to stop)" %
+                         rootdir)
+                paths = w.wait_for_changes(debounce=debounce)
+                if paths is None:
+                    log.info("Rescanning '%s'" % rootdir)
+                    files_map = self.s3.sync_bucket(
+                        rootdir, self.bucket, cf_dist_id=cfid,
+                        files_filter=files_filter,
+                        pre_upload_cb=pre_upload_cb,
+                        cf_files_filter=cf_files_filter,
+                        num_threads=num_threads, exclude=exclude,
+                        delete=delete, gzip=gzip)
+                    remote = self.s3.get_remote_files(self.bucket)
+                else:
+                    log.info("Syncing %d changed path(s)" % len(paths))
+                    files_map = self.s3.sync_files(
+                        rootdir, self.bucket, paths | retry, remote,
+                        cf_dist_id=cfid, files_filter=files_filter,
+                        pre_upload_cb=pre_upload_cb,
+                        cf_files_filter=cf_files_filter,
+                        num_threads=num_threads, exclude=exclude,
+                        delete=delete, gzip=gzip)
+                self._record_invalidations(cfid, files_map)
+                retry = self._get_local_paths(rootdir, files_map.failed)
+                if files_map.failed:
+                    log.error(exception.SyncFailed(self.name,
+                                                   files_map.failed).msg)
+                    log.warn("Retrying %d file(s) on the next change" %
+                             len(retry))
+                log.info("Uploaded %d file(s), deleted %d file(s)" %
+                         (len(files_map), len(files_map.deleted)))
+                if wait and files_map.invalidations:
+                    self.update_invalidations(ids=files_map.invalidations,
+                                              wait=True)
+        except KeyboardInterrupt:
+            log.info("Stopped watching '%s'" % rootdir)
+        finally:
+            w.close()
+
+    def update_invalidations(self, ids=None, wait=False):
+        """
+        Refresh the status of the site's pending CloudFront invalidations
+        (or only those in ids) and return the site's InvalidationHistory. If
+        wait is True poll until the invalidations have completed.
+        """
+        history = invalidation.InvalidationHistory(self.name)
+        pending = history.get_pending()
+        if ids is not None:
+            pending = [r for r in pending if r['id'] in ids]
+        by_dist = {}
+        for r in pending:
+            by_dist.setdefault(r['dist_id'], []).append(r['id'])
+        for dist_id, inval_ids in by_dist.items():
+            if wait:
+                statuses = self.cf.wait_for_invalidations(dist_id, inval_ids)
+            else:
+                statuses = {}
+                for inval_id in inval_ids:
+                    try:
+                        statuses[inval_id] = self.cf.get_invalidation_status(
+                            dist_id, inval_id)
+                    except Exception, e:
+                        log.warn("Unable to get status of invalidation %s: "
+                                 "%s" % (inval_id, e))
+            history.update(statuses)
+        if pending:
+            history.save()
+        return history
+
+    def clone(self, output_dir=None, stats_json=None):
         odir = output_dir or os.getcwd()
         log.info("Cloning site '%s' to '%s'" % (self.name, odir))
-        self.s3.download_bucket(self.bucket, odir)
-        log.info("Successfully cloned site '%s'" % self.name)
+        self.start_stats('clone')
+        try:
+            self.s3.download_bucket(self.bucket, odir)
+            log.info("Successfully cloned site '%s'" % self.name)
+        finally:
+            self.stop_stats(stats_json=stats_json)
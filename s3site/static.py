@@ -11,7 +11,15 @@ PID = os.getpid()
 S3SITE_CFG_DIR = os.path.join(os.path.expanduser('~'), '.s3site')
 S3SITE_CFG_FILE = os.path.join(S3SITE_CFG_DIR, 'config')
 S3SITE_LOG_DIR = os.path.join(S3SITE_CFG_DIR, 'logs')
+S3SITE_CACHE_DIR = os.path.join(S3SITE_CFG_DIR, 'cache')
+S3SITE_HASH_CACHE_DIR = os.path.join(S3SITE_CACHE_DIR, 'hashes')
+S3SITE_GZIP_CACHE_DIR = os.path.join(S3SITE_CACHE_DIR, 'gzip')
+S3SITE_REGISTRY_DIR = os.path.join(S3SITE_CACHE_DIR, 'sites')
+S3SITE_INVALIDATIONS_DIR = os.path.join(S3SITE_CFG_DIR, 'invalidations')
+S3SITE_JOURNAL_DIR = os.path.join(S3SITE_CFG_DIR, 'journals')
+S3SITE_STATS_DIR = os.path.join(S3SITE_LOG_DIR, 'stats')
 S3SITE_META_FILE = '__s3site.cfg'
+S3SITE_MANIFEST_FILE = '__s3site.manifest'
 DEBUG_FILE = os.path.join(S3SITE_LOG_DIR, 'debug.log')
 AWS_DEBUG_FILE = os.path.join(S3SITE_LOG_DIR, 'aws-debug.log')
 CRASH_FILE = os.path.join(S3SITE_LOG_DIR, 'crash-report-%d.txt' % PID)
@@ -21,6 +29,7 @@ GLOBAL_SETTINGS = {
     'enable_experimental': (bool, False, False, None, None),
     'web_browser': (str, False, None, None, None),
     'include': (list, False, [], None, None),
+    'site_cache_ttl': (int, False, 3600, None, None),
 }
 
 AWS_SETTINGS = {
@@ -34,10 +43,26 @@ AWS_SETTINGS = {
     'aws_region_name': (str, False, None, None, None),
     'aws_region_host': (str, False, None, None, None),
     'aws_s3_host': (str, False, None, None, None),
+    'aws_cf_host': (str, False, None, None, None),
     'aws_proxy': (str, False, None, None, None),
     'aws_proxy_port': (int, False, None, None, None),
     'aws_proxy_user': (str, False, None, None, None),
     'aws_proxy_pass': (str, False, None, None, None),
+    'aws_upload_threads': (int, False, 10, None, None),
+    'aws_multipart_threshold': (int, False, 64, None, None),
+    'aws_multipart_chunk_size': (int, False, 16, None, None),
+    'aws_manifest_verify_interval': (int, False, 10, None, None),
+    'aws_gzip': (bool, False, False, None, None),
+    'aws_gzip_types': (list, False, None, None, None),
+    'aws_gzip_min_savings': (int, False, 10, None, None),
+    'aws_gzip_cache_size': (int, False, 256, None, None),
+    'aws_cf_max_invalidation_paths': (int, False, 1000, None, None),
+    'aws_cf_max_overinvalidation': (int, False, 50, None, None),
+    'aws_max_requests_per_sec': (float, False, None, None, None),
+    'aws_max_kb_per_sec': (int, False, None, None, None),
+    'aws_max_retries': (int, False, 5, None, None),
+    'aws_list_shards': (int, False, 8, None, None),
+    'aws_max_connections': (int, False, None, None, None),
 }
 
 
@@ -63,3 +88,4 @@ def __makedirs(path, exit_on_failure=False):
 def create_config_dirs():
     __makedirs(S3SITE_CFG_DIR, exit_on_failure=True)
     __makedirs(S3SITE_LOG_DIR)
+    __makedirs(S3SITE_CACHE_DIR)
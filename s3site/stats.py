@@ -0,0 +1,353 @@
+"""
+Per-phase statistics for sync, clone and delete operations
+
+OperationStats records the wall time spent in each phase of an operation
+(listing the bucket, walking the local tree, hashing, uploading, etc.) along
+with the number of items processed, the requests made to AWS, retries and
+bytes transferred in each phase.
+
+Phases can be nested: the time spent in a nested phase is not counted in the
+enclosing phase so that the phase times of an operation add up to its total
+wall time. This makes it possible to separate interleaved work, such as
+walking the local tree and listing the bucket while comparing them, using
+time_iter and time_call.
+
+Work handed to other threads is recorded in the phase that was current when
+it was handed over (see bind) rather than in whatever phase the main thread
+has moved on to by the time the work is done.
+"""
+import os
+import json
+import time
+import threading
+
+from s3site import utils
+from s3site import static
+
+
+class Phase(object):
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.items = 0
+        self.requests = {}
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+
+    def __repr__(self):
+        return '<Phase: %s (%.2fs)>' % (self.name, self.seconds)
+
+    @property
+    def num_requests(self):
+        return sum(self.requests.values())
+
+    def to_dict(self):
+        return dict(name=self.name, seconds=round(self.seconds, 6),
+                    items=self.items, requests=dict(self.requests),
+                    num_requests=self.num_requests, errors=self.errors,
+                    retries=self.retries, bytes=self.bytes)
+
+
+class OperationStats(object):
+    """
+    Collects per-phase statistics for an operation (e.g. 'sync') on a site
+
+    stats = OperationStats('sync', 'mysite')
+    stats.start_phase('upload')
+    stats.add_request('PUT', 200, 0.1)
+    stats.finish()
+    stats.save()
+
+    Only the MaxSavedStats most recent files are kept in
+    static.S3SITE_STATS_DIR.
+    """
+    MaxSavedStats = 100
+
+    def __init__(self, operation, site_name=None):
+        self.operation = operation
+        self.site_name = site_name
+        self.started = time.time()
+        self.finished = None
+        self.phases = {}
+        self._order = []
+        # [phase name, start time, time spent in nested phases]
+        self._stack = []
+        self._lock = threading.RLock()
+        # phase of the work being done by the current thread (see bind)
+        self._local = threading.local()
+
+    def __repr__(self):
+        return '<OperationStats: %s %s>' % (self.operation, self.site_name)
+
+    @property
+    def seconds(self):
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def current_phase(self):
+        self._lock.acquire()
+        try:
+            bound = getattr(self._local, 'phase', None)
+            if bound:
+                return self.get_phase(bound)
+            if self._stack:
+                return self.get_phase(self._stack[-1][0])
+            return self.get_phase('other')
+        finally:
+            self._lock.release()
+
+    def get_phase(self, name):
+        self._lock.acquire()
+        try:
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = self.phases[name] = Phase(name)
+                self._order.append(name)
+            return phase
+        finally:
+            self._lock.release()
+
+    def push(self, name):
+        """
+        Start the nested phase name
+        """
+        self._lock.acquire()
+        try:
+            self.get_phase(name)
+            self._stack.append([name, time.time(), 0.0])
+        finally:
+            self._lock.release()
+
+    def pop(self):
+        """
+        End the innermost phase
+        """
+        self._lock.acquire()
+        try:
+            name, started, nested = self._stack.pop()
+            elapsed = time.time() - started
+            self.phases[name].seconds += elapsed - nested
+            if self._stack:
+                self._stack[-1][2] += elapsed
+        finally:
+            self._lock.release()
+
+    def start_phase(self, name):
+        """
+        End all current phases and start phase name
+        """
+        self.end_phase()
+        self.push(name)
+
+    def end_phase(self):
+        while self._stack:
+            self.pop()
+
+    def time_iter(self, name, iterable):
+        """
+        Yields the items in iterable counting the time spent producing each
+        item in phase name
+        """
+        iterator = iter(iterable)
+        while True:
+            self.push(name)
+            try:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            finally:
+                self.pop()
+            self.add_items(1, phase=name)
+            yield item
+
+    def time_call(self, name, func, *args, **kwargs):
+        """
+        Call func(*args, **kwargs) counting its time in phase name
+        """
+        self.push(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.pop()
+            self.add_items(1, phase=name)
+
+    def bind(self, func):
+        """
+        Returns a function that calls func recording the requests, retries,
+        items and bytes of the calling thread in the current phase, e.g.
+        for jobs run by ThreadPool workers
+        """
+        name = self.current_phase.name
+
+        def bound(*args, **kwargs):
+            previous = getattr(self._local, 'phase', None)
+            self._local.phase = name
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.phase = previous
+        return bound
+
+    def _get_phase(self, phase=None):
+        if phase is None:
+            return self.current_phase
+        return self.get_phase(phase)
+
+    def add_items(self, n, phase=None):
+        self._lock.acquire()
+        try:
+            self._get_phase(phase).items += n
+        finally:
+            self._lock.release()
+
+    def add_bytes(self, n, phase=None):
+        self._lock.acquire()
+        try:
+            self._get_phase(phase).bytes += n
+        finally:
+            self._lock.release()
+
+    def add_retry(self, phase=None):
+        self._lock.acquire()
+        try:
+            self._get_phase(phase).retries += 1
+        finally:
+            self._lock.release()
+
+    def add_request(self, method, status, elapsed):
+        """
+        Record a request made in the current phase. status is None if no
+        response was received.
+        """
+        self._lock.acquire()
+        try:
+            phase = self.current_phase
+            phase.requests[method] = phase.requests.get(method, 0) + 1
+            if status is None or status >= 400:
+                phase.errors += 1
+        finally:
+            self._lock.release()
+
+    def finish(self):
+        self.end_phase()
+        if self.finished is None:
+            self.finished = time.time()
+
+    def to_dict(self):
+        self._lock.acquire()
+        try:
+            phases = [self.phases[name].to_dict() for name in self._order]
+        finally:
+            self._lock.release()
+        return dict(operation=self.operation, site=self.site_name,
+                    started=self.started, finished=self.finished,
+                    seconds=round(self.seconds, 6), phases=phases)
+
+    def format_summary(self):
+        """
+        Returns a list of lines summarizing the time, requests, retries and
+        bytes of each phase
+        """
+        fmt = '%-12s %9s %7s %9s %8s %8s'
+        lines = [fmt % ('phase', 'time', 'items', 'requests', 'retries',
+                        'bytes')]
+        phases = [self.phases[name] for name in self._order]
+        for p in phases:
+            lines.append(fmt % (p.name, '%.2fs' % p.seconds, p.items,
+                                p.num_requests, p.retries,
+                                utils.format_size(p.bytes)))
+        requests = sum([phase.num_requests for phase in phases])
+        retries = sum([phase.retries for phase in phases])
+        nbytes = sum([phase.bytes for phase in phases])
+        lines.append(fmt % ('total', '%.2fs' % self.seconds, '', requests,
+                            retries, utils.format_size(nbytes)))
+        return lines
+
+    def get_default_path(self):
+        timestamp = time.strftime('%Y%m%d-%H%M%S',
+                                  time.localtime(self.started))
+        filename = '%s-%s-%s.json' % (self.operation, self.site_name,
+                                      timestamp)
+        return os.path.join(static.S3SITE_STATS_DIR, filename)
+
+    def save(self, path=None):
+        """
+        Write the stats as JSON to path (default: a new file in
+        static.S3SITE_STATS_DIR) and return the path
+        """
+        prune = path is None
+        path = path or self.get_default_path()
+        dirname = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        f = open(path, 'w')
+        try:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+            f.write('\n')
+        finally:
+            f.close()
+        if prune:
+            self.prune(dirname)
+        return path
+
+    def prune(self, stats_dir):
+        """
+        Remove all but the MaxSavedStats most recently saved stats files in
+        stats_dir
+        """
+        files = []
+        for entry in utils.iter_dir(stats_dir):
+            if entry.name.endswith('.json') and entry.is_file():
+                files.append((entry.stat().st_mtime, entry.path))
+        files.sort()
+        for mtime, path in files[:-self.MaxSavedStats]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class NullStats(object):
+    """
+    Stand-in for OperationStats used when no statistics are being collected
+    """
+    def __nonzero__(self):
+        return False
+
+    def start_phase(self, name):
+        pass
+
+    def end_phase(self):
+        pass
+
+    def push(self, name):
+        pass
+
+    def pop(self):
+        pass
+
+    def time_iter(self, name, iterable):
+        return iterable
+
+    def time_call(self, name, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    def bind(self, func):
+        return func
+
+    def add_items(self, n, phase=None):
+        pass
+
+    def add_bytes(self, n, phase=None):
+        pass
+
+    def add_retry(self, phase=None):
+        pass
+
+    def add_request(self, method, status, elapsed):
+        pass
+
+    def finish(self):
+        pass
@@ -9,6 +9,9 @@ config_template = """\
 #WEB_BROWSER=chromium
 # split the config into multiple files
 #INCLUDE=~/.s3site/aws, ~/.s3site/sites
+# how long (in seconds) the list of sites found in your account is cached
+# for the list command and site name completion (0 disables the cache)
+#SITE_CACHE_TTL = 3600
 
 #############################################
 ## AWS Credentials and Connection Settings ##
@@ -29,11 +32,54 @@ AWS_USER_ID= #your userid
 # Uncomment these settings when creating an instance-store (S3) AMI (OPTIONAL)
 #EC2_CERT = /path/to/your/cert-asdf0as9df092039asdfi02089.pem
 #EC2_PRIVATE_KEY = /path/to/your/pk-asdfasd890f200909.pem
+# Uncomment to connect to a different S3 or CloudFront endpoint, e.g. a
+# local stand-in used for testing (set AWS_IS_SECURE = False for plain HTTP)
+#AWS_S3_HOST = localhost
+#AWS_CF_HOST = localhost
+#AWS_PORT = 8000
+#AWS_IS_SECURE = False
 # Uncomment these settings to use a proxy host when connecting to AWS
 #AWS_PROXY = your.proxyhost.com
 #AWS_PROXY_PORT = 8080
 #AWS_PROXY_USER = yourproxyuser
 #AWS_PROXY_PASS = yourproxypass
+# Uncomment to change the number of concurrent uploads used by sync
+#AWS_UPLOAD_THREADS = 10
+# Uncomment to change the file size (in MB) above which files are uploaded
+# as multipart uploads and the size (in MB, minimum 5) of each part
+#AWS_MULTIPART_THRESHOLD = 64
+#AWS_MULTIPART_CHUNK_SIZE = 16
+# Uncomment to change how many syncs may use the bucket's sync manifest
+# before the bucket is listed in full to verify it (0 = always list)
+#AWS_MANIFEST_VERIFY_INTERVAL = 10
+# Uncomment to gzip-compress text assets when syncing (same as sync --gzip),
+# to change the content types that are compressed, to change the minimum
+# savings (in percent) required to upload the compressed version of a file
+# and to change the size (in MB) of the local cache of compressed files
+#AWS_GZIP = True
+#AWS_GZIP_TYPES = text/*, application/javascript, application/json
+#AWS_GZIP_MIN_SAVINGS = 10
+#AWS_GZIP_CACHE_SIZE = 256
+# Uncomment to change how CloudFront invalidations are planned: directories
+# in which at most AWS_CF_MAX_OVERINVALIDATION percent of the files are
+# unchanged are invalidated with a single '/dir/*' wildcard and more
+# directories are collapsed if a sync would invalidate more than
+# AWS_CF_MAX_INVALIDATION_PATHS paths
+#AWS_CF_MAX_INVALIDATION_PATHS = 1000
+#AWS_CF_MAX_OVERINVALIDATION = 50
+# Uncomment to limit the number of requests per second and the bandwidth (in
+# KB/s) used when uploading, copying and deleting files and to change how
+# many times throttled (503 SlowDown) or failed requests are retried
+#AWS_MAX_REQUESTS_PER_SEC = 100
+#AWS_MAX_KB_PER_SEC = 1024
+#AWS_MAX_RETRIES = 5
+# Uncomment to change how many of the bucket's top-level directories are
+# listed concurrently when listing a bucket
+#AWS_LIST_SHARDS = 8
+# Uncomment to change how many idle connections to S3 are kept open for
+# reuse by worker threads (defaults to the larger of AWS_UPLOAD_THREADS and
+# AWS_LIST_SHARDS)
+#AWS_MAX_CONNECTIONS = 10
 """
 
 DASHES = '-' * 10
@@ -0,0 +1,514 @@
+"""
+Benchmarks for s3site
+
+Usage: python -m s3site.tests.benchmarks [benchmark ...]
+
+The sync and scenarios benchmarks run against a local fakes3.FakeS3Server
+and don't need AWS credentials or network access. The scenarios benchmark
+exits with an error if any of the scenarios fail.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import signal
+import tempfile
+import traceback
+
+import boto.s3.key
+import boto.s3.user
+
+from s3site import utils
+from s3site import static
+from s3site import awsutils
+from s3site import remoteindex
+from s3site.tests import fakes3
+
+MB = 1024 * 1024
+
+
+def make_deep_tree(root, depth=8, fanout=2, files_per_dir=5):
+    """
+    Create a synthetic site tree with fanout subdirectories per directory
+    down to depth levels and files_per_dir small files in every directory.
+    Returns the number of files created.
+    """
+    nfiles = 0
+    for i in range(files_per_dir):
+        f = open(os.path.join(root, 'file%d.html' % i), 'w')
+        f.write('<html>%s</html>' % root)
+        f.close()
+        nfiles += 1
+    if depth > 0:
+        for i in range(fanout):
+            subdir = os.path.join(root, 'dir%d' % i)
+            os.mkdir(subdir)
+            nfiles += make_deep_tree(subdir, depth - 1, fanout, files_per_dir)
+    return nfiles
+
+
+def make_tiny_tree(root, nfiles=5000, size=128, files_per_dir=500):
+    """
+    Create a synthetic site tree with nfiles tiny files of size bytes spread
+    over directories of files_per_dir files. Returns the number of files
+    created.
+    """
+    for i in range(nfiles):
+        subdir = os.path.join(root, 'dir%d' % (i / files_per_dir))
+        if not os.path.isdir(subdir):
+            os.mkdir(subdir)
+        f = open(os.path.join(subdir, 'file%d.css' % i), 'w')
+        f.write(('/* %d */' % i).ljust(size))
+        f.close()
+    return nfiles
+
+
+def make_huge_tree(root, nfiles=2, size=80 * MB):
+    """
+    Create a synthetic site tree with nfiles huge files of size bytes (large
+    enough to be uploaded as multipart uploads by default). Returns the
+    number of files created.
+    """
+    for i in range(nfiles):
+        f = open(os.path.join(root, 'video%d.mp4' % i), 'wb')
+        for j in range(size / MB):
+            f.write(os.urandom(MB))
+        f.write(os.urandom(size % MB))
+        f.close()
+    return nfiles
+
+
+def get_tree_size(root):
+    return sum([e.stat().st_size for e in utils.walk_files(root)])
+
+
+def find_files_recursive(path):
+    """
+    The original utils.find_files implementation which both iterates over
+    os.walk and recurses into each subdirectory, kept for comparison
+    """
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            yield os.path.join(root, f)
+        for d in dirs:
+            for f in find_files_recursive(os.path.join(root, d)):
+                yield f
+
+
+def timed(func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - start, result
+
+
+def bench_walk(depth=8, fanout=2, files_per_dir=5):
+    """
+    Compare the original recursive find_files with utils.walk_files on a
+    deep synthetic tree
+    """
+    root = tempfile.mkdtemp(prefix='s3site-bench-')
+    try:
+        nfiles = make_deep_tree(root, depth, fanout, files_per_dir)
+        print 'walk: depth=%d fanout=%d files=%d scandir=%s' % \
+            (depth, fanout, nfiles, utils.scandir is not None)
+        walkers = [
+            ('find_files (original)',
+             lambda: list(find_files_recursive(root))),
+            ('walk_files',
+             lambda: [e.path for e in utils.walk_files(root)]),
+        ]
+        for name, walker in walkers:
+            secs, paths = timed(walker)
+            print '  %-24s %8d paths %8d unique %8.3fs' % \
+                (name, len(paths), len(set(paths)), secs)
+    finally:
+        shutil.rmtree(root)
+
+
+def make_listing(nobjects, seed=0):
+    """
+    Yields boto Keys like those returned by a bucket listing (sorted by
+    name) for a synthetic site with nobjects objects
+    """
+    rand = random.Random(seed)
+    owner = boto.s3.user.User()
+    owner.id = '%064x' % rand.getrandbits(256)
+    owner.display_name = 'owner'
+    for i in xrange(nobjects):
+        key = boto.s3.key.Key(name='assets/%04d/file-%07d.html' %
+                              (i / 1000, i))
+        key.etag = '"%032x"' % rand.getrandbits(128)
+        key.size = rand.randint(0, 2 ** 20)
+        key.last_modified = '2012-07-01T12:00:00.000Z'
+        key.storage_class = 'STANDARD'
+        key.owner = owner
+        yield key
+
+
+def get_max_rss():
+    """
+    Returns the peak resident set size of the current process in KB
+    """
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss /= 1024
+    return rss
+
+
+def run_in_child(func):
+    """
+    Calls func in a forked child process and returns func's result, which
+    must be JSON serializable, along with the child's peak RSS in KB
+    """
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            try:
+                os.close(rfd)
+                output = json.dumps([func(), get_max_rss()])
+                while output:
+                    output = output[os.write(wfd, output):]
+                status = 0
+            except Exception:
+                traceback.print_exc()
+        finally:
+            os._exit(status)
+    os.close(wfd)
+    chunks = []
+    chunk = os.read(rfd, 65536)
+    while chunk:
+        chunks.append(chunk)
+        chunk = os.read(rfd, 65536)
+    os.close(rfd)
+    pid, status = os.waitpid(pid, 0)
+    if status:
+        raise RuntimeError("benchmark process %d failed" % pid)
+    return json.loads(''.join(chunks))
+
+
+def measure_memory(func):
+    """
+    Calls func in a forked child process and returns the increase in the
+    child's peak RSS (in KB) along with the time func took
+    """
+    def measure():
+        before = get_max_rss()
+        secs, result = timed(func)
+        return get_max_rss() - before, secs
+    (kb, secs), rss = run_in_child(measure)
+    return kb, secs
+
+
+def bench_remote_index(nobjects=200000):
+    """
+    Compare the memory used to hold the remote state of a bucket as a
+    dictionary of boto Keys (the original get_bucket_files_map) with
+    RemoteIndex
+    """
+    if not hasattr(os, 'fork'):
+        print 'remote_index: requires os.fork, skipping'
+        return
+    print 'remote_index: objects=%d' % nobjects
+    structures = [
+        ('dict of Keys (original)',
+         lambda: dict([(k.name, k) for k in make_listing(nobjects)])),
+        ('RemoteIndex',
+         lambda: remoteindex.RemoteIndex(make_listing(nobjects))),
+    ]
+    for name, build in structures:
+        kb, secs = measure_memory(build)
+        print '  %-24s %8.1f MB %6d bytes/object %8.3fs' % \
+            (name, kb / 1024.0, kb * 1024 / nobjects, secs)
+
+
+def start_fake_s3(faults=None):
+    """
+    Start a fakes3.FakeS3Server, injecting faults (fakes3.Faults) if given,
+    in a child process, so that its memory and CPU time don't count towards
+    the benchmarks, with a fake CloudFront distribution. Returns the server's
+    pid and port and the distribution id.
+    """
+    server = fakes3.FakeS3Server(faults=faults)
+    dist_id = server.add_distribution('s3site-bench.s3-website.local')
+    pid = os.fork()
+    if pid == 0:
+        try:
+            server.serve_forever()
+        finally:
+            os._exit(0)
+    server.server_close()
+    return pid, server.port, dist_id
+
+
+def stop_fake_s3(pid):
+    os.kill(pid, signal.SIGTERM)
+    os.waitpid(pid, 0)
+
+
+def get_fake_s3(port, **kwargs):
+    return awsutils.EasyS3('benchmark', 'benchmark', aws_s3_host='127.0.0.1',
+                           aws_cf_host='127.0.0.1', aws_port=port,
+                           aws_is_secure=False, **kwargs)
+
+
+def create_fake_site(port, bucket_name):
+    s3 = get_fake_s3(port)
+    bucket = s3.create_bucket(bucket_name)
+    key = bucket.new_key(static.S3SITE_META_FILE)
+    key.set_contents_from_string('')
+
+
+def run_operation(port, bucket_name, operation, func, **kwargs):
+    """
+    Run func(s3, bucket) in a child process collecting statistics for
+    operation. kwargs are passed to EasyS3. Returns the operation's
+    statistics (OperationStats.to_dict) with the child's peak RSS in KB
+    added as 'max_rss'.
+    """
+    def run():
+        s3 = get_fake_s3(port, **kwargs)
+        bucket = s3.get_bucket(bucket_name)
+        op_stats = s3.start_stats(operation, bucket_name)
+        try:
+            func(s3, bucket)
+        finally:
+            s3.stop_stats()
+        return op_stats.to_dict()
+    op_stats, rss = run_in_child(run)
+    op_stats['max_rss'] = rss
+    return op_stats
+
+
+def format_operation(operation, nfiles, op_stats):
+    phases = op_stats['phases']
+    secs = max(op_stats['seconds'], 1e-6)
+    nbytes = sum([p['bytes'] for p in phases])
+    requests = sum([p['num_requests'] for p in phases])
+    retries = sum([p['retries'] for p in phases])
+    return ('  %-8s %8.3fs %9.1f files/s %8.2f MB/s %7d requests '
+            '%4d retries %8.1f MB peak RSS' %
+            (operation, secs, nfiles / secs, nbytes / float(MB) / secs,
+             requests, retries, op_stats['max_rss'] / 1024.0))
+
+
+SITE_TREES = [('tiny', make_tiny_tree), ('huge', make_huge_tree),
+              ('deep', make_deep_tree)]
+
+
+def bench_sync(trees=None):
+    """
+    Sync synthetic site trees (many tiny files, a few huge files, deep
+    nesting) to a local fake S3 and CloudFront, sync them again unchanged,
+    clone them and delete them reporting files/sec, MB/sec, requests and
+    peak RSS for each operation
+    """
+    if not hasattr(os, 'fork'):
+        print 'sync: requires os.fork, skipping'
+        return
+    pid, port, dist_id = start_fake_s3()
+    try:
+        for name, make_tree in SITE_TREES:
+            if trees and name not in trees:
+                continue
+            root = tempfile.mkdtemp(prefix='s3site-bench-')
+            output_dir = tempfile.mkdtemp(prefix='s3site-bench-')
+            try:
+                nfiles = make_tree(root)
+                print 'sync %s: files=%d size=%s' % \
+                    (name, nfiles, utils.format_size(get_tree_size(root)))
+                bucket_name = 's3site-bench-%s' % name
+                create_fake_site(port, bucket_name)
+
+                def sync(s3, bucket):
+                    s3.sync_bucket(root, bucket, cf_dist_id=dist_id)
+
+                def clone(s3, bucket):
+                    s3.download_bucket(bucket, output_dir)
+                operations = [('sync', sync), ('resync', sync),
+                              ('clone', clone),
+                              ('delete', lambda s3, b: s3.delete_bucket(b))]
+                for operation, func in operations:
+                    op_stats = run_operation(port, bucket_name, operation,
+                                             func)
+                    print format_operation(operation, nfiles, op_stats)
+            finally:
+                shutil.rmtree(root)
+                shutil.rmtree(output_dir)
+    finally:
+        stop_fake_s3(pid)
+
+
+def make_scenario_tree(root):
+    """
+    Create a site tree that exercises every transfer path: small files in
+    nested directories, a multipart upload (with the scenario settings) and
+    identical files that are copied server-side rather than uploaded. Returns
+    the number of files created.
+    """
+    nfiles = make_deep_tree(root, depth=4, fanout=3, files_per_dir=3)
+    make_huge_tree(root, nfiles=1, size=12 * MB)
+    data = os.urandom(128 * 1024)
+    for name in ('logo.png', 'logo-copy.png'):
+        f = open(os.path.join(root, name), 'wb')
+        f.write(data)
+        f.close()
+    return nfiles + 3
+
+
+def change_scenario_tree(root):
+    """
+    Change, add and remove some of the files created by make_scenario_tree
+    """
+    for i in range(3):
+        f = open(os.path.join(root, 'dir0', 'file%d.html' % i), 'a')
+        f.write('<!-- changed -->')
+        f.close()
+    shutil.copy(os.path.join(root, 'logo.png'),
+                os.path.join(root, 'dir1', 'logo.png'))
+    shutil.rmtree(os.path.join(root, 'dir2'))
+
+
+def get_tree_md5s(root):
+    """
+    Returns a dictionary mapping the path of every file under root, relative
+    to root, to its MD5 leaving out s3site's own metadata files
+    """
+    md5s = {}
+    for entry in utils.walk_files(root):
+        path = entry.path[len(root) + 1:]
+        if not path.startswith('__s3site'):
+            md5s[path] = utils.compute_md5(entry.path)
+    return md5s
+
+
+def compare_trees(expected, actual):
+    """
+    Returns a description of the differences between the trees expected and
+    actual or None if their files are identical
+    """
+    expected = get_tree_md5s(expected)
+    actual = get_tree_md5s(actual)
+    missing = [p for p in expected if p not in actual]
+    extra = [p for p in actual if p not in expected]
+    changed = [p for p in expected if p in actual and
+               expected[p] != actual[p]]
+    if missing or extra or changed:
+        return '%d missing, %d extra and %d different file(s)' % \
+            (len(missing), len(extra), len(changed))
+
+
+# settings used by the scenarios so that a small file is uploaded as a
+# multipart upload and retries are given enough attempts to succeed
+SCENARIO_SETTINGS = dict(aws_multipart_threshold=5,
+                         aws_multipart_chunk_size=5, aws_max_retries=10)
+
+
+def run_scenario(port, dist_id, bucket_name):
+    """
+    Sync a site tree, change it and sync it again with delete, clone it and
+    delete the bucket. Returns a list of (operation, stats, error) tuples
+    where error describes what went wrong, if anything.
+    """
+    root = tempfile.mkdtemp(prefix='s3site-scenario-')
+    output_dir = tempfile.mkdtemp(prefix='s3site-scenario-')
+    results = []
+    try:
+        make_scenario_tree(root)
+        create_fake_site(port, bucket_name)
+
+        def sync(s3, bucket):
+            result = s3.sync_bucket(root, bucket, cf_dist_id=dist_id,
+                                    delete=True)
+            if result.failed:
+                raise Exception('%d file(s) failed to sync' %
+                                len(result.failed))
+
+        def clone(s3, bucket):
+            s3.download_bucket(bucket, output_dir)
+
+        def delete(s3, bucket):
+            s3.delete_bucket(bucket)
+            if s3.get_bucket_or_none(bucket.name):
+                raise Exception('bucket still exists')
+        operations = [('sync', sync), ('change', change_scenario_tree),
+                      ('resync', sync), ('clone', clone),
+                      ('delete', delete)]
+        for operation, func in operations:
+            if operation == 'change':
+                func(root)
+                continue
+            error = None
+            try:
+                op_stats = run_operation(port, bucket_name, operation, func,
+                                         **SCENARIO_SETTINGS)
+            except RuntimeError, e:
+                op_stats = None
+                error = str(e)
+            if not error and operation == 'clone':
+                error = compare_trees(root,
+                                      os.path.join(output_dir, bucket_name))
+            results.append((operation, op_stats, error))
+            if error:
+                break
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(output_dir)
+    return results
+
+
+def bench_scenarios(scenarios=None):
+    """
+    Run the sync, clone and delete paths end to end against a local fake S3
+    injecting the faults of each of fakes3.SCENARIOS (latency, bandwidth
+    limits, 503 SlowDown responses, connection resets and truncated
+    listings), checking the results and reporting time, requests and retries
+    """
+    if not hasattr(os, 'fork'):
+        print 'scenarios: requires os.fork, skipping'
+        return
+    failed = []
+    for name, faults in fakes3.SCENARIOS:
+        if scenarios and name not in scenarios:
+            continue
+        print 'scenario %s: %r' % (name, faults)
+        pid, port, dist_id = start_fake_s3(faults)
+        try:
+            results = run_scenario(port, dist_id, 's3site-scenario-%s' % name)
+        finally:
+            stop_fake_s3(pid)
+        for operation, op_stats, error in results:
+            if op_stats:
+                phases = op_stats['phases']
+                print '  %-8s %8.3fs %7d requests %4d retries %s' % (
+                    operation, op_stats['seconds'],
+                    sum([p['num_requests'] for p in phases]),
+                    sum([p['retries'] for p in phases]),
+                    error and 'FAILED: %s' % error or 'ok')
+            else:
+                print '  %-8s FAILED: %s' % (operation, error)
+            if error:
+                failed.append(name)
+    if failed:
+        sys.exit('scenarios failed: %s' % ', '.join(failed))
+
+
+BENCHMARKS = dict(walk=bench_walk, remote_index=bench_remote_index,
+                  sync=bench_sync, scenarios=bench_scenarios)
+
+
+def main(names=None):
+    names = names or sorted(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            sys.exit("unknown benchmark '%s' (choose from: %s)" %
+                     (name, ', '.join(sorted(BENCHMARKS))))
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
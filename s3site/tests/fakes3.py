@@ -0,0 +1,669 @@
+"""
+Local in-memory stand-in for the S3 and CloudFront REST APIs
+
+FakeS3Server implements the subset of the S3 (path-style requests only) and
+CloudFront APIs used by s3site: listing, reading, writing, copying and
+deleting objects, multipart uploads, bucket website configuration, looking up
+distributions and creating and checking on invalidations. It's meant for
+tests and benchmarks and is reached through the usual connection settings:
+
+    server = FakeS3Server().start()
+    s3 = awsutils.EasyS3(key, secret, aws_s3_host='127.0.0.1',
+                         aws_cf_host='127.0.0.1', aws_port=server.port,
+                         aws_is_secure=False)
+
+Distributions can't be created through the API, use add_distribution()
+instead. The number of requests received by method, and the number of faults
+injected, are kept in server.state.request_counts.
+
+Latency, bandwidth limits and failures can be injected into S3 requests to
+see how s3site copes with a slow or unreliable S3 (see Faults). SCENARIOS
+lists a few ready-made combinations:
+
+    server = FakeS3Server(faults=Faults(slowdown_rate=0.05)).start()
+"""
+import cgi
+import time
+import random
+import socket
+import struct
+import uuid
+import hashlib
+import urllib
+import urlparse
+import threading
+import xml.dom.minidom
+import BaseHTTPServer
+import SocketServer
+from xml.sax.saxutils import escape
+
+S3_NS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+CF_VERSION = '2010-11-01'
+CF_NS = 'http://cloudfront.amazonaws.com/doc/%s/' % CF_VERSION
+
+
+def _timestamp(t=None):
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(t))
+
+
+class FakeObject(object):
+    def __init__(self, data, headers=None, etag=None):
+        self.data = data
+        self.headers = headers or {}
+        self.etag = etag or hashlib.md5(data).hexdigest()
+        self.mtime = time.time()
+
+
+class FakeBucket(object):
+    def __init__(self, name):
+        self.name = name
+        self.objects = {}
+        self.website = None
+        self.uploads = {}
+
+
+class Faults(object):
+    """
+    Faults injected by FakeS3Server into S3 requests
+
+    latency - seconds added to every request
+    bandwidth - maximum request and response body transfer rate of each
+                request in bytes/sec
+    slowdown_rate - fraction of requests answered with '503 SlowDown'
+    reset_rate - fraction of requests whose connection is reset instead of
+                 being answered
+    max_keys - maximum number of keys returned per listing so that listings
+               are truncated (paginated) sooner than clients ask for
+    methods - only inject slowdowns and resets into requests with these HTTP
+              methods (default: all methods)
+    seed - seed for the random number generator used to pick the requests
+           that fail
+    """
+    def __init__(self, latency=0, bandwidth=None, slowdown_rate=0,
+                 reset_rate=0, max_keys=None, methods=None, seed=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.slowdown_rate = slowdown_rate
+        self.reset_rate = reset_rate
+        self.max_keys = max_keys
+        self.methods = methods
+        self._random = random.Random(seed)
+
+    def __repr__(self):
+        faults = ['%s=%s' % (k, v) for k, v in sorted(self.__dict__.items())
+                  if not k.startswith('_') and v]
+        return '<Faults: %s>' % (', '.join(faults) or 'none')
+
+    def should_fail(self, method, rate):
+        if not rate or (self.methods and method not in self.methods):
+            return False
+        return self._random.random() < rate
+
+    def throttle(self, nbytes):
+        if self.bandwidth and nbytes:
+            time.sleep(nbytes / float(self.bandwidth))
+
+
+# named fault combinations used to exercise s3site end to end (see
+# s3site.tests.benchmarks)
+SCENARIOS = [
+    ('clean', Faults()),
+    ('latency', Faults(latency=0.02)),
+    ('bandwidth', Faults(bandwidth=4 * 1024 * 1024)),
+    ('slowdown', Faults(slowdown_rate=0.05, seed=1)),
+    ('resets', Faults(reset_rate=0.02, seed=2)),
+    ('truncated', Faults(max_keys=7)),
+    ('mixed', Faults(latency=0.005, bandwidth=8 * 1024 * 1024,
+                     slowdown_rate=0.02, reset_rate=0.01, max_keys=50,
+                     seed=3)),
+]
+
+
+class FakeState(object):
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.buckets = {}
+        self.distributions = {}
+        self.invalidations = {}
+        self.request_counts = {}
+
+    def count(self, op):
+        self.request_counts[op] = self.request_counts.get(op, 0) + 1
+
+
+class FakeS3Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # buffer each response and send it without waiting for delayed ACKs so
+    # that small requests aren't dominated by TCP stalls
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _parse(self):
+        parsed = urlparse.urlparse(self.path)
+        self.query = cgi.parse_qs(parsed.query, keep_blank_values=True)
+        parts = parsed.path.lstrip('/').split('/', 1)
+        self.bucket_name = urllib.unquote(parts[0])
+        self.key_name = None
+        if len(parts) > 1 and parts[1]:
+            self.key_name = urllib.unquote(parts[1])
+
+    @property
+    def faults(self):
+        return self.server.faults
+
+    def _body(self):
+        length = int(self.headers.get('content-length') or 0)
+        body = self.rfile.read(length)
+        if self.faults:
+            self.faults.throttle(len(body))
+        return body
+
+    def _send(self, status, body='', headers=None, head=False):
+        self.send_response(status)
+        headers = headers or {}
+        if body and 'Content-Type' not in headers:
+            headers['Content-Type'] = 'application/xml'
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            if self.faults:
+                self.faults.throttle(len(body))
+            self.wfile.write(body)
+
+    def _error(self, status, code, msg=''):
+        body = ('<?xml version="1.0" encoding="UTF-8"?><Error><Code>%s</Code>'
+                '<Message>%s</Message></Error>' % (code, escape(msg)))
+        self._send(status, body, head=self.command == 'HEAD')
+
+    def _count(self, op):
+        self.state.lock.acquire()
+        try:
+            self.state.count(op)
+        finally:
+            self.state.lock.release()
+
+    def _reset(self):
+        """
+        Reset the connection without responding
+        """
+        self.close_connection = 1
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                   struct.pack('ii', 1, 0))
+        self.connection.close()
+
+    def _inject_faults(self, method):
+        """
+        Inject the server's faults into the current request. Returns True if
+        the request has been dealt with.
+        """
+        faults = self.faults
+        if faults.latency:
+            time.sleep(faults.latency)
+        if faults.should_fail(method, faults.reset_rate):
+            self._count('reset')
+            self._reset()
+            return True
+        if faults.should_fail(method, faults.slowdown_rate):
+            self._count('503')
+            self._body()
+            self._error(503, 'SlowDown', 'Please reduce your request rate.')
+            return True
+        return False
+
+    def _dispatch(self, method):
+        self._parse()
+        self._count(method)
+        if self.bucket_name == CF_VERSION:
+            return self._cloudfront(method)
+        if self.faults and self._inject_faults(method):
+            return
+        handler = getattr(self, '%s_%s' % (method.lower(), 'object'
+                                           if self.key_name else 'bucket'))
+        handler()
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_HEAD(self):
+        self._dispatch('HEAD')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _get_bucket(self):
+        bucket = self.state.buckets.get(self.bucket_name)
+        if not bucket:
+            self._error(404, 'NoSuchBucket', self.bucket_name)
+        return bucket
+
+    # S3 bucket operations
+
+    def get_bucket(self):
+        if not self.bucket_name:
+            return self._list_buckets()
+        bucket = self._get_bucket()
+        if not bucket:
+            return
+        if 'website' in self.query:
+            if not bucket.website:
+                return self._error(404, 'NoSuchWebsiteConfiguration')
+            return self._send(200, bucket.website)
+        if 'location' in self.query:
+            return self._send(200, '<LocationConstraint xmlns="%s"/>' % S3_NS)
+        self._list_objects(bucket)
+
+    head_bucket = get_bucket
+
+    def _list_buckets(self):
+        buckets = ''.join(['<Bucket><Name>%s</Name><CreationDate>%s'
+                           '</CreationDate></Bucket>' %
+                           (escape(b), _timestamp())
+                           for b in sorted(self.state.buckets)])
+        body = ('<ListAllMyBucketsResult xmlns="%s"><Owner><ID>fake</ID>'
+                '<DisplayName>fake</DisplayName></Owner><Buckets>%s</Buckets>'
+                '</ListAllMyBucketsResult>' % (S3_NS, buckets))
+        self._send(200, body)
+
+    def _list_objects(self, bucket):
+        q = dict([(k, v[0]) for k, v in self.query.items()])
+        prefix = q.get('prefix', '')
+        marker = q.get('marker', '')
+        delimiter = q.get('delimiter', '')
+        max_keys = int(q.get('max-keys', 1000))
+        if self.faults and self.faults.max_keys:
+            max_keys = min(max_keys, self.faults.max_keys)
+        self.state.lock.acquire()
+        try:
+            names = sorted(bucket.objects)
+            objects = dict(bucket.objects)
+        finally:
+            self.state.lock.release()
+        contents = []
+        prefixes = []
+        truncated = False
+        next_marker = ''
+        for name in names:
+            if name <= marker or not name.startswith(prefix):
+                continue
+            if delimiter:
+                idx = name.find(delimiter, len(prefix))
+                if idx >= 0:
+                    cp = name[:idx + len(delimiter)]
+                    if cp <= marker or (prefixes and prefixes[-1] == cp):
+                        continue
+                    if len(contents) + len(prefixes) >= max_keys:
+                        truncated = True
+                        break
+                    prefixes.append(cp)
+                    next_marker = cp
+                    continue
+            if len(contents) + len(prefixes) >= max_keys:
+                truncated = True
+                break
+            contents.append(name)
+            next_marker = name
+        xml_contents = []
+        for name in contents:
+            obj = objects[name]
+            xml_contents.append(
+                '<Contents><Key>%s</Key><LastModified>%s</LastModified>'
+                '<ETag>&quot;%s&quot;</ETag><Size>%d</Size>'
+                '<StorageClass>STANDARD</StorageClass></Contents>' %
+                (escape(name), _timestamp(obj.mtime), obj.etag,
+                 len(obj.data)))
+        xml_prefixes = ['<CommonPrefixes><Prefix>%s</Prefix></CommonPrefixes>'
+                        % escape(p) for p in prefixes]
+        body = ('<ListBucketResult xmlns="%s"><Name>%s</Name>'
+                '<Prefix>%s</Prefix><Marker>%s</Marker>'
+                '<MaxKeys>%d</MaxKeys><IsTruncated>%s</IsTruncated>' %
+                (S3_NS, escape(bucket.name), escape(prefix), escape(marker),
+                 max_keys, str(truncated).lower()))
+        if truncated and delimiter:
+            body += '<NextMarker>%s</NextMarker>' % escape(next_marker)
+        body += ''.join(xml_contents) + ''.join(xml_prefixes)
+        body += '</ListBucketResult>'
+        self._send(200, body)
+
+    def put_bucket(self):
+        body = self._body()
+        self.state.lock.acquire()
+        try:
+            bucket = self.state.buckets.get(self.bucket_name)
+            if 'website' in self.query:
+                if not bucket:
+                    return self._error(404, 'NoSuchBucket')
+                bucket.website = body
+                return self._send(200)
+            if not bucket:
+                self.state.buckets[self.bucket_name] = \
+                    FakeBucket(self.bucket_name)
+        finally:
+            self.state.lock.release()
+        self._send(200)
+
+    def delete_bucket(self):
+        self.state.lock.acquire()
+        try:
+            bucket = self.state.buckets.get(self.bucket_name)
+            if not bucket:
+                return self._error(404, 'NoSuchBucket')
+            if bucket.objects:
+                return self._error(409, 'BucketNotEmpty')
+            del self.state.buckets[self.bucket_name]
+        finally:
+            self.state.lock.release()
+        self._send(204)
+
+    def post_bucket(self):
+        bucket = self._get_bucket()
+        if not bucket:
+            return
+        if 'delete' not in self.query:
+            return self._error(400, 'InvalidRequest')
+        doc = xml.dom.minidom.parseString(self._body())
+        deleted = []
+        self.state.lock.acquire()
+        try:
+            for node in doc.getElementsByTagName('Key'):
+                name = ''.join([n.data for n in node.childNodes])
+                bucket.objects.pop(name, None)
+                deleted.append(name)
+        finally:
+            self.state.lock.release()
+        body = '<DeleteResult xmlns="%s">' % S3_NS
+        body += ''.join(['<Deleted><Key>%s</Key></Deleted>' % escape(k)
+                         for k in deleted])
+        body += '</DeleteResult>'
+        self._send(200, body)
+
+    # S3 object operations
+
+    def _object_headers(self, obj):
+        headers = dict(obj.headers)
+        headers['ETag'] = '"%s"' % obj.etag
+        headers['Last-Modified'] = time.strftime(
+            '%a, %d %b %Y %H:%M:%S GMT', time.gmtime(obj.mtime))
+        return headers
+
+    def get_object(self):
+        bucket = self._get_bucket()
+        if not bucket:
+            return
+        if 'uploadId' in self.query:
+            return self._list_parts(bucket)
+        obj = bucket.objects.get(self.key_name)
+        if not obj:
+            return self._error(404, 'NoSuchKey', self.key_name)
+        self._send(200, obj.data, self._object_headers(obj))
+
+    def _list_parts(self, bucket):
+        upload_id = self.query['uploadId'][0]
+        upload = bucket.uploads.get(upload_id)
+        if not upload:
+            return self._error(404, 'NoSuchUpload', upload_id)
+        parts = ''.join(['<Part><PartNumber>%d</PartNumber><ETag>&quot;%s'
+                         '&quot;</ETag><Size>%d</Size></Part>' %
+                         (n, hashlib.md5(data).hexdigest(), len(data))
+                         for n, data in sorted(upload[1].items())])
+        body = ('<ListPartsResult xmlns="%s"><Bucket>%s</Bucket><Key>%s</Key>'
+                '<UploadId>%s</UploadId><IsTruncated>false</IsTruncated>%s'
+                '</ListPartsResult>' % (S3_NS, escape(bucket.name),
+                                        escape(self.key_name), upload_id,
+                                        parts))
+        self._send(200, body)
+
+    def head_object(self):
+        bucket = self._get_bucket()
+        if not bucket:
+            return
+        obj = bucket.objects.get(self.key_name)
+        if not obj:
+            return self._send(404, head=True)
+        self.send_response(200)
+        for k, v in self._object_headers(obj).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(obj.data)))
+        self.end_headers()
+
+    def _stored_headers(self):
+        headers = {}
+        for k, v in self.headers.items():
+            lk = k.lower()
+            if lk.startswith('x-amz-meta-') or lk in ('content-type',
+                                                      'content-encoding',
+                                                      'cache-control'):
+                headers[k] = v
+        return headers
+
+    def put_object(self):
+        bucket = self._get_bucket()
+        if not bucket:
+            return
+        body = self._body()
+        if 'uploadId' in self.query:
+            return self._put_part(bucket, body)
+        copy_source = self.headers.get('x-amz-copy-source')
+        if copy_source:
+            return self._copy_object(bucket, copy_source)
+        obj = FakeObject(body, self._stored_headers())
+        self.state.lock.acquire()
+        try:
+            bucket.objects[self.key_name] = obj
+        finally:
+            self.state.lock.release()
+        self._send(200, headers={'ETag': '"%s"' % obj.etag})
+
+    def _copy_object(self, bucket, copy_source):
+        src_bucket, src_key = urllib.unquote(copy_source).lstrip('/').split(
+            '/', 1)
+        src = self.state.buckets.get(src_bucket)
+        obj = src and src.objects.get(src_key)
+        if not obj:
+            return self._error(404, 'NoSuchKey', src_key)
+        headers = dict(obj.headers)
+        if self.headers.get('x-amz-metadata-directive') == 'REPLACE':
+            headers = self._stored_headers()
+        new = FakeObject(obj.data, headers, etag=obj.etag)
+        self.state.lock.acquire()
+        try:
+            bucket.objects[self.key_name] = new
+        finally:
+            self.state.lock.release()
+        body = ('<CopyObjectResult><LastModified>%s</LastModified>'
+                '<ETag>&quot;%s&quot;</ETag></CopyObjectResult>' %
+                (_timestamp(new.mtime), new.etag))
+        self._send(200, body)
+
+    def delete_object(self):
+        bucket = self._get_bucket()
+        if not bucket:
+            return
+        if 'uploadId' in self.query:
+            bucket.uploads.pop(self.query['uploadId'][0], None)
+            return self._send(204)
+        self.state.lock.acquire()
+        try:
+            bucket.objects.pop(self.key_name, None)
+        finally:
+            self.state.lock.release()
+        self._send(204)
+
+    def post_object(self):
+        bucket = self._get_bucket()
+        if not bucket:
+            return
+        body = self._body()
+        if 'uploads' in self.query:
+            upload_id = uuid.uuid4().hex
+            bucket.uploads[upload_id] = (self._stored_headers(), {})
+            resp = ('<InitiateMultipartUploadResult xmlns="%s">'
+                    '<Bucket>%s</Bucket><Key>%s</Key><UploadId>%s</UploadId>'
+                    '</InitiateMultipartUploadResult>' %
+                    (S3_NS, escape(bucket.name), escape(self.key_name),
+                     upload_id))
+            return self._send(200, resp)
+        if 'uploadId' in self.query:
+            upload_id = self.query['uploadId'][0]
+            upload = bucket.uploads.pop(upload_id, None)
+            if not upload:
+                return self._error(404, 'NoSuchUpload', upload_id)
+            headers, parts = upload
+            # the parts listed in the request make up the object
+            doc = xml.dom.minidom.parseString(body)
+            nums = sorted([int(n.firstChild.data) for n in
+                           doc.getElementsByTagName('PartNumber')])
+            if [n for n in nums if n not in parts]:
+                return self._error(400, 'InvalidPart')
+            data = ''.join([parts[n] for n in nums])
+            digests = ''.join([hashlib.md5(parts[n]).digest() for n in nums])
+            etag = '%s-%d' % (hashlib.md5(digests).hexdigest(), len(nums))
+            self.state.lock.acquire()
+            try:
+                bucket.objects[self.key_name] = FakeObject(data, headers,
+                                                           etag=etag)
+            finally:
+                self.state.lock.release()
+            resp = ('<CompleteMultipartUploadResult xmlns="%s">'
+                    '<Location>http://%s/%s</Location><Bucket>%s</Bucket>'
+                    '<Key>%s</Key><ETag>&quot;%s&quot;</ETag>'
+                    '</CompleteMultipartUploadResult>' %
+                    (S3_NS, escape(bucket.name), escape(self.key_name),
+                     escape(bucket.name), escape(self.key_name), etag))
+            return self._send(200, resp)
+        self._error(400, 'InvalidRequest')
+
+    def _put_part(self, bucket, body):
+        upload_id = self.query['uploadId'][0]
+        part_num = int(self.query['partNumber'][0])
+        upload = bucket.uploads.get(upload_id)
+        if not upload:
+            return self._error(404, 'NoSuchUpload', upload_id)
+        upload[1][part_num] = body
+        etag = hashlib.md5(body).hexdigest()
+        self._send(200, headers={'ETag': '"%s"' % etag})
+
+    # CloudFront operations
+
+    def _cloudfront(self, method):
+        parts = self.key_name.split('/')
+        if parts[0] != 'distribution':
+            return self._error(404, 'NoSuchResource')
+        if len(parts) == 1:
+            return self._cf_list()
+        dist = self.state.distributions.get(parts[1])
+        if not dist:
+            return self._error(404, 'NoSuchDistribution', parts[1])
+        if len(parts) == 2:
+            return self._send(200, self._cf_dist_xml(dist, 'Distribution'),
+                              headers={'ETag': 'E1'})
+        if parts[2] == 'invalidation':
+            if method == 'POST':
+                return self._cf_invalidate(dist)
+            if len(parts) == 4:
+                return self._cf_invalidation_status(dist, parts[3])
+        self._error(404, 'NoSuchResource')
+
+    def _cf_dist_xml(self, dist, tag):
+        config = ('<CustomOrigin><DNSName>%s</DNSName><HTTPPort>80</HTTPPort>'
+                  '<HTTPSPort>443</HTTPSPort><OriginProtocolPolicy>http-only'
+                  '</OriginProtocolPolicy></CustomOrigin>'
+                  '<Enabled>true</Enabled>' % escape(dist['origin']))
+        if tag == 'Distribution':
+            config = ('<DistributionConfig>%s<CallerReference>x'
+                      '</CallerReference><DefaultRootObject>%s'
+                      '</DefaultRootObject></DistributionConfig>' %
+                      (config, escape(dist['root'])))
+        return ('<%s xmlns="%s"><Id>%s</Id><Status>Deployed</Status>'
+                '<LastModifiedTime>%s</LastModifiedTime>'
+                '<InProgressInvalidationBatches>0'
+                '</InProgressInvalidationBatches>'
+                '<DomainName>%s.cloudfront.net</DomainName>%s</%s>' %
+                (tag, CF_NS, dist['id'], _timestamp(), dist['id'].lower(),
+                 config, tag))
+
+    def _cf_list(self):
+        summaries = ''.join([self._cf_dist_xml(d, 'DistributionSummary')
+                             for d in self.state.distributions.values()])
+        body = ('<DistributionList xmlns="%s"><Marker></Marker>'
+                '<MaxItems>100</MaxItems><IsTruncated>false</IsTruncated>'
+                '%s</DistributionList>' % (CF_NS, summaries))
+        self._send(200, body)
+
+    def _cf_invalidation_xml(self, inv):
+        paths = ''.join(['<Path>%s</Path>' % escape(p) for p in inv['paths']])
+        return ('<Invalidation xmlns="%s"><Id>%s</Id><Status>%s</Status>'
+                '<CreateTime>%s</CreateTime><InvalidationBatch>%s'
+                '<CallerReference>%s</CallerReference></InvalidationBatch>'
+                '</Invalidation>' % (CF_NS, inv['id'], inv['status'],
+                                     _timestamp(inv['created']), paths,
+                                     inv['id']))
+
+    def _cf_invalidate(self, dist):
+        doc = xml.dom.minidom.parseString(self._body())
+        paths = [''.join([n.data for n in node.childNodes])
+                 for node in doc.getElementsByTagName('Path')]
+        inv = dict(id='I' + uuid.uuid4().hex[:12].upper(), paths=paths,
+                   status='InProgress', created=time.time(), dist=dist['id'])
+        self.state.lock.acquire()
+        try:
+            self.state.invalidations[inv['id']] = inv
+        finally:
+            self.state.lock.release()
+        self._send(201, self._cf_invalidation_xml(inv))
+
+    def _cf_invalidation_status(self, dist, inv_id):
+        inv = self.state.invalidations.get(inv_id)
+        if not inv:
+            return self._error(404, 'NoSuchInvalidation', inv_id)
+        if time.time() - inv['created'] >= self.server.invalidation_time:
+            inv['status'] = 'Completed'
+        self._send(200, self._cf_invalidation_xml(inv))
+
+
+class FakeS3Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, state=None,
+                 invalidation_time=0, faults=None):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), FakeS3Handler)
+        self.state = state or FakeState()
+        self.invalidation_time = invalidation_time
+        # Faults to inject into S3 requests (can be changed at any time)
+        self.faults = faults
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def add_distribution(self, origin, root='index.html'):
+        dist_id = 'E' + uuid.uuid4().hex[:12].upper()
+        self.state.distributions[dist_id] = dict(id=dist_id, origin=origin,
+                                                 root=root)
+        return dist_id
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.setDaemon(True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
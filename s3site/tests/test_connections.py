@@ -0,0 +1,82 @@
+import socket
+import httplib
+import unittest
+
+from s3site import awsutils
+
+
+class FakeConnection(object):
+    """
+    Stand-in for a boto connection that only has boto's pool of idle
+    HTTP(S) connections
+    """
+    def __init__(self):
+        self._pool = awsutils.boto.connection.ConnectionPool()
+        self.closed = False
+
+    def add_socket(self):
+        """
+        Add an idle HTTP connection to the pool and return the server end of
+        its socket
+        """
+        client, server = socket.socketpair()
+        http_conn = httplib.HTTPConnection('localhost')
+        http_conn.sock = client
+        self._pool.put_http_connection('localhost', False, http_conn)
+        return http_conn, server
+
+    def get_http_connections(self):
+        pool = self._pool.host_to_pool.get(('localhost', False))
+        return [pair[0] for pair in (pool and pool.queue or [])]
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = awsutils.ConnectionPool(FakeConnection, max_size=2)
+
+    def test_prune_drops_closed_sockets(self):
+        conn = self.pool.get()
+        alive, alive_server = conn.add_socket()
+        dead, dead_server = conn.add_socket()
+        dead_server.close()
+        self.assertEqual(self.pool.prune(conn), 1)
+        self.assertEqual(conn.get_http_connections(), [alive])
+        self.assertEqual(dead.sock, None)
+        alive_server.close()
+
+    def test_reuse_prunes_closed_sockets(self):
+        conn = self.pool.get()
+        http_conn, server = conn.add_socket()
+        self.pool.put(conn)
+        server.close()
+        self.assertTrue(self.pool.get() is conn)
+        self.assertEqual(conn.get_http_connections(), [])
+        self.assertEqual((self.pool.created, self.pool.reused), (1, 1))
+
+    def test_idle_connections_are_closed(self):
+        self.pool.max_idle = -1
+        conn = self.pool.get()
+        http_conn, server = conn.add_socket()
+        self.pool.put(conn)
+        self.assertFalse(self.pool.get() is conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(http_conn.sock, None)
+        server.close()
+
+    def test_main_connection_is_pooled(self):
+        s3 = awsutils.EasyS3('test', 'test', aws_s3_host='127.0.0.1',
+                             aws_upload_threads=2)
+        worker_conn = s3.connections.get()
+        s3.connections.put(worker_conn)
+        self.assertTrue(s3.conn is worker_conn)
+        self.assertEqual(s3.conn.num_retries, s3.MainNumRetries)
+        self.assertEqual(s3.connections.created, 1)
+        s3.close()
+        self.assertEqual(s3.connections.get().num_retries, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
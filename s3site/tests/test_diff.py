@@ -0,0 +1,61 @@
+import unittest
+
+from s3site import diff
+from s3site import manifest
+from s3site import exception
+from s3site.tests.test_sync import FakeS3TestCase
+
+
+def entry(name, etag='abc'):
+    return manifest.ManifestEntry(name, etag, 1)
+
+
+class TestDiff(unittest.TestCase):
+    def test_merge_join(self):
+        joined = list(diff.merge_join([1, 3, 4], [2, 3, 5], lambda x: x,
+                                      lambda x: x))
+        self.assertEqual(joined, [(1, 1, None), (2, None, 2), (3, 3, 3),
+                                  (4, 4, None), (5, None, 5)])
+
+    def test_actions(self):
+        local = [('a.html', 'a'), ('b.html', 'b'), ('d.html', 'd')]
+        remote = [entry('b.html'), entry('c.html'), entry('d.html', 'old')]
+
+        def is_in_sync(local, remote):
+            return remote.etag == 'abc'
+        actions = [(action, s3path) for action, s3path, l, r in
+                   diff.diff(local, remote, is_in_sync)]
+        self.assertEqual(actions, [(diff.ADD, 'a.html'),
+                                   (diff.UNCHANGED, 'b.html'),
+                                   (diff.EXTRANEOUS, 'c.html'),
+                                   (diff.CHANGE, 'd.html')])
+
+    def test_unsorted_input_is_rejected(self):
+        local = [('b.html', 'b'), ('a.html', 'a')]
+        self.assertRaises(exception.SortOrderError, list,
+                          diff.diff(local, [], lambda l, r: True))
+        remote = [entry('a.html'), entry('a.html')]
+        self.assertRaises(exception.SortOrderError, list,
+                          diff.diff([], remote, lambda l, r: True))
+
+
+class TestLocalOrder(FakeS3TestCase):
+    def test_local_files_in_s3_order(self):
+        # '-' and '.' sort before '/' so 'a-b' and 'a.html' come before the
+        # files in directory 'a'
+        for name in ['a/b.html', 'a.html', 'a-b/c.html', 'a/a/z.html',
+                     'ab.html', 'A.html']:
+            self.write_file(name, name)
+        for name in ['a/b.html', 'a.html', 'a-b/c.html', 'a/a/z.html',
+                     'ab.html', 'A.html']:
+            key = self.bucket.new_key(name)
+            key.set_contents_from_string(name)
+        local = [p for p, e in self.s3.iter_local_files(self.rootdir)]
+        remote = [e.name for e in self.s3.iter_bucket_files(self.bucket)]
+        self.assertEqual(local, remote)
+        self.assertEqual(local, ['A.html', 'a-b/c.html', 'a.html',
+                                 'a/a/z.html', 'a/b.html', 'ab.html'])
+
+
+if __name__ == '__main__':
+    unittest.main()
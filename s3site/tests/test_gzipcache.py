@@ -0,0 +1,80 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+from s3site import utils
+from s3site import gzipcache
+
+
+class TestGzipCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, 'gzip')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_file(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        f = open(path, 'w')
+        f.write(data)
+        f.close()
+        return path
+
+    def compress(self, cache, path):
+        return cache.compress(path, utils.compute_md5(path))
+
+    def test_compressed_copies_are_keyed_by_md5_and_level(self):
+        cache = gzipcache.GzipCache(cache_dir=self.cache_dir)
+        a = self.write_file('a.html', 'same content ' * 100)
+        b = self.write_file('b.html', 'same content ' * 100)
+        c = self.write_file('c.html', 'other content ' * 100)
+        gz_a = self.compress(cache, a)
+        self.assertEqual(self.compress(cache, b), gz_a)
+        self.assertNotEqual(self.compress(cache, c), gz_a)
+        self.assertEqual(gzip.open(gz_a).read(), 'same content ' * 100)
+        fast = gzipcache.GzipCache(cache_dir=self.cache_dir, level=1)
+        self.assertNotEqual(self.compress(fast, a), gz_a)
+        self.assertNotEqual(fast.kind, cache.kind)
+
+    def test_output_is_deterministic(self):
+        cache = gzipcache.GzipCache(cache_dir=self.cache_dir)
+        path = self.write_file('a.html', 'content ' * 100)
+        gz_path = self.compress(cache, path)
+        md5 = utils.compute_md5(gz_path)
+        os.remove(gz_path)
+        os.utime(path, (0, 0))
+        self.assertEqual(utils.compute_md5(self.compress(cache, path)), md5)
+
+    def test_matches_and_is_worthwhile(self):
+        cache = gzipcache.GzipCache(min_savings=10)
+        self.assertTrue(cache.matches('text/html'))
+        self.assertTrue(cache.matches('image/svg+xml'))
+        self.assertFalse(cache.matches('image/png'))
+        self.assertTrue(cache.is_worthwhile(100, 90))
+        self.assertFalse(cache.is_worthwhile(100, 91))
+
+    def test_prune_removes_least_recently_used(self):
+        cache = gzipcache.GzipCache(cache_dir=self.cache_dir)
+        paths = []
+        for i in range(3):
+            path = self.write_file('%d.html' % i, os.urandom(1024))
+            paths.append(self.compress(cache, path))
+            os.utime(paths[-1], (i, i))
+        self.assertEqual(cache.prune(), 0)
+        # using the oldest copy makes it the most recently used one
+        self.compress(cache, os.path.join(self.tmpdir, '0.html'))
+        cache.max_size = os.path.getsize(paths[0]) * 2
+        self.assertEqual(cache.prune(), 1)
+        self.assertEqual([os.path.isfile(p) for p in paths],
+                         [True, False, True])
+
+    def test_prune_without_cache_dir(self):
+        cache = gzipcache.GzipCache(cache_dir=self.cache_dir)
+        self.assertEqual(cache.prune(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+
+from s3site import invalidation
+from s3site.tests.test_sync import FakeS3TestCase
+
+
+def get_planner(files, max_paths=1000, max_overinvalidation=50):
+    planner = invalidation.InvalidationPlanner(
+        max_paths=max_paths, max_overinvalidation=max_overinvalidation)
+    for s3path in files:
+        planner.add_file(s3path)
+    return planner
+
+
+class TestInvalidationPlanner(unittest.TestCase):
+    files = ['index.html', 'about.html',
+             'css/a.css', 'css/b.css', 'css/c.css',
+             'blog/index.html', 'blog/1.html', 'blog/2.html', 'blog/3.html',
+             'blog/2012/a.html', 'blog/2012/b.html']
+
+    def test_get_parent_dirs(self):
+        self.assertEqual(invalidation.get_parent_dirs('a/b/c.html'),
+                         ['', 'a/', 'a/b/'])
+        self.assertEqual(invalidation.get_parent_dirs('c.html'), [''])
+
+    def test_single_changes_are_not_collapsed(self):
+        planner = get_planner(self.files)
+        self.assertEqual(planner.plan(['css/a.css', 'blog/2012/a.html']),
+                         ['blog/2012/a.html', 'css/a.css'])
+        self.assertEqual(planner.plan([]), [])
+
+    def test_mostly_changed_directories_are_collapsed(self):
+        planner = get_planner(self.files)
+        changed = ['css/a.css', 'css/b.css', 'blog/2012/a.html',
+                   'blog/2012/b.html', 'index.html']
+        self.assertEqual(planner.plan(changed),
+                         ['blog/2012/*', 'css/*', 'index.html'])
+
+    def test_max_overinvalidation(self):
+        changed = ['css/a.css', 'css/b.css']
+        planner = get_planner(self.files, max_overinvalidation=0)
+        self.assertEqual(planner.plan(changed), changed)
+        # blog/ has 3 of 6 files changed: exactly 50% unchanged
+        changed = ['blog/1.html', 'blog/2.html', 'blog/2012/a.html']
+        planner = get_planner(self.files, max_overinvalidation=50)
+        self.assertEqual(planner.plan(changed), ['blog/*'])
+        planner = get_planner(self.files, max_overinvalidation=49)
+        self.assertEqual(planner.plan(changed), sorted(changed))
+
+    def test_max_paths_collapses_cheapest_directory(self):
+        changed = ['css/a.css', 'blog/1.html', 'blog/2.html',
+                   'blog/2012/a.html']
+        planner = get_planner(self.files, max_paths=2,
+                              max_overinvalidation=0)
+        # blog/ saves 2 paths for 3 unchanged files while the root would
+        # invalidate everything
+        self.assertEqual(planner.plan(changed), ['blog/*', 'css/a.css'])
+        planner = get_planner(self.files, max_paths=1,
+                              max_overinvalidation=0)
+        self.assertEqual(planner.plan(changed), ['*'])
+
+    def test_changed_root_index_invalidates_directory(self):
+        planner = get_planner(self.files)
+        self.assertEqual(planner.plan(['blog/index.html'],
+                                      root_index='index.html'),
+                         ['blog/', 'blog/index.html'])
+        self.assertEqual(planner.plan(['index.html'],
+                                      root_index='index.html'),
+                         ['/', 'index.html'])
+
+    def test_wildcards_are_not_escaped(self):
+        batch = invalidation.InvalidationBatch(['blog/*', 'a b.html'])
+        self.assertEqual(batch.escape('blog/*'), '/blog/*')
+        self.assertEqual(batch.escape('a b.html'), '/a%20b.html')
+
+
+class TestNewPaths(unittest.TestCase):
+    files = ['index.html', 'blog/index.html', 'blog/1.html']
+
+    def get_planner(self, new):
+        planner = invalidation.InvalidationPlanner()
+        for s3path in self.files:
+            planner.add_file(s3path)
+        for s3path in new:
+            planner.add_file(s3path, new=True)
+        return planner
+
+    def test_new_paths_are_not_invalidated(self):
+        new = ['blog/2.html', 'docs/index.html']
+        planner = self.get_planner(new)
+        self.assertEqual(planner.plan([], root_index='index.html', new=new),
+                         [])
+        self.assertEqual(planner.plan(['blog/1.html'], new=new),
+                         ['blog/1.html'])
+
+    def test_new_files_are_not_counted_as_unchanged(self):
+        new = ['blog/2.html', 'blog/3.html', 'blog/4.html']
+        self.files = self.files + ['a.html', 'b.html', 'c.html']
+        planner = self.get_planner(new)
+        self.assertEqual(planner.plan(['blog/index.html', 'blog/1.html'],
+                                      new=new),
+                         ['blog/*'])
+
+    def test_new_root_index_in_existing_directory(self):
+        new = ['docs/index.html']
+        self.files = ['blog/1.html', 'docs/a.html']
+        planner = self.get_planner(new)
+        self.assertEqual(planner.plan([], root_index='index.html', new=new),
+                         ['docs/'])
+
+
+class TestSyncInvalidations(FakeS3TestCase):
+    def test_only_existing_paths_are_invalidated(self):
+        dist_id = self.server.add_distribution('site.s3-website')
+        names = ['a.html', 'b.html', 'c.html', 'index.html']
+        for name in names:
+            self.write_file(name, name)
+        result = self.s3.sync_bucket(self.rootdir, self.bucket,
+                                     cf_dist_id=dist_id)
+        self.assertEqual(result.invalidations, {})
+        self.assertEqual(result.not_invalidated, names)
+        self.write_file('index.html', 'changed')
+        self.write_file('new.html', 'new')
+        result = self.s3.sync_bucket(self.rootdir, self.bucket,
+                                     cf_dist_id=dist_id)
+        self.assertEqual(result.not_invalidated, ['new.html'])
+        self.assertEqual(len(result.invalidations), 1)
+        inval_id = result.invalidations.keys()[0]
+        paths = self.server.state.invalidations[inval_id]['paths']
+        self.assertEqual(sorted(paths), ['/', '/index.html'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from s3site import journal
+from s3site import manifest
+from s3site.tests.test_sync import FakeS3TestCase
+
+
+def entry(name, etag='abc'):
+    return manifest.ManifestEntry(name, etag, 1, {'Content-Type': 'text/html'})
+
+
+class TestSyncJournal(unittest.TestCase):
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.journal_dir)
+
+    def get_journal(self, bucket_name='site', rootdir='/tmp/site'):
+        return journal.SyncJournal(bucket_name, rootdir,
+                                   journal_dir=self.journal_dir)
+
+    def test_records_are_replayed(self):
+        jrnl = self.get_journal()
+        jrnl.record_upload(entry('a.html', 'new'))
+        jrnl.record_upload(entry('b.html'), new=True)
+        jrnl.record_delete(['c.html', 'd.html'])
+        jrnl.record_upload(entry('d.html'))
+        jrnl.close()
+        jrnl = self.get_journal().load()
+        self.assertEqual(sorted(jrnl.uploaded), ['a.html', 'b.html',
+                                                 'd.html'])
+        self.assertEqual(jrnl.deleted, set(['c.html']))
+        self.assertEqual(jrnl.unplanned, {'a.html': False, 'b.html': True,
+                                          'c.html': False, 'd.html': False})
+        remote = [entry('a.html', 'old'), entry('c.html'), entry('e.html')]
+        replayed = [(e.name, e.etag) for e in jrnl.replay(remote)]
+        self.assertEqual(replayed, [('a.html', 'new'), ('b.html', 'abc'),
+                                    ('d.html', 'abc'), ('e.html', 'abc')])
+
+    def test_planned_invalidations_are_pending(self):
+        jrnl = self.get_journal()
+        jrnl.record_upload(entry('a.html'))
+        jrnl.record_plan(['a.html', 'b/*'])
+        jrnl.record_invalidation('I1', ['a.html'])
+        jrnl.close()
+        jrnl = self.get_journal().load()
+        self.assertEqual(jrnl.unplanned, {})
+        self.assertEqual(jrnl.pending, set(['b/*']))
+        self.assertFalse(jrnl.is_empty)
+
+    def test_truncated_record_is_ignored(self):
+        jrnl = self.get_journal()
+        jrnl.record_upload(entry('a.html'))
+        jrnl.record_upload(entry('b.html'))
+        jrnl.close()
+        data = open(jrnl.journal_file).read()
+        f = open(jrnl.journal_file, 'w')
+        f.write(data[:-10])
+        f.close()
+        jrnl = self.get_journal().load()
+        self.assertEqual(sorted(jrnl.uploaded), ['a.html'])
+
+    def test_journals_are_per_bucket_and_rootdir(self):
+        jrnl = self.get_journal()
+        jrnl.record_upload(entry('a.html'))
+        jrnl.close()
+        self.assertTrue(self.get_journal('other').load().is_empty)
+        self.assertTrue(self.get_journal(rootdir='/tmp/other').load().is_empty)
+        jrnl.remove()
+        self.assertFalse(os.path.exists(jrnl.journal_file))
+        self.assertTrue(self.get_journal().load().is_empty)
+
+
+class TestResumeSync(FakeS3TestCase):
+    def test_interrupted_sync_is_resumed(self):
+        dist_id = self.server.add_distribution('site.s3-website')
+        for name in ['a.html', 'b.html', 'c.html', 'd.html']:
+            self.write_file(name, name)
+        self.s3.sync_bucket(self.rootdir, self.bucket, cf_dist_id=dist_id)
+        self.write_file('a.html', 'changed')
+
+        def interrupt(*args, **kwargs):
+            raise KeyboardInterrupt()
+        self.s3._update_manifest = interrupt
+        self.assertRaises(KeyboardInterrupt, self.s3.sync_bucket,
+                          self.rootdir, self.bucket, cf_dist_id=dist_id)
+        del self.s3._update_manifest
+        jrnl = journal.SyncJournal(self.bucket.name, self.rootdir).load()
+        self.assertEqual(sorted(jrnl.uploaded), ['a.html'])
+        # a.html isn't uploaded again but it's still invalidated
+        result = self.s3.sync_bucket(self.rootdir, self.bucket,
+                                     cf_dist_id=dist_id)
+        self.assertEqual(result.values(), [])
+        paths = [inv['paths']
+                 for inv in self.server.state.invalidations.values()]
+        self.assertEqual(paths, [['/a.html']])
+        mf = self.s3.get_manifest(self.bucket)
+        etags = dict([(e.name, e.etag) for e in mf])
+        objects = self.server.state.buckets['site'].objects
+        self.assertEqual(etags['a.html'], objects['a.html'].etag)
+        self.assertFalse(os.path.exists(jrnl.journal_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
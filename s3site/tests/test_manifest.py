@@ -0,0 +1,105 @@
+import gzip
+import tempfile
+import unittest
+
+from s3site import static
+from s3site import manifest
+from s3site import exception
+from s3site.tests.test_sync import FakeS3TestCase
+
+
+def write_manifest(entries, syncs_since_verify=0):
+    mf = manifest.ManifestWriter(syncs_since_verify=syncs_since_verify)
+    for entry in entries:
+        mf.add(entry)
+    return mf.close()
+
+
+class TestManifest(unittest.TestCase):
+    def test_round_trip(self):
+        entries = [manifest.ManifestEntry('about.html', '"abc"', 5,
+                                          {'Content-Type': 'text/html'}),
+                   manifest.ManifestEntry(u'caf\xe9.html', 'def', 7)]
+        reader = manifest.ManifestReader(write_manifest(entries, 3))
+        self.assertEqual(len(reader), 2)
+        self.assertEqual(reader.syncs_since_verify, 3)
+        read = [(e.name, e.etag, e.size, e.headers) for e in reader]
+        self.assertEqual(read, [('about.html', 'abc', 5,
+                                 {'Content-Type': 'text/html'}),
+                                ('caf\xc3\xa9.html', 'def', 7, {})])
+
+    def test_reserved_files_are_skipped(self):
+        entries = [manifest.ManifestEntry(name, 'abc', 1)
+                   for name in sorted(manifest.RESERVED_FILES +
+                                      ['index.html'])]
+        reader = manifest.ManifestReader(write_manifest(entries))
+        self.assertEqual([e.name for e in reader], ['index.html'])
+
+    def test_unsorted_entries_are_rejected(self):
+        mf = manifest.ManifestWriter()
+        mf.add(manifest.ManifestEntry('b.html', 'abc', 1))
+        self.assertRaises(exception.SortOrderError, mf.add,
+                          manifest.ManifestEntry('a.html', 'abc', 1))
+        self.assertRaises(exception.SortOrderError, mf.add,
+                          manifest.ManifestEntry('b.html', 'abc', 1))
+
+    def write_gzip(self, data):
+        tmp = tempfile.TemporaryFile()
+        gz = gzip.GzipFile(fileobj=tmp, mode='wb')
+        gz.write(data)
+        gz.close()
+        return tmp
+
+    def test_invalid_manifests(self):
+        tmp = tempfile.TemporaryFile()
+        tmp.write('not gzip')
+        self.assertRaises(exception.InvalidManifest,
+                          manifest.ManifestReader, tmp)
+        self.assertRaises(exception.InvalidManifest, manifest.ManifestReader,
+                          self.write_gzip('{"version": 0}\n'))
+        self.assertRaises(exception.InvalidManifest, manifest.ManifestReader,
+                          self.write_gzip('{"version": 1}\n["a.html"]\n'))
+        # truncated after the header
+        data = write_manifest([manifest.ManifestEntry('a.html', 'abc', 1)])
+        tmp = tempfile.TemporaryFile()
+        tmp.write(data.read()[:-12])
+        self.assertRaises(exception.InvalidManifest,
+                          manifest.ManifestReader, tmp)
+
+
+class TestSyncManifest(FakeS3TestCase):
+    def test_resync_uses_manifest(self):
+        for i in range(5):
+            self.write_file('page%d.html' % i, 'page %d' % i)
+        self.s3.sync_bucket(self.rootdir, self.bucket)
+        mf = self.s3.get_manifest(self.bucket)
+        self.assertEqual([e.name for e in mf],
+                         ['page%d.html' % i for i in range(5)])
+        listings = []
+        iter_bucket_keys = self.s3.iter_bucket_keys
+
+        def record_listing(*args, **kwargs):
+            listings.append(args)
+            return iter_bucket_keys(*args, **kwargs)
+        self.s3.iter_bucket_keys = record_listing
+        self.write_file('page0.html', 'changed')
+        result = self.s3.sync_bucket(self.rootdir, self.bucket)
+        self.assertEqual(result.values(), ['page0.html'])
+        self.assertEqual(listings, [])
+        mf = self.s3.get_manifest(self.bucket)
+        self.assertEqual(mf.syncs_since_verify, 1)
+        entry = [e for e in mf if e.name == 'page0.html'][0]
+        self.assertEqual(entry.size, len('changed'))
+
+    def test_corrupt_manifest_is_ignored(self):
+        self.write_file('index.html', 'index')
+        key = self.bucket.new_key(static.S3SITE_MANIFEST_FILE)
+        key.set_contents_from_string('corrupt')
+        self.assertEqual(self.s3.get_manifest(self.bucket), None)
+        result = self.s3.sync_bucket(self.rootdir, self.bucket)
+        self.assertEqual(result.values(), ['index.html'])
+        self.assertEqual(len(self.s3.get_manifest(self.bucket)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import sys
+import threading
+import unittest
+
+from s3site import profiler
+from s3site import threadpool
+
+
+def busy_worker_func(n):
+    return sum(range(n))
+
+
+def busy_thread_func():
+    return sum(range(1000))
+
+
+def busy_main_func():
+    return sum(range(1000))
+
+
+class TestProfiler(unittest.TestCase):
+    def get_function_names(self, stats):
+        return set([func[2] for func in stats.stats])
+
+    def test_workers_profiled(self):
+        prof = profiler.Profiler().start()
+        pool = threadpool.ThreadPool(size=2)
+        for i in range(4):
+            pool.add_job(busy_worker_func, 1000, jobid=i)
+        results = [job.result for job in pool.as_completed()]
+        pool.shutdown()
+        thread = threading.Thread(target=busy_thread_func)
+        thread.start()
+        thread.join()
+        busy_main_func()
+        prof.stop()
+        self.assertEqual(results, [499500] * 4)
+        self.assertEqual(sys.getprofile(), None)
+        self.assertEqual(profiler._active, [])
+        # the main thread and both pool workers but not the plain thread
+        self.assertEqual(len(prof._thread_stats), 3)
+        names = self.get_function_names(prof.get_stats())
+        self.assertTrue('busy_worker_func' in names)
+        self.assertTrue('busy_main_func' in names)
+        self.assertFalse('busy_thread_func' in names)
+
+    def test_nested(self):
+        outer = profiler.Profiler().start()
+        inner = profiler.Profiler().start()
+        pool = threadpool.ThreadPool(size=1)
+        pool.add_job(busy_worker_func, 1000)
+        pool.wait()
+        pool.shutdown()
+        inner.stop()
+        busy_main_func()
+        outer.stop()
+        self.assertEqual(sys.getprofile(), None)
+        self.assertEqual(profiler._active, [])
+        inner_names = self.get_function_names(inner.get_stats())
+        self.assertTrue('busy_worker_func' in inner_names)
+        self.assertFalse('busy_main_func' in inner_names)
+        # the enclosing profiler also gets the nested profiler's results
+        # and resumes profiling the main thread once it has stopped
+        outer_names = self.get_function_names(outer.get_stats())
+        self.assertTrue('busy_worker_func' in outer_names)
+        self.assertTrue('busy_main_func' in outer_names)
+        self.assertEqual(len(outer._thread_stats), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import time
+import unittest
+import StringIO
+
+from s3site import progress
+
+
+class FakeTerminal(StringIO.StringIO):
+    def isatty(self):
+        return True
+
+
+class TestTransferProgress(unittest.TestCase):
+    def transfer(self, fd):
+        transfer = progress.TransferProgress(total_files=2, total_bytes=20,
+                                             fd=fd, interval=0.01).start()
+        transfer.start_file('a', 10)
+        transfer.update('a', 5)
+        time.sleep(0.1)
+        transfer.finish_file('a')
+        transfer.start_file('b', 10)
+        transfer.finish_file('b')
+        transfer.finish()
+        return fd.getvalue()
+
+    def test_no_redraw_unless_terminal(self):
+        output = self.transfer(StringIO.StringIO())
+        self.assertFalse('\r' in output)
+        self.assertEqual(output.count('\n'), 1)
+        self.assertTrue(output.startswith('Transferred: 2/2 files'))
+
+    def test_redraw_on_terminal(self):
+        output = self.transfer(FakeTerminal())
+        self.assertTrue('\r' in output)
+        self.assertEqual(output.count('\n'), 1)
+
+    def test_finish_twice(self):
+        fd = StringIO.StringIO()
+        transfer = progress.TransferProgress(fd=fd).start()
+        transfer.finish()
+        transfer.finish()
+        self.assertEqual(fd.getvalue().count('\n'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+from s3site import manifest
+from s3site import exception
+from s3site import remoteindex
+
+MD5 = 'd41d8cd98f00b204e9800998ecf8427e'
+
+
+def entry(name, etag=MD5, size=1, headers=None):
+    return manifest.ManifestEntry(name, etag, size, headers)
+
+
+def dump(index):
+    return [(e.name, e.etag, e.size, e.headers) for e in index.itervalues()]
+
+
+class TestRemoteIndex(unittest.TestCase):
+    def test_entries_round_trip(self):
+        html = {'Content-Type': 'text/html'}
+        entries = [entry('a.html', MD5, 5, html),
+                   entry('b.bin', MD5 + '-12', 2 ** 40),
+                   entry('c.html', 'not-an-md5', 7, html),
+                   entry(u'caf\xe9.html', '"%s"' % MD5, 0)]
+        index = remoteindex.RemoteIndex(entries)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(dump(index), [
+            ('a.html', MD5, 5, html), ('b.bin', MD5 + '-12', 2 ** 40, {}),
+            ('c.html', 'not-an-md5', 7, html),
+            ('caf\xc3\xa9.html', MD5, 0, {})])
+        self.assertEqual(len(index._headers), 2)
+        self.assertEqual(index['b.bin'].etag, MD5 + '-12')
+        self.assertEqual(index.get('missing.html'), None)
+        self.assertRaises(KeyError, index.__getitem__, 'missing.html')
+        self.assertTrue('a.html' in index)
+        self.assertFalse('a.htm' in index)
+
+    def test_unsorted_entries_are_rejected(self):
+        index = remoteindex.RemoteIndex([entry('b.html')])
+        self.assertRaises(exception.SortOrderError, index.append,
+                          entry('a.html'))
+        self.assertRaises(exception.SortOrderError, index.append,
+                          entry('b.html'))
+
+    def test_updates(self):
+        index = remoteindex.RemoteIndex([entry('a.html'), entry('c.html'),
+                                         entry('dir/a.html')])
+        index['b.html'] = entry('b.html', size=2)
+        index['c.html'] = entry('c.html', size=3)
+        del index['a.html']
+        self.assertRaises(KeyError, index.__delitem__, 'a.html')
+        expected = [('b.html', 2), ('c.html', 3), ('dir/a.html', 1)]
+        self.assertEqual(len(index), 3)
+        self.assertEqual([(e.name, e.size) for e in index.itervalues()],
+                         expected)
+        self.assertFalse('a.html' in index)
+        self.assertEqual(list(index.iterkeys('dir/')), ['dir/a.html'])
+        index.compact()
+        self.assertEqual(index._updates, {})
+        self.assertEqual(len(index), 3)
+        self.assertEqual([(e.name, e.size) for e in index.itervalues()],
+                         expected)
+        index.append(entry('e.html'))
+        self.assertEqual(list(index), ['b.html', 'c.html', 'dir/a.html',
+                                       'e.html'])
+
+    def test_updates_are_compacted(self):
+        index = remoteindex.RemoteIndex()
+        index.MaxUpdates = 3
+        for name in ['d.html', 'c.html', 'b.html', 'a.html']:
+            index[name] = entry(name)
+        self.assertEqual(index._updates, {})
+        self.assertEqual(list(index), ['a.html', 'b.html', 'c.html',
+                                       'd.html'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import socket
+import threading
+import unittest
+
+from s3site import scheduler
+
+
+class TestRequestScheduler(unittest.TestCase):
+    def test_retries_counted_from_threads(self):
+        sched = scheduler.RequestScheduler(max_concurrency=8, base_delay=0)
+        nthreads = 8
+        nrequests = 100
+
+        def flaky():
+            attempts = []
+
+            def request():
+                attempts.append(1)
+                if len(attempts) == 1:
+                    raise socket.error('connection reset')
+            return request
+
+        def worker():
+            for i in range(nrequests):
+                sched.run(flaky())
+        threads = [threading.Thread(target=worker) for i in range(nthreads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sched.retries, nthreads * nrequests)
+
+    def test_no_retry_for_other_errors(self):
+        sched = scheduler.RequestScheduler(base_delay=0)
+
+        def request():
+            raise ValueError('bug')
+        self.assertRaises(ValueError, sched.run, request)
+        self.assertEqual(sched.retries, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
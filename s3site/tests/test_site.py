@@ -0,0 +1,58 @@
+import unittest
+
+from s3site import site
+from s3site import static
+from s3site.tests.test_sync import FakeS3TestCase
+
+
+class FakeConfig(object):
+    globals = {'site_cache_ttl': 3600}
+
+
+class TestSiteRegistry(FakeS3TestCase):
+    def create_site(self, name, cf=False, website=True):
+        bucket = self.s3.create_bucket(name)
+        if website:
+            bucket.configure_website('index.html', 'error.html')
+        key = bucket.new_key(static.S3SITE_META_FILE)
+        if cf:
+            dist_id = self.server.add_distribution(name + '.s3-website')
+            key.update_metadata(dict(cfid=dist_id))
+        key.set_contents_from_string('')
+
+    def test_refresh_lists_distributions_once(self):
+        self.create_site('site1', cf=True)
+        self.create_site('site2')
+        self.create_site('site3', cf=True)
+        sm = site.SiteManager(s3=self.s3, cf=self.s3.cf, cfg=FakeConfig())
+        listed = []
+        get_all_distributions = self.s3.cf.get_all_distributions
+
+        def record_listing():
+            listed.append(1)
+            return get_all_distributions()
+        self.s3.cf.get_all_distributions = record_listing
+        entries = sm.get_registered_sites(refresh=True)
+        self.assertEqual(len(listed), 1)
+        self.assertEqual([e['name'] for e in entries],
+                         ['site1', 'site2', 'site3'])
+        self.assertEqual([bool(e.get('cf_id')) for e in entries],
+                         [True, False, True])
+        self.assertEqual(entries[0]['index_doc'], 'index.html')
+        self.assertEqual(entries[0]['error_doc'], 'error.html')
+        self.assertTrue(entries[2]['cf_enabled'])
+        # the registry is used until it's refreshed
+        sm.get_all_sites = None
+        self.assertEqual(sm.get_site_names(), ['site1', 'site2', 'site3'])
+
+    def test_refresh_skips_broken_sites(self):
+        self.create_site('site1')
+        self.create_site('site2', website=False)
+        self.create_site('site3')
+        sm = site.SiteManager(s3=self.s3, cf=self.s3.cf, cfg=FakeConfig())
+        entries = sm.get_registered_sites(refresh=True)
+        self.assertEqual([e['name'] for e in entries], ['site1', 'site3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from s3site import stats
+from s3site import threadpool
+
+
+class TestOperationStats(unittest.TestCase):
+    def test_bound_jobs_record_in_their_phase(self):
+        op_stats = stats.OperationStats('sync', 'site')
+        op_stats.start_phase('list')
+
+        def list_page():
+            op_stats.add_request('GET', 200, 0.1)
+            op_stats.add_retry()
+        job = op_stats.bind(list_page)
+        op_stats.start_phase('hash')
+        pool = threadpool.ThreadPool(size=2)
+        try:
+            for i in range(3):
+                pool.add_job(job)
+            pool.wait()
+        finally:
+            pool.shutdown()
+        op_stats.add_request('HEAD', 200, 0.1)
+        op_stats.finish()
+        self.assertEqual(op_stats.phases['list'].requests, {'GET': 3})
+        self.assertEqual(op_stats.phases['list'].retries, 3)
+        self.assertEqual(op_stats.phases['hash'].requests, {'HEAD': 1})
+        self.assertEqual(op_stats.phases['hash'].retries, 0)
+
+    def test_saved_stats_are_pruned(self):
+        stats_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, stats_dir)
+        for i in range(5):
+            path = os.path.join(stats_dir, 'sync-site-%d.json' % i)
+            open(path, 'w').close()
+            os.utime(path, (i, i))
+        op_stats = stats.OperationStats('sync', 'site')
+        op_stats.MaxSavedStats = 3
+        op_stats.finish()
+        saved = op_stats.save(os.path.join(stats_dir, 'latest.json'))
+        # files saved to an explicit path aren't pruned
+        self.assertEqual(len(os.listdir(stats_dir)), 6)
+        op_stats.prune(stats_dir)
+        self.assertEqual(sorted(os.listdir(stats_dir)),
+                         [os.path.basename(saved), 'sync-site-3.json',
+                          'sync-site-4.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
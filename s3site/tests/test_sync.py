@@ -0,0 +1,309 @@
+"""
+Tests for syncing sites against a local fakes3.FakeS3Server
+
+Usage: python -m unittest discover -s s3site/tests -t .
+"""
+import os
+import shutil
+import time
+import tempfile
+import threading
+import unittest
+
+import boto.s3.multipart
+
+from s3site import static
+from s3site import awsutils
+from s3site import hashcache
+from s3site import manifest
+from s3site.tests import fakes3
+
+# static directories redirected to a temporary directory during each test
+STATIC_DIRS = ['S3SITE_HASH_CACHE_DIR', 'S3SITE_GZIP_CACHE_DIR',
+               'S3SITE_JOURNAL_DIR', 'S3SITE_INVALIDATIONS_DIR',
+               'S3SITE_REGISTRY_DIR', 'S3SITE_STATS_DIR']
+
+
+class FakeS3TestCase(unittest.TestCase):
+    """
+    Runs each test against a new fake S3 server with an empty 'site' bucket
+    and a local site tree in self.rootdir
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self._static = {}
+        for name in STATIC_DIRS:
+            self._static[name] = getattr(static, name)
+            setattr(static, name, os.path.join(self.tmpdir, name.lower()))
+        self.rootdir = os.path.join(self.tmpdir, 'site')
+        os.mkdir(self.rootdir)
+        self.server = fakes3.FakeS3Server().start()
+        self.s3 = self.get_s3()
+        self.bucket = self.s3.create_bucket('site')
+
+    def tearDown(self):
+        self.s3.close()
+        self.server.stop()
+        for name, value in self._static.items():
+            setattr(static, name, value)
+        shutil.rmtree(self.tmpdir)
+
+    def get_s3(self, **kwargs):
+        return awsutils.EasyS3('test', 'test', aws_s3_host='127.0.0.1',
+                               aws_cf_host='127.0.0.1',
+                               aws_port=self.server.port,
+                               aws_is_secure=False, **kwargs)
+
+    def write_file(self, name, data):
+        path = os.path.join(self.rootdir, name)
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        f = open(path, 'w')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        return path
+
+
+class TestSyncFiles(FakeS3TestCase):
+    def test_watch_round_keeps_hash_cache(self):
+        for i in range(10):
+            self.write_file('dir%d/file%d.html' % (i % 3, i), 'file %d' % i)
+        self.s3.sync_bucket(self.rootdir, self.bucket)
+        # files new to the bucket aren't hashed until they're compared
+        self.s3.sync_bucket(self.rootdir, self.bucket)
+        cached = hashcache.HashCache(self.rootdir).load()
+        self.assertEqual(len(cached), 10)
+        remote = self.s3.get_remote_files(self.bucket)
+        path = self.write_file('dir0/file0.html', 'changed')
+        result = self.s3.sync_files(self.rootdir, self.bucket, set([path]),
+                                    remote)
+        self.assertEqual(result.values(), ['dir0/file0.html'])
+        entries = hashcache.HashCache(self.rootdir).load()
+        self.assertEqual(sorted(entries), sorted(cached))
+
+
+class TestListBucket(FakeS3TestCase):
+    def test_prefix_pages_scheduled_separately(self):
+        for i in range(5):
+            key = self.bucket.new_key('dir/page%d.html' % i)
+            key.set_contents_from_string('page %d' % i)
+        self.server.faults = fakes3.Faults(max_keys=2)
+        runs = []
+        run = self.s3.scheduler.run
+
+        def record_run(func, *args, **kwargs):
+            runs.append(func.__name__)
+            return run(func, *args, **kwargs)
+        self.s3.scheduler.run = record_run
+        names = [e.name for e in self.s3.iter_bucket_keys(self.bucket)]
+        self.assertEqual(names, ['dir/page%d.html' % i for i in range(5)])
+        self.assertEqual(runs, ['list_page'] * 3)
+
+    def test_prefix_listing_is_streamed(self):
+        for i in range(10):
+            key = self.bucket.new_key('dir/page%d.html' % i)
+            key.set_contents_from_string('page %d' % i)
+        self.server.faults = fakes3.Faults(max_keys=1)
+        runs = []
+        run = self.s3.scheduler.run
+
+        def record_run(func, *args, **kwargs):
+            runs.append(func.__name__)
+            return run(func, *args, **kwargs)
+        self.s3.scheduler.run = record_run
+        keys = self.s3.iter_bucket_keys(self.bucket, num_shards=1)
+        self.assertEqual(next(keys).name, 'dir/page0.html')
+        time.sleep(0.5)
+        # one page yielded, one queued and one waiting to be queued
+        self.assertTrue(len(runs) <= 3)
+        names = ['dir/page0.html'] + [e.name for e in keys]
+        self.assertEqual(names, ['dir/page%d.html' % i for i in range(10)])
+        self.assertEqual(len(runs), 10)
+
+    def test_closed_listing_stops_workers(self):
+        for i in range(10):
+            key = self.bucket.new_key('dir/page%d.html' % i)
+            key.set_contents_from_string('page %d' % i)
+        self.server.faults = fakes3.Faults(max_keys=1)
+        keys = self.s3.iter_bucket_keys(self.bucket, num_shards=1)
+        next(keys)
+        keys.close()
+        time.sleep(1)
+        workers = [t for t in threading.enumerate()
+                   if t.name.startswith('s3site-list')]
+        self.assertEqual(workers, [])
+
+
+class TestSyncBucket(FakeS3TestCase):
+    def test_unknown_etag_is_not_in_sync(self):
+        self.write_file('index.html', 'index')
+        self.write_file('about.html', 'about')
+        self.s3.sync_bucket(self.rootdir, self.bucket)
+        # ETag written by another S3-compatible store
+        objects = self.server.state.buckets['site'].objects
+        objects['index.html'].etag = 'a6105c0a611b41b08f1209506350279e-x'
+        result = self.s3.sync_bucket(self.rootdir, self.bucket,
+                                     full_scan=True)
+        self.assertEqual(result.values(), ['index.html'])
+
+    def test_delete_keeps_excluded_paths(self):
+        self.write_file('index.html', 'index')
+        for name in ['stale.html', 'drafts/post.html', 'logs/access.log',
+                     'old/page.html']:
+            self.bucket.new_key(name).set_contents_from_string(name)
+        result = self.s3.sync_bucket(self.rootdir, self.bucket)
+        self.assertEqual(result.deleted, [])
+        self.s3.MaxDeleteKeys = 1
+        result = self.s3.sync_bucket(self.rootdir, self.bucket, delete=True,
+                                     exclude=['drafts', '*.log'])
+        self.assertEqual(result.values(), [])
+        self.assertEqual(result.deleted, ['old/page.html', 'stale.html'])
+        objects = self.server.state.buckets['site'].objects
+        remaining = [name for name in sorted(objects)
+                     if name not in manifest.RESERVED_FILES]
+        self.assertEqual(remaining, ['drafts/post.html', 'index.html',
+                                     'logs/access.log'])
+        mf = self.s3.get_manifest(self.bucket)
+        self.assertEqual([e.name for e in mf], remaining)
+
+    def test_gzip_upload(self):
+        self.write_file('index.html', 'index ' * 1000)
+        self.write_file('logo.png', 'png ' * 1000)
+        result = self.s3.sync_bucket(self.rootdir, self.bucket, gzip=True)
+        self.assertEqual(sorted(result.values()), ['index.html', 'logo.png'])
+        objects = self.server.state.buckets['site'].objects
+        headers = dict([(k.lower(), v)
+                        for k, v in objects['index.html'].headers.items()])
+        self.assertEqual(headers['content-encoding'], 'gzip')
+        self.assertEqual(headers['content-type'], 'text/html')
+        self.assertTrue(len(objects['index.html'].data) < 6000)
+        self.assertEqual(len(objects['logo.png'].data), 4000)
+        result = self.s3.sync_bucket(self.rootdir, self.bucket, gzip=True,
+                                     full_scan=True)
+        self.assertEqual(result.values(), [])
+
+    def sync_moved_file(self, s3, size, **kwargs):
+        """
+        Sync a file of size bytes, move it and sync again passing kwargs to
+        sync_bucket. Returns the copies made by the second sync (see
+        EasyS3.copy_files).
+        """
+        copies = {}
+        copy_files = s3.copy_files
+
+        def record_copies(copy_map, *args, **kwargs):
+            copies.update(copy_map)
+            return copy_files(copy_map, *args, **kwargs)
+        s3.copy_files = record_copies
+        path = self.write_file('old/page.html', 'x' * size)
+        self.write_file('other.html', 'y' * size)
+        s3.sync_bucket(self.rootdir, self.bucket)
+        os.rename(path, os.path.join(self.rootdir, 'page.html'))
+        result = s3.sync_bucket(self.rootdir, self.bucket, delete=True,
+                                **kwargs)
+        self.assertEqual(result.values(), ['page.html'])
+        self.assertEqual(result.deleted, ['old/page.html'])
+        return copies
+
+    def test_moved_file_is_copied(self):
+        copies = self.sync_moved_file(self.s3, 100 * 1024)
+        self.assertEqual(copies.values(), ['old/page.html'])
+
+    def test_moved_file_is_copied_with_pre_upload_cb(self):
+        def set_metadata(key):
+            key.set_metadata('synced-by', 'test')
+        copies = self.sync_moved_file(self.s3, 100 * 1024,
+                                      pre_upload_cb=set_metadata)
+        self.assertEqual(copies.values(), ['old/page.html'])
+        obj = self.server.state.buckets['site'].objects['page.html']
+        headers = dict([(k.lower(), v) for k, v in obj.headers.items()])
+        self.assertEqual(headers['x-amz-meta-synced-by'], 'test')
+        self.assertEqual(headers['content-type'], 'text/html')
+
+    def test_moved_multipart_file_is_copied(self):
+        s3 = self.get_s3(aws_multipart_threshold=5,
+                         aws_multipart_chunk_size=5)
+        self.addCleanup(s3.close)
+        copies = self.sync_moved_file(s3, 6 * 1024 * 1024)
+        self.assertEqual(copies.values(), ['old/page.html'])
+        etag = self.server.state.buckets['site'].objects['page.html'].etag
+        self.assertEqual(etag.strip('"')[-2:], '-2')
+
+
+class TestDownloadBucket(FakeS3TestCase):
+    def test_throttled_downloads_are_retried(self):
+        for i in range(20):
+            key = self.bucket.new_key('dir%d/page%d.html' % (i % 3, i))
+            key.set_contents_from_string('page %d' % i)
+        self.server.faults = fakes3.Faults(slowdown_rate=0.1,
+                                           methods=['GET'], seed=1)
+        output_dir = os.path.join(self.tmpdir, 'clone')
+        os.mkdir(output_dir)
+        op_stats = self.s3.start_stats('clone', 'site')
+        try:
+            self.s3.download_bucket(self.bucket, output_dir)
+        finally:
+            self.s3.stop_stats()
+        for i in range(20):
+            path = os.path.join(output_dir, 'site', 'dir%d' % (i % 3),
+                                'page%d.html' % i)
+            self.assertEqual(open(path).read(), 'page %d' % i)
+        download = op_stats.phases['download']
+        self.assertEqual(download.items, 20)
+        self.assertTrue(download.retries > 0)
+        self.assertEqual(download.num_requests, 20 + download.retries)
+
+
+class TestMultipartUpload(FakeS3TestCase):
+    def setUp(self):
+        super(TestMultipartUpload, self).setUp()
+        self.mp_s3 = self.get_s3(aws_multipart_threshold=5,
+                                 aws_multipart_chunk_size=5)
+        self.addCleanup(self.mp_s3.close)
+        self.path = self.write_file('large.bin', 'x' * 6 * 1024 * 1024)
+        self.runs = []
+        run = self.mp_s3.scheduler.run
+
+        def record_run(func, *args, **kwargs):
+            self.runs.append(func)
+            return run(func, *args, **kwargs)
+        self.mp_s3.scheduler.run = record_run
+
+    def get_connection(self, func):
+        owner = func.im_self
+        if isinstance(owner, boto.s3.multipart.MultiPartUpload):
+            owner = owner.bucket
+        return owner.connection
+
+    def test_requests_are_only_retried_by_scheduler(self):
+        etag = self.mp_s3.put_multipart_file(self.path, self.bucket,
+                                             'large.bin')
+        self.assertTrue(etag.endswith('-2'))
+        names = [f.__name__ for f in self.runs]
+        self.assertEqual(names[0], 'initiate_multipart_upload')
+        self.assertEqual(names[-1], 'complete_upload')
+        for func in (self.runs[0], self.runs[-1]):
+            self.assertEqual(self.get_connection(func).num_retries, 0)
+
+    def test_cancel_error_does_not_hide_part_error(self):
+        def fail_part(*args):
+            raise ValueError('part failed')
+        self.mp_s3._upload_part_worker = fail_part
+        run = self.mp_s3.scheduler.run
+
+        def fail_cancel(func, *args, **kwargs):
+            if func.__name__ == 'cancel_upload':
+                raise IOError('cancel failed')
+            return run(func, *args, **kwargs)
+        self.mp_s3.scheduler.run = fail_cancel
+        self.assertRaises(ValueError, self.mp_s3.put_multipart_file,
+                          self.path, self.bucket, 'large.bin')
+        self.assertEqual([f.__name__ for f in self.runs],
+                         ['initiate_multipart_upload'])
+
+
+if __name__ == '__main__':
+    unittest.main()
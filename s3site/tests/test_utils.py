@@ -0,0 +1,21 @@
+import unittest
+
+from s3site import utils
+
+
+class TestGetEtagParts(unittest.TestCase):
+    def test_plain_md5(self):
+        etag = '"d41d8cd98f00b204e9800998ecf8427e"'
+        self.assertEqual(utils.get_etag_parts(etag), 0)
+
+    def test_multipart(self):
+        etag = '"d41d8cd98f00b204e9800998ecf8427e-12"'
+        self.assertEqual(utils.get_etag_parts(etag), 12)
+
+    def test_unknown_format(self):
+        self.assertEqual(utils.get_etag_parts('"abc-def"'), 0)
+        self.assertEqual(utils.get_etag_parts('"d41d8cd9-"'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from s3site import watcher
+
+
+class TestInotifyWatcher(unittest.TestCase):
+    def setUp(self):
+        self.rootdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.rootdir, 'index.html')
+        f = open(self.path, 'w')
+        f.write('index')
+        f.close()
+        try:
+            self.watcher = watcher.InotifyWatcher(self.rootdir)
+        except watcher.InotifyError, e:
+            shutil.rmtree(self.rootdir)
+            self.skipTest(str(e))
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.rootdir)
+
+    def read_all(self):
+        changed = set()
+        while True:
+            paths = self.watcher.read(0.2)
+            if not paths:
+                return changed
+            changed.update(paths)
+
+    def test_new_file_reported_once_written(self):
+        path = os.path.join(self.rootdir, 'about.html')
+        f = open(path, 'w')
+        self.assertEqual(self.read_all(), set())
+        f.write('about')
+        f.close()
+        self.assertEqual(self.read_all(), set([path]))
+
+    def test_links_are_reported(self):
+        hardlink = os.path.join(self.rootdir, 'hard.html')
+        symlink = os.path.join(self.rootdir, 'sym.html')
+        os.link(self.path, hardlink)
+        os.symlink(self.path, symlink)
+        self.assertEqual(self.read_all(), set([hardlink, symlink]))
+
+    def test_wait_for_changes_batches_paths(self):
+        paths = []
+        for i in range(3):
+            path = os.path.join(self.rootdir, 'page%d.html' % i)
+            f = open(path, 'w')
+            f.write('page %d' % i)
+            f.close()
+            paths.append(path)
+        self.assertEqual(self.watcher.wait_for_changes(debounce=0.2),
+                         set(paths))
+
+
+class TestPollingWatcher(unittest.TestCase):
+    def setUp(self):
+        self.rootdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.rootdir)
+
+    def test_changes_are_reported(self):
+        w = watcher.PollingWatcher(self.rootdir, interval=0.1)
+        path = os.path.join(self.rootdir, 'index.html')
+        f = open(path, 'w')
+        f.write('index')
+        f.close()
+        self.assertEqual(w.read(1.0), [path])
+        os.remove(path)
+        self.assertEqual(w.read(1.0), [path])
+        self.assertEqual(w.read(0.2), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+"""
+ThreadPool module for s3site
+"""
+import sys
+import Queue
+import threading
+
+from s3site import profiler
+from s3site.logger import log
+
+
+class Job(object):
+    """
+    A single unit of work executed by a ThreadPool worker
+
+    The return value of func is stored in the 'result' attribute. If func
+    raises an exception the exception info is stored in 'exc_info' instead.
+    """
+    def __init__(self, func, args=None, kwargs=None, jobid=None):
+        self.func = func
+        self.args = args or []
+        self.kwargs = kwargs or {}
+        self.jobid = jobid
+        self.result = None
+        self.exc_info = None
+
+    def __repr__(self):
+        return '<Job: %s>' % self.jobid
+
+    @property
+    def failed(self):
+        return self.exc_info is not None
+
+    @property
+    def exception(self):
+        if self.exc_info:
+            return self.exc_info[1]
+
+    def run(self):
+        try:
+            self.result = self.func(*self.args, **self.kwargs)
+        except Exception:
+            self.exc_info = sys.exc_info()
+            log.debug("job %s failed" % self.jobid, exc_info=self.exc_info)
+        return self.result
+
+
+class Worker(threading.Thread):
+    def __init__(self, pool, name):
+        threading.Thread.__init__(self, name=name)
+        self.setDaemon(True)
+        self.pool = pool
+
+    def run(self):
+        profiler.profile_worker(self._run)
+
+    def _run(self):
+        while True:
+            job = self.pool._jobs.get()
+            if job is None:
+                return
+            job.run()
+            self.pool._results.put(job)
+
+
+class ThreadPool(object):
+    """
+    Fixed-size pool of daemon worker threads that execute Jobs from a shared
+    queue
+
+    pool = ThreadPool(size=10)
+    for path in paths:
+        pool.add_job(upload, path, jobid=path)
+    for job in pool.as_completed():
+        print job.jobid, job.result
+    pool.shutdown()
+    """
+    def __init__(self, size=10, name='s3site-worker'):
+        self.size = max(1, size)
+        self.name = name
+        self._jobs = Queue.Queue()
+        self._results = Queue.Queue()
+        self._workers = []
+        self._pending = 0
+
+    def __repr__(self):
+        return '<ThreadPool: %s (%d workers)>' % (self.name, self.size)
+
+    def _start_workers(self):
+        while len(self._workers) < self.size:
+            name = '%s-%d' % (self.name, len(self._workers))
+            worker = Worker(self, name)
+            worker.start()
+            self._workers.append(worker)
+
+    def add_job(self, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) for execution and return its Job. The
+        optional 'jobid' keyword argument is stored on the Job and not passed
+        to func.
+        """
+        jobid = kwargs.pop('jobid', None)
+        job = Job(func, args, kwargs, jobid=jobid)
+        self._start_workers()
+        self._pending += 1
+        self._jobs.put(job)
+        return job
+
+    def as_completed(self, poll_interval=0.5):
+        """
+        Yield Jobs as they finish until all queued Jobs have completed
+
+        Uses a timeout when waiting on results so that the main thread can
+        still be interrupted (e.g. CTRL-C) while workers are busy
+        """
+        while self._pending > 0:
+            try:
+                job = self._results.get(True, poll_interval)
+            except Queue.Empty:
+                continue
+            self._pending -= 1
+            yield job
+
+    def wait(self):
+        """
+        Wait for all queued Jobs to complete and return them
+        """
+        return list(self.as_completed())
+
+    def map(self, func, items):
+        """
+        Run func on each item concurrently and return the list of completed
+        Jobs in the same order as items
+        """
+        jobs = [self.add_job(func, item, jobid=item) for item in items]
+        self.wait()
+        return jobs
+
+    def shutdown(self):
+        for worker in self._workers:
+            self._jobs.put(None)
+        self._workers = []
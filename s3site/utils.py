@@ -3,6 +3,9 @@ Utils module for s3site
 """
 import os
 import re
+import math
+import stat
+import fnmatch
 import hashlib
 import urlparse
 
@@ -27,6 +30,14 @@ except ImportError, e:
         log.error("Please check that IPython is installed and working.")
         log.error("If not, you can install it via: easy_install ipython")
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
 try:
     import pudb
     set_trace = pudb.set_trace
@@ -66,16 +77,120 @@ class AttributeDict(dict):
             return super(AttributeDict, self).__getattribute__(name)
 
 
-def find_files(path):
+class DirEntry(object):
+    """
+    Minimal stand-in for scandir's DirEntry used when the scandir module is
+    not available (it's installed with s3site on Python < 3.5). Unlike
+    scandir, is_dir/is_file require a stat call.
+    """
+    __slots__ = ['name', 'path', '_stat']
+
+    def __init__(self, dirpath, name):
+        self.name = name
+        self.path = os.path.join(dirpath, name)
+        self._stat = None
+
+    def __repr__(self):
+        return '<DirEntry: %s>' % self.name
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def is_dir(self):
+        try:
+            return stat.S_ISDIR(self.stat().st_mode)
+        except OSError:
+            return False
+
+    def is_file(self):
+        try:
+            return stat.S_ISREG(self.stat().st_mode)
+        except OSError:
+            return False
+
+
+def iter_dir(path):
+    """
+    Returns an iterable of DirEntry objects for path using scandir if
+    available
+    """
+    if scandir:
+        return scandir(path)
+    return [DirEntry(path, name) for name in os.listdir(path)]
+
+
+def _read_dir(dirpath, parents, exclude, sort):
+    """
+    Returns the files in dirpath as DirEntry objects and its subdirectories as
+    (path, parents) tuples. Files come first followed by the subdirectories
+    unless sort is True in which case everything is ordered as S3 orders the
+    corresponding keys: by name with a '/' appended to directory names.
+    """
+    try:
+        entries = iter_dir(dirpath)
+    except OSError, e:
+        log.warn("Unable to read directory '%s': %s" % (dirpath, e))
+        return []
+    files = []
+    subdirs = []
+    for entry in entries:
+        if exclude and [p for p in exclude
+                        if fnmatch.fnmatch(entry.name, p)]:
+            continue
+        if entry.is_dir():
+            st = entry.stat()
+            dirid = (st.st_dev, st.st_ino)
+            if dirid in parents:
+                log.warn("Skipping symlink loop: %s" % entry.path)
+                continue
+            subdir = (entry.path, parents | frozenset([dirid]))
+            subdirs.append((entry.name + '/', subdir))
+        elif entry.is_file():
+            files.append((entry.name, entry))
+    if sort:
+        return [item for name, item in sorted(files + subdirs)]
+    subdirs.sort()
+    return [item for name, item in files + subdirs]
+
+
+def walk_files(path, exclude=None, sort=False):
+    """
+    Yields a DirEntry for every regular file under path. Each directory is
+    read exactly once and, when scandir is available, the file type comes
+    from the directory listing rather than an extra stat call.
+
+    exclude is an optional list of shell-style patterns matched against each
+    file and directory name. Excluded directories are not descended into.
+    Symlinked directories are followed unless they point back to one of
+    their parent directories.
+
+    If sort is True files are yielded in the byte-wise order of their paths
+    relative to path (using '/' as the separator) which is the order S3 lists
+    the corresponding keys in. Otherwise files within a directory are yielded
+    in the order they are listed in.
+    """
+    exclude = exclude or []
+    st = os.stat(path)
+    stack = [iter([(path, frozenset([(st.st_dev, st.st_ino)]))])]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+        elif isinstance(item, tuple):
+            dirpath, parents = item
+            stack.append(iter(_read_dir(dirpath, parents, exclude, sort)))
+        else:
+            yield item
+
+
+def find_files(path, exclude=None):
+    path = os.path.expanduser(path)
     if not os.path.isdir(path):
         raise exception.BaseException("'%s' is not a directory" % path)
-    path = os.path.expanduser(path)
-    for root, dirs, files in os.walk(path):
-        for f in files:
-            yield os.path.join(root, f)
-        for d in dirs:
-            for f in find_files(os.path.join(root, d)):
-                yield f
+    for entry in walk_files(path, exclude=exclude):
+        yield entry.path
 
 
 def compute_md5(path):
@@ -89,6 +204,56 @@ def compute_md5(path):
     return md5.hexdigest()
 
 
+def get_multipart_count(size, part_size):
+    """
+    Returns the number of part_size parts needed to upload size bytes
+    """
+    return max(1, int(math.ceil(size / float(part_size))))
+
+
+def get_etag_parts(etag):
+    """
+    Returns the number of parts in a multipart upload ETag ('<md5>-<parts>')
+    or 0 if etag is a plain MD5 hex digest or isn't in a format S3 uses (e.g.
+    ETags written by other S3-compatible stores)
+    """
+    etag = etag.strip('"')
+    if '-' not in etag:
+        return 0
+    try:
+        return int(etag.rsplit('-', 1)[1])
+    except ValueError:
+        return 0
+
+
+def compute_multipart_etag(path, part_size):
+    """
+    Returns the ETag S3 assigns to path when uploaded as a multipart upload
+    with part_size byte parts: the MD5 of the concatenated binary MD5 digests
+    of each part followed by '-<number of parts>'
+    """
+    digests = []
+    f = open(path, 'rb')
+    try:
+        while True:
+            md5 = hashlib.md5()
+            remaining = part_size
+            while remaining > 0:
+                data = f.read(min(8192, remaining))
+                if not data:
+                    break
+                md5.update(data)
+                remaining -= len(data)
+            if remaining == part_size and digests:
+                break
+            digests.append(md5.digest())
+            if remaining > 0:
+                break
+    finally:
+        f.close()
+    return '%s-%d' % (hashlib.md5(''.join(digests)).hexdigest(), len(digests))
+
+
 def strip_windows_drive_letter(path):
     return MSWIN_DRIVE_LETTER_RE.sub('', path)
 
@@ -108,3 +273,25 @@ def group_iter(iterator, n):
     if accumulator:
         items.append(accumulator)
     return items
+
+
+def format_size(nbytes):
+    """
+    Returns nbytes as a human readable string e.g. 1536 => '1.5KB'
+    """
+    nbytes = float(nbytes)
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if abs(nbytes) < 1024 or unit == 'TB':
+            break
+        nbytes /= 1024
+    if unit == 'B':
+        return '%dB' % nbytes
+    return '%.1f%s' % (nbytes, unit)
+
+
+def format_seconds(seconds):
+    """
+    Returns seconds formatted as HH:MM:SS
+    """
+    seconds = int(max(seconds, 0))
+    return '%02d:%02d:%02d' % (seconds / 3600, seconds / 60 % 60, seconds % 60)
@@ -0,0 +1,307 @@
+"""
+File system watchers used by sync --watch
+
+On Linux the watcher uses inotify (via ctypes) to be notified about changes
+in the site's directory tree. Everywhere else, or if inotify is unavailable
+(e.g. out of watches), the tree is polled for changes instead.
+
+Watchers report changed paths in batches: wait_for_changes blocks until
+something changes and then keeps collecting changes until the tree has been
+quiet for a short while so that a burst of changes (e.g. a site generator
+rewriting its output) results in a single sync.
+"""
+import os
+import sys
+import stat
+import time
+import errno
+import select
+import struct
+import ctypes
+import fnmatch
+import ctypes.util
+
+from s3site import utils
+from s3site.logger import log
+
+
+class Watcher(object):
+    """
+    Base class for watchers. Subclasses provide read(timeout) which returns
+    a list of changed paths, an empty list if nothing changed within timeout
+    seconds or None if changes may have been missed and the whole tree must
+    be rescanned.
+    """
+    def __init__(self, rootdir, exclude=None):
+        self.rootdir = os.path.abspath(os.path.expanduser(rootdir))
+        self.exclude = exclude or []
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, self.rootdir)
+
+    def is_excluded(self, name):
+        for pattern in self.exclude:
+            if fnmatch.fnmatch(name, pattern):
+                return True
+        return False
+
+    def close(self):
+        pass
+
+    def wait_for_changes(self, debounce=1.0, max_delay=10.0):
+        """
+        Blocks until paths change under rootdir and returns the set of
+        changed paths once no further changes have been seen for debounce
+        seconds (or max_delay seconds have passed since the first change).
+        Returns None if the whole tree must be rescanned.
+        """
+        changes = set()
+        first = None
+        while True:
+            if first is None:
+                timeout = max(debounce, 1.0)
+            else:
+                timeout = min(debounce, first + max_delay - time.time())
+            paths = self.read(max(timeout, 0))
+            if paths is None:
+                return None
+            if paths:
+                changes.update(paths)
+                if first is None:
+                    first = time.time()
+            elif changes:
+                return changes
+            if first is not None and time.time() - first >= max_delay:
+                return changes
+
+
+class PollingWatcher(Watcher):
+    """
+    Detects changes by walking the tree every interval seconds and comparing
+    the size and mtime of every file
+    """
+    def __init__(self, rootdir, exclude=None, interval=2.0):
+        super(PollingWatcher, self).__init__(rootdir, exclude=exclude)
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next_scan = time.time() + interval
+
+    def _scan(self):
+        snapshot = {}
+        for entry in utils.walk_files(self.rootdir, exclude=self.exclude):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            snapshot[entry.path] = (st.st_size, st.st_mtime, st.st_ino)
+        return snapshot
+
+    def read(self, timeout):
+        wait = self._next_scan - time.time()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self._next_scan = time.time() + self.interval
+        snapshot = self._scan()
+        old = self._snapshot
+        self._snapshot = snapshot
+        changed = [p for p in snapshot if old.get(p) != snapshot[p]]
+        changed.extend([p for p in old if p not in snapshot])
+        return changed
+
+
+class InotifyError(Exception):
+    pass
+
+
+class InotifyWatcher(Watcher):
+    """
+    Detects changes using Linux's inotify API. Every directory in the tree is
+    watched individually and watches are added for new directories as they
+    appear.
+    """
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0x00080000
+    # files are reported once they've been written and closed rather than on
+    # every write
+    Mask = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+            IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+    EventHeader = struct.Struct('iIII')
+
+    _libc = None
+
+    def __init__(self, rootdir, exclude=None):
+        super(InotifyWatcher, self).__init__(rootdir, exclude=exclude)
+        libc = self._get_libc()
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise InotifyError(os.strerror(ctypes.get_errno()))
+        self._dirs = {}
+        try:
+            self._watch_tree(self.rootdir)
+        except InotifyError:
+            self.close()
+            raise
+
+    @classmethod
+    def _get_libc(cls):
+        if cls._libc is None:
+            if not sys.platform.startswith('linux'):
+                raise InotifyError("inotify is only available on Linux")
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                               use_errno=True)
+            if not hasattr(libc, 'inotify_init1'):
+                raise InotifyError("libc does not support inotify")
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                               ctypes.c_uint32]
+            cls._libc = libc
+        return cls._libc
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, path,
+                                          self.Mask | self.IN_ONLYDIR)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise InotifyError("unable to watch '%s': %s" %
+                               (path, os.strerror(err)))
+        self._dirs[wd] = path
+
+    def _watch_tree(self, path):
+        """
+        Watch path and all directories below it. Returns the files found in
+        the tree.
+        """
+        self._add_watch(path)
+        files = []
+        stack = [path]
+        # (dev, ino) of the directories seen so far to avoid symlink loops
+        seen = set()
+        while stack:
+            dirpath = stack.pop()
+            try:
+                entries = utils.iter_dir(dirpath)
+            except OSError:
+                continue
+            for entry in entries:
+                if self.is_excluded(entry.name):
+                    continue
+                if entry.is_dir():
+                    st = entry.stat()
+                    if (st.st_dev, st.st_ino) in seen:
+                        continue
+                    seen.add((st.st_dev, st.st_ino))
+                    self._add_watch(entry.path)
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    files.append(entry.path)
+        return files
+
+    def _read_events(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError, e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        events = []
+        offset = 0
+        while offset < len(data):
+            header = self.EventHeader.unpack_from(data, offset)
+            wd, mask, cookie, length = header
+            offset += self.EventHeader.size
+            name = data[offset:offset + length].rstrip('\0')
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def read(self, timeout):
+        try:
+            ready = select.select([self.fd], [], [], timeout)[0]
+        except select.error, e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        if not ready:
+            return []
+        changed = []
+        for wd, mask, name in self._read_events():
+            if mask & self.IN_Q_OVERFLOW:
+                log.warn("Too many file system events, rescanning '%s'" %
+                         self.rootdir)
+                return None
+            if mask & self.IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            dirpath = self._dirs.get(wd)
+            if mask & self.IN_MOVE_SELF:
+                # stop watching directories moved out of the tree
+                if dirpath and not os.path.isdir(dirpath):
+                    self._libc.inotify_rm_watch(self.fd, wd)
+                continue
+            if dirpath is None or not name or self.is_excluded(name):
+                continue
+            path = os.path.join(dirpath, name)
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    try:
+                        changed.extend(self._watch_tree(path))
+                    except InotifyError, e:
+                        log.warn("%s, rescanning '%s'" % (e, self.rootdir))
+                        return None
+                elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    changed.append(path)
+                continue
+            if mask & self.IN_CREATE and self._is_being_written(path):
+                # wait for IN_CLOSE_WRITE before reporting new files
+                continue
+            changed.append(path)
+        return changed
+
+    def _is_being_written(self, path):
+        """
+        Returns True if path was created as a new regular file, which is
+        reported once it's been written and closed. Symlinks and hard links
+        to existing files are complete as soon as they're created and never
+        produce IN_CLOSE_WRITE.
+        """
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return False
+        return stat.S_ISREG(st.st_mode) and st.st_nlink == 1
+
+    def close(self):
+        if self.fd is not None and self.fd >= 0:
+            os.close(self.fd)
+        self.fd = None
+
+
+def get_watcher(rootdir, exclude=None, poll=False, poll_interval=2.0):
+    """
+    Returns an InotifyWatcher for rootdir if inotify is available (and poll
+    is False) or a PollingWatcher otherwise
+    """
+    if not poll:
+        try:
+            return InotifyWatcher(rootdir, exclude=exclude)
+        except InotifyError, e:
+            log.warn("Unable to use inotify (%s), polling for changes "
+                     "instead" % e)
+    return PollingWatcher(rootdir, exclude=exclude, interval=poll_interval)
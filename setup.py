@@ -7,12 +7,17 @@ if sys.version_info < (2, 5):
     print >> sys.stderr, error
     sys.exit(1)
 
+install_requires = ["boto>=2.5.2"]
+if sys.version_info < (3, 5):
+    # os.scandir is only in the standard library since Python 3.5
+    install_requires.append("scandir")
+
 try:
     from setuptools import setup, find_packages
     console_scripts = ['s3site = s3site.cli:main']
     extra = dict(test_suite="s3site.tests",
                  tests_require="nose",
-                 install_requires=["boto>=2.5.2"],
+                 install_requires=install_requires,
                  include_package_data=True,
                  entry_points=dict(console_scripts=console_scripts),
                  zip_safe=False)